@@ -1,14 +1,30 @@
 import os
-from flask import Flask
+from flask import Flask, current_app, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
+from sqlalchemy import event, make_url
+from sqlalchemy.orm import Session, raiseload
+from app.cache import Cache, UserCache
+from app.metrics import Metrics
+from app.events import EventHub
+from app.assets import Assets
+from app.reads import ReadTracker
+from app.popularity import Popularity
+from app.replicas import RoutingSession, init_replicas
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 csrf = CSRFProtect()
+cache = Cache()
+user_cache = UserCache()
+metrics = Metrics()
+events = EventHub()
+assets = Assets()
+reads = ReadTracker()
+popularity = Popularity()
 
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
@@ -20,19 +36,177 @@ class Config:
     # Сохраняем в корневую папку static/avatars
     UPLOAD_FOLDER = 'app/static/avatars'
     MAX_CONTENT_LENGTH = 2 * 1024 * 1024
+    # Размеры аватарок (px) и пул их фоновой обработки
+    AVATAR_SIZES = (32, 64, 150)
+    AVATAR_WORKERS = 2
+    AVATAR_QUEUE_SIZE = 16
+    # Количество ответов на одной странице темы
+    POSTS_PER_PAGE = 20
+    SEARCH_RESULTS_PER_PAGE = 20
+    # Лента активности пользователя: записей на странице и в профиле
+    ACTIVITY_PER_PAGE = 20
+    PROFILE_ACTIVITY_ITEMS = 5
+    # Отладка: ошибка при ленивой загрузке связей внутри запроса (поиск N+1)
+    RAISE_ON_LAZY_LOAD = os.environ.get('RAISE_ON_LAZY_LOAD') == '1'
+    # Кэш страниц и фрагментов: lru (в памяти процесса), filesystem или null
+    CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'lru'
+    CACHE_DIR = os.environ.get('CACHE_DIR') or 'instance/cache'
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_DEFAULT_TIMEOUT = 300
+    # Снимки пользователей для user_loader: lru, filesystem (общий для процессов) или null
+    USER_CACHE_TYPE = os.environ.get('USER_CACHE_TYPE') or 'lru'
+    USER_CACHE_TIMEOUT = 60
+    USER_CACHE_MAX_ENTRIES = 10000
+    # Инструментирование запросов и эндпоинт /metrics (Prometheus)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+    METRICS_SLOWEST_QUERIES = 3
+    # Доступ к /metrics (иначе 404): заголовок Authorization: Bearer <токен> или адреса
+    # и сети из списка. За обратным прокси адрес клиента - адрес прокси, там нужен токен
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = [ip for ip in (os.environ.get('METRICS_ALLOWED_IPS') or '').split(',') if ip]
+    # Удаление порциями; объемы больше порога (тем + сообщений) удаляются в фоне
+    DELETE_CHUNK_SIZE = 1000
+    DELETE_BACKGROUND_THRESHOLD = 5000
+    # Рендерер текста сообщений: plain (экранирование и переносы) или markdown (пакеты markdown и nh3)
+    CONTENT_RENDERER = os.environ.get('CONTENT_RENDERER') or 'plain'
+    # Метод хеширования паролей werkzeug; при смене стоимости пароли перехешируются при входе
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+    # Пул процессов для хеширования (0 - в потоке запроса) и предел очереди к нему
+    AUTH_HASH_WORKERS = 2
+    AUTH_HASH_QUEUE_SIZE = 8
+    AUTH_HASH_TIMEOUT = 10
+    # Ограничение частоты входа и регистрации: (запросов, за секунд, ключ).
+    # Попытки входа под одним именем считаются по адресу: ключ только по имени
+    # позволил бы любому заблокировать чужую учетную запись
+    AUTH_RATE_LIMIT_ENABLED = True
+    AUTH_RATE_LIMITS = {
+        'login_ip': (20, 60, 'ip'),
+        'login_user': (5, 60, 'ip_username'),
+        'register_ip': (5, 3600, 'ip'),
+    }
+    # PRAGMA для каждого нового соединения с SQLite и параметры драйвера sqlite3
+    # (к другим базам не применяются)
+    SQLITE_PRAGMAS = {}
+    SQLITE_CONNECT_ARGS = {}
+    # Повторы записи, если SQLite занята другим писателем (пауза растет вдвое)
+    DB_WRITE_RETRIES = 3
+    DB_RETRY_DELAY = 0.05
+    # Реплики только для чтения (адреса через запятую); чтение в index, section,
+    # thread и профилях идет на них, кроме пользователей, которые недавно писали
+    REPLICA_URLS = [url for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url]
+    REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS') or 10)
+    # Новые сообщения темы через SSE: local - события видит только свой процесс,
+    # database - общая таблица live_event для нескольких воркеров
+    SSE_BROKER = os.environ.get('SSE_BROKER') or 'local'
+    SSE_POLL_INTERVAL = 0.5
+    SSE_EVENT_TTL = 300
+    # Очередь событий на клиента, история канала для Last-Event-ID, пинг и предел соединений
+    SSE_QUEUE_SIZE = 100
+    SSE_HISTORY = 50
+    SSE_HEARTBEAT = 15
+    SSE_MAX_CONNECTIONS = 5000
+    # Статика из static/dist (flask forum assets); 0 - исходные файлы, например при правке CSS
+    ASSETS_USE_MANIFEST = os.environ.get('ASSETS_USE_MANIFEST') != '0'
+    # Отметки прочтения копятся в памяти и пишутся пачкой раз в интервал или по размеру
+    READ_FLUSH_INTERVAL = 5
+    READ_FLUSH_SIZE = 1000
+    # Просмотры тем: приращения копятся в памяти и пишутся пачкой (как отметки прочтения)
+    VIEW_FLUSH_INTERVAL = 10
+    VIEW_FLUSH_SIZE = 1000
+    # Горячие темы на главной: сколько показывать, как часто пересчитывать (0 - только
+    # командой flask forum hot), окно и период полураспада вклада ответов и просмотров
+    HOT_THREADS = 10
+    HOT_REFRESH_INTERVAL = 300
+    HOT_WINDOW_HOURS = 72
+    HOT_HALF_LIFE_HOURS = 12
+    HOT_VIEW_WEIGHT = 0.05
+    # Архив (flask forum archive): ответы тем без активности дольше стольких месяцев
+    # переносятся в сжатый блок; большие темы остаются - архив распаковывается целиком
+    ARCHIVE_AFTER_MONTHS = 12
+    ARCHIVE_MAX_POSTS = 5000
 
-def create_app(config_class=Config):
+class ProductionConfig(Config):
+    """SQLite под несколько воркеров gunicorn: читатели не ждут писателей (WAL),
+    писатели ждут друг друга до busy_timeout, а не падают с database is locked"""
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        # В режиме WAL NORMAL не портит базу при сбое, теряются лишь последние транзакции
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+    }
+    SQLITE_CONNECT_ARGS = {'timeout': 5}
+    DB_WRITE_RETRIES = 5
+
+CONFIGS = {
+    'default': Config,
+    'production': ProductionConfig,
+}
+
+def _raiseload_in_request(orm_execute_state):
+    """Запрещает ленивые загрузки, выполняющие SQL, для объектов, загруженных в запросе"""
+    if (orm_execute_state.is_select and has_request_context()
+            and current_app.config.get('RAISE_ON_LAZY_LOAD')):
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            raiseload('*', sql_only=True)
+        )
+
+def _sqlite_pragmas(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+    return set_pragmas
+
+def _sqlite_connect_args(app):
+    """Добавить SQLITE_CONNECT_ARGS в параметры движка, если основная база - SQLite"""
+    if not app.config['SQLITE_CONNECT_ARGS'] or make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() != 'sqlite':
+        return
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options['connect_args'] = {**options.get('connect_args', {}), **app.config['SQLITE_CONNECT_ARGS']}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+def create_app(config_class=None):
     app = Flask(__name__)
-    app.config.from_object(config_class)
+    # Без явного класса настройки выбираются переменной окружения FORUM_CONFIG
+    app.config.from_object(config_class or CONFIGS[os.environ.get('FORUM_CONFIG') or 'default'])
     
     # Создаем папку для загрузки в корне
     with app.app_context():
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
+    _sqlite_connect_args(app)
+    init_replicas(app)
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and app.config['SQLITE_PRAGMAS']:
+                event.listen(engine, 'connect', _sqlite_pragmas(app.config['SQLITE_PRAGMAS']))
     migrate.init_app(app, db)
     login_manager.init_app(app)
     csrf.init_app(app)
+    cache.init_app(app)
+    user_cache.init_app(app)
+    metrics.init_app(app)
+    events.init_app(app)
+    assets.init_app(app)
+    reads.init_app(app)
+    popularity.init_app(app)
+    
+    if app.config['RAISE_ON_LAZY_LOAD'] and not event.contains(Session, 'do_orm_execute', _raiseload_in_request):
+        event.listen(Session, 'do_orm_execute', _raiseload_in_request)
+    
+    from app.rendering import content_html, post_card_key
+    app.jinja_env.filters['content_html'] = content_html
+    app.jinja_env.globals['post_card_key'] = post_card_key
     
     from app import routes
     from app import models
@@ -0,0 +1,267 @@
+import json
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func, text
+from app import db
+from app.cache import invalidate_on_commit
+from app.models import User, Thread, Post, ThreadArchive
+from app.rendering import get_renderer, render_content
+from app.utils import PostPage
+
+# Версия формата архива: {"v": 1, "posts": [[id, user_id, created_at, content], ...]}
+ARCHIVE_FORMAT = 1
+# Сколько распакованных архивов держать в памяти процесса: большая тема
+# читается постранично, и распаковка на каждую страницу стоила бы ~10 мс
+UNPACKED_CACHE_SIZE = 16
+
+_unpacked = OrderedDict()
+_unpacked_lock = threading.Lock()
+
+
+class ArchivedPost:
+    """Ответ архивной темы: те же поля, что шаблон темы читает у Post.
+
+    Не объект ORM - иначе привязка автора через backref добавила бы его в
+    сессию, и ответ записался бы обратно в post при ближайшем flush.
+    HTML в архиве не хранится и рисуется текущим рендерером (карточка все
+    равно кэшируется фрагментом).
+    """
+
+    content_html = None
+
+    def __init__(self, thread_id, id, user_id, created_at, content):
+        self.thread_id = thread_id
+        self.id = id
+        self.user_id = user_id
+        self.created_at = created_at
+        self.content = content
+        self.author = None
+
+
+def pack_posts(rows):
+    """Сжать ответы темы (строки с id, user_id, created_at, content) в один блок"""
+    data = {'v': ARCHIVE_FORMAT,
+            'posts': [[row.id, row.user_id, row.created_at.isoformat(), row.content] for row in rows]}
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def _archive_rows(archive):
+    """Строки [id, user_id, created_at, content] архива (с кэшем распакованных)"""
+    # Архив не меняется: восстановление удаляет строку, новая получает другой archived_at
+    key = (archive.thread_id, archive.archived_at)
+    with _unpacked_lock:
+        rows = _unpacked.get(key)
+        if rows is not None:
+            _unpacked.move_to_end(key)
+            return rows
+    rows = _unpack_rows(archive)
+    with _unpacked_lock:
+        _unpacked[key] = rows
+        while len(_unpacked) > UNPACKED_CACHE_SIZE:
+            _unpacked.popitem(last=False)
+    return rows
+
+
+def _unpack_rows(archive):
+    data = json.loads(zlib.decompress(archive.data))
+    if data.get('v') != ARCHIVE_FORMAT:
+        raise ValueError(f'Неизвестный формат архива темы {archive.thread_id}: {data.get("v")}')
+    return data['posts']
+
+
+def _archived_posts(thread_id, rows):
+    version = get_renderer().full_version
+    posts = []
+    for post_id, user_id, created_at, content in rows:
+        post = ArchivedPost(thread_id, post_id, user_id, datetime.fromisoformat(created_at), content)
+        post.content_version = version
+        posts.append(post)
+    return posts
+
+
+def unpack_posts(archive):
+    """Ответы архивной темы в порядке страниц темы"""
+    return _archived_posts(archive.thread_id, _archive_rows(archive))
+
+
+def archived_thread_page(thread, per_page, after=None, before=None, last=False, offset=None):
+    """Страница архивной темы с теми же курсорами, что и get_thread_page.
+
+    Архив распаковывается целиком, поэтому в архив попадают только темы не
+    больше ARCHIVE_MAX_POSTS ответов. Авторы страницы загружаются одним запросом.
+    """
+    archive = db.session.get(ThreadArchive, thread.id)
+    rows = _archive_rows(archive) if archive is not None else []
+    index = {row[0]: position for position, row in enumerate(rows)}
+
+    end = None
+    # Курсор на краю темы (после последнего или до первого ответа) дает
+    # крайнюю страницу, а не пустую
+    if last or index.get(after) == len(rows) - 1:
+        start = max(len(rows) - per_page, 0)
+    elif index.get(before, 0) > 0:
+        end = index[before]
+        start = max(end - per_page, 0)
+    elif after in index:
+        start = index[after] + 1
+    else:
+        start = 0
+    if end is None:
+        end = min(start + per_page, len(rows))
+    # Объекты только для страницы, а не для всей темы
+    page_posts = _archived_posts(thread.id, rows[start:end])
+
+    authors = {user.id: user for user in
+               User.query.filter(User.id.in_({post.user_id for post in page_posts}))} if page_posts else {}
+    for post in page_posts:
+        post.author = authors.get(post.user_id)
+    return PostPage(page_posts, start, start > 0, end < len(rows))
+
+
+def archive_thread(thread_id, updated_at):
+    """Перенести ответы темы в архив одной транзакцией.
+
+    Сначала тема помечается архивной при условии, что updated_at не
+    изменился: так запись берет блокировку раньше чтения ответов, и ответ,
+    добавленный после выбора темы, не будет удален без архивации.
+    Возвращает (сообщений, байт в строках, байт в архиве) или None.
+    """
+    claimed = db.session.execute(
+        update(Thread).where(Thread.id == thread_id, Thread.updated_at == updated_at,
+                             Thread.is_archived.is_(False))
+        .values(is_archived=True),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return None
+    rows = db.session.execute(
+        select(Post.id, Post.user_id, Post.created_at, Post.content, Post.content_html)
+        .where(Post.thread_id == thread_id).order_by(Post.created_at, Post.id)
+    ).all()
+    data = pack_posts(rows)
+    raw_size = sum(len(row.content.encode('utf-8')) + len((row.content_html or '').encode('utf-8'))
+                   for row in rows)
+    db.session.add(ThreadArchive(thread_id=thread_id, data=data, post_count=len(rows),
+                                 raw_size=raw_size, archived_at=datetime.utcnow()))
+    db.session.execute(delete(Post).where(Post.thread_id == thread_id),
+                       execution_options={'synchronize_session': False})
+    invalidate_on_commit(db.session, f'thread:{thread_id}')
+    db.session.commit()
+    return len(rows), raw_size, len(data)
+
+
+def post_ids_reused():
+    """True для таблицы post SQLite, созданной без AUTOINCREMENT (до архива).
+
+    В ней id удаленных при архивации ответов достаются новым сообщениям,
+    и восстановление архива упирается в занятые id.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    sql = db.session.scalar(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'post'"))
+    return sql is not None and 'AUTOINCREMENT' not in sql.upper()
+
+
+def archive_cold_threads(months, max_posts, batch_size=100, progress=None):
+    """Заархивировать темы без активности дольше months месяцев (по 30 дней).
+
+    Каждая тема - отдельная транзакция. Закрепленные темы и темы больше
+    max_posts ответов остаются в основных таблицах. Возвращает Counter
+    с числом тем, сообщений и байтами до и после.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=30 * months)
+    totals = Counter()
+    last_id = 0
+    while True:
+        candidates = db.session.execute(
+            select(Thread.id, Thread.updated_at).where(
+                Thread.id > last_id, Thread.updated_at < cutoff, Thread.is_archived.is_(False),
+                Thread.is_pinned.is_not(True), Thread.post_count <= max_posts
+            ).order_by(Thread.id).limit(batch_size)
+        ).all()
+        # Читающая транзакция закрывается: каждая тема архивируется своей
+        db.session.rollback()
+        if not candidates:
+            break
+        for candidate in candidates:
+            result = archive_thread(candidate.id, candidate.updated_at)
+            if result is None:
+                continue
+            posts, raw_size, packed_size = result
+            totals.update(threads=1, posts=posts, raw_bytes=raw_size, archive_bytes=packed_size)
+        last_id = candidates[-1].id
+        if progress is not None:
+            progress(totals)
+    return totals
+
+
+def restore_thread(thread):
+    """Вернуть ответы архивной темы в post (перед новым ответом или удалением).
+
+    Вызывается в транзакции пишущего маршрута: ответы вставляются с прежними
+    id, HTML рисуется заново. Возвращает число восстановленных ответов.
+    """
+    archive = db.session.get(ThreadArchive, thread.id)
+    if archive is None:
+        thread.is_archived = False
+        return 0
+    posts = unpack_posts(archive)
+    # Архив удаляет тот, кто первым его забрал: параллельный ответ вставит ответы один раз
+    claimed = db.session.execute(
+        delete(ThreadArchive).where(ThreadArchive.thread_id == thread.id),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.expunge(archive)
+    if claimed:
+        rows = []
+        for post in posts:
+            render_content(post)
+            rows.append({'id': post.id, 'user_id': post.user_id, 'thread_id': thread.id,
+                         'created_at': post.created_at, 'content': post.content,
+                         'content_html': post.content_html, 'content_version': post.content_version})
+        if rows:
+            db.session.execute(Post.__table__.insert(), rows)
+    thread.is_archived = False
+    return len(posts) if claimed else 0
+
+
+def archive_batches(batch_size=10, thread_ids=None):
+    """Архивы порциями по thread_id (поиск и счетчики), чтобы не держать в памяти все сразу.
+
+    thread_ids - только архивы этих тем.
+    """
+    query = select(ThreadArchive)
+    if thread_ids is not None:
+        query = query.where(ThreadArchive.thread_id.in_(thread_ids))
+    last_id = 0
+    while True:
+        archives = db.session.scalars(
+            query.where(ThreadArchive.thread_id > last_id).order_by(ThreadArchive.thread_id).limit(batch_size)
+        ).all()
+        if not archives:
+            return
+        last_id = archives[-1].thread_id
+        yield archives
+
+
+def archived_post_authors(thread_ids):
+    """Ответы архивных тем по одному архиву: [(id ответа, id автора), ...].
+
+    Архивы читаются порциями archive_batches и распаковываются без кэша
+    (удаляемые темы не должны вытеснять из него читаемые).
+    """
+    for archives in archive_batches(thread_ids=thread_ids):
+        for archive in archives:
+            yield [(row[0], row[1]) for row in _unpack_rows(archive)]
+
+
+def archive_stats():
+    """Число архивных тем и ответов, байты в строках до архивации и в архиве"""
+    row = db.session.execute(select(
+        func.count(ThreadArchive.thread_id), func.coalesce(func.sum(ThreadArchive.post_count), 0),
+        func.coalesce(func.sum(ThreadArchive.raw_size), 0), func.coalesce(func.sum(func.length(ThreadArchive.data)), 0)
+    )).one()
+    return {'threads': row[0], 'posts': row[1], 'raw_bytes': row[2], 'archive_bytes': row[3]}
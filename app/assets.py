@@ -0,0 +1,273 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import urllib.parse
+import urllib.request
+from flask import request, abort, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Сторонние файлы: путь в static и адрес исходника (версии зафиксированы в адресе).
+# Скачиваются командой flask forum assets --fetch вместе со шрифтами из их CSS.
+VENDOR = {
+    'vendor/bootstrap/css/bootstrap.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/js/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+    'vendor/fontawesome/css/all.min.css':
+        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
+}
+
+# Бандлы: имя результата и исходные файлы в порядке подключения
+BUNDLES = {
+    'css/forum.css': [
+        'vendor/bootstrap/css/bootstrap.min.css',
+        'vendor/fontawesome/css/all.min.css',
+        'css/style.css',
+    ],
+    'js/forum.js': [
+        'vendor/bootstrap/js/bootstrap.bundle.min.js',
+    ],
+}
+
+# Каталоги static, которые не собираются: загрузки пользователей и сам результат сборки
+SKIP_DIRS = ('avatars', 'dist')
+
+# Форматы, которые уже сжаты: gzip и brotli их не уменьшат
+COMPRESSED_TYPES = ('.woff', '.woff2', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico')
+
+# Хешированные файлы никогда не меняются: год в кэше браузера без перепроверок
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_SOURCE_MAP = re.compile(r'^\s*(//|/\*)# sourceMappingURL=.*$', re.M)
+
+
+def _is_local(ref):
+    return not (ref.startswith(('data:', '#', '/')) or '://' in ref)
+
+
+def fetch_vendor(static_dir, progress=None):
+    """Скачать сторонние файлы из VENDOR и ресурсы, на которые ссылается их CSS"""
+    for path, url in VENDOR.items():
+        data = _download(url, os.path.join(static_dir, path), progress)
+        if path.endswith('.css'):
+            for _, ref in _CSS_URL.findall(data.decode('utf-8')):
+                if _is_local(ref):
+                    ref = ref.split('?')[0].split('#')[0]
+                    _download(urllib.parse.urljoin(url, ref),
+                              os.path.join(static_dir, posixpath.join(posixpath.dirname(path), ref)), progress)
+
+
+def _download(url, target, progress):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        data = response.read()
+    os.makedirs(os.path.dirname(os.path.normpath(target)), exist_ok=True)
+    with open(os.path.normpath(target), 'wb') as f:
+        f.write(data)
+    if progress is not None:
+        progress(url)
+    return data
+
+
+def missing_vendor(static_dir):
+    """Файлы бандлов, которых нет в static (обычно не скачанные сторонние)"""
+    return [source for sources in BUNDLES.values() for source in sources
+            if not os.path.exists(os.path.join(static_dir, source))]
+
+
+def minify_css(text):
+    """Убрать комментарии и лишние пробелы (без разбора CSS, для уже валидных файлов)"""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def _fingerprint(name, data):
+    base, ext = posixpath.splitext(name)
+    return f'{base}.{hashlib.sha256(data).hexdigest()[:10]}{ext}'
+
+
+def _rewrite_css_urls(text, source, target, paths):
+    """Пути url() из CSS-файла source - относительно бандла target и на хешированные файлы"""
+    def replace(match):
+        ref = match.group(2)
+        if not _is_local(ref):
+            return match.group(0)
+        clean = re.split(r'[?#]', ref, 1)[0]
+        suffix = ref[len(clean):]
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(source), clean))
+        hashed = paths.get(resolved)
+        if hashed is None:
+            return match.group(0)
+        return f'url({posixpath.relpath(hashed, posixpath.dirname(target))}{suffix})'
+    return _CSS_URL.sub(replace, text)
+
+
+def _css(text, source, target, paths):
+    text = _rewrite_css_urls(text, source, target, paths)
+    # Уже минифицированные сторонние файлы не трогаем
+    return text if source.endswith('.min.css') else minify_css(text)
+
+
+def _compress(path):
+    """Записать рядом .gz и (если есть пакет brotli) .br; вернуть список кодировок"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    encodings = []
+    variants = [('br', '.br', lambda d: brotli.compress(d, quality=11))] if brotli is not None else []
+    variants.append(('gzip', '.gz', lambda d: gzip.compress(d, 9, mtime=0)))
+    for encoding, suffix, compress in variants:
+        packed = compress(data)
+        if len(packed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(packed)
+            encodings.append(encoding)
+    return encodings
+
+
+def build_assets(static_dir, clean=False, progress=None):
+    """Собрать static/dist: хешированные копии файлов, бандлы и сжатые варианты.
+
+    Выполняется при развертывании; результат описывает dist/manifest.json
+    (исходное имя -> хешированный путь и доступные кодировки). Файлы прошлых
+    сборок остаются (clean=True удаляет их): открытые до обновления страницы
+    еще ссылаются на старые хеши.
+    """
+    # Без сторонних файлов сборка не начинается: иначе страницы так и ходили бы на CDN
+    missing = missing_vendor(static_dir)
+    if missing:
+        raise RuntimeError('Нет файлов ' + ', '.join(missing) + ': выполните flask forum assets --fetch '
+                           'и добавьте app/static/vendor в репозиторий')
+    dist = os.path.join(static_dir, 'dist')
+    if clean:
+        shutil.rmtree(dist, ignore_errors=True)
+    paths = {}
+    bundled = {source for sources in BUNDLES.values() for source in sources}
+
+    def write(name, data):
+        hashed = _fingerprint(name, data)
+        target = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        paths[name] = hashed
+        if progress is not None:
+            progress(hashed)
+
+    # Сначала шрифты и картинки: CSS ссылается на их хешированные имена
+    names = []
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir).replace(os.sep, '/')
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        names.extend(posixpath.normpath(posixpath.join(rel_root, filename)) for filename in files)
+    for name in sorted(names, key=lambda name: (name.endswith('.css'), name)):
+        if name in bundled:
+            continue
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            data = _css(data.decode('utf-8'), name, name, paths).encode('utf-8')
+        write(name, data)
+
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_dir, source), encoding='utf-8') as f:
+                text = _SOURCE_MAP.sub('', f.read())
+            if bundle.endswith('.css'):
+                text = _css(text, source, bundle, paths)
+            parts.append(text)
+        write(bundle, ('\n' if bundle.endswith('.css') else ';\n').join(parts).encode('utf-8'))
+
+    manifest = {}
+    for name, hashed in paths.items():
+        encodings = [] if hashed.endswith(COMPRESSED_TYPES) else _compress(os.path.join(dist, hashed))
+        manifest[name] = {'path': hashed, 'encodings': encodings}
+    with open(os.path.join(dist, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    """Раздача собранных файлов из static/dist.
+
+    asset_url(filename) - замена url_for('static', filename=...): после сборки
+    возвращает адрес хешированного файла в /assets/, до сборки - обычный static.
+    Файлы /assets/ отдаются с Cache-Control immutable и, если клиент принимает,
+    в заранее сжатом виде (br или gzip) - во время запроса ничего не сжимается.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.files = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = os.path.join(app.static_folder, 'dist')
+        self.manifest = {}
+        self.files = {}
+        manifest_path = os.path.join(self.directory, 'manifest.json')
+        if app.config.get('ASSETS_USE_MANIFEST', True) and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+            self.files = {entry['path']: entry['encodings'] for entry in self.manifest.values()}
+        missing = [] if all(bundle in self.manifest for bundle in BUNDLES) else missing_vendor(app.static_folder)
+        if missing:
+            app.logger.warning('Нет файлов %s: страницы подключают их с CDN, '
+                               'выполните flask forum assets --fetch', ', '.join(missing))
+        app.extensions['assets'] = self
+
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.send_asset)
+        app.jinja_env.globals['asset_url'] = self.asset_url
+        app.jinja_env.globals['asset_urls'] = self.asset_urls
+
+    def asset_url(self, filename, **values):
+        entry = self.manifest.get(filename)
+        if entry is None:
+            return url_for('static', filename=filename, **values)
+        return url_for('assets', filename=entry['path'], **values)
+
+    def asset_urls(self, bundle):
+        """Адреса для подключения бандла.
+
+        До сборки - исходные файлы по отдельности, а еще не скачанные
+        сторонние файлы - с их CDN, как раньше.
+        """
+        if bundle in self.manifest:
+            return [self.asset_url(bundle)]
+        urls = []
+        for source in BUNDLES[bundle]:
+            if source in VENDOR and not os.path.exists(os.path.join(os.path.dirname(self.directory), source)):
+                urls.append(VENDOR[source])
+            else:
+                urls.append(url_for('static', filename=source))
+        return urls
+
+    def send_asset(self, filename):
+        encodings = self.files.get(filename)
+        if encodings is None:
+            abort(404)
+        encoding = next((e for e in encodings if request.accept_encodings[e]), None)
+        path = filename + {'br': '.br', 'gzip': '.gz', None: ''}[encoding]
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.directory, path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        # Имя файла на диске (.gz, .br) клиенту не нужно
+        response.headers.pop('Content-Disposition', None)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from functools import wraps
+from flask import current_app, request, abort
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# Пул процессов для хеширования паролей и число мест в нем (выполняемые + ожидающие)
+_hash_executor = None
+_hash_slots = None
+_hash_lock = threading.Lock()
+
+
+class AuthBusy(Exception):
+    """Очередь хеширования паролей заполнена - запрос отклоняется сразу"""
+
+
+def _get_hash_executor(app):
+    global _hash_executor, _hash_slots
+    with _hash_lock:
+        if _hash_executor is None:
+            _hash_executor = ProcessPoolExecutor(max_workers=app.config['AUTH_HASH_WORKERS'])
+            _hash_slots = threading.BoundedSemaphore(app.config['AUTH_HASH_QUEUE_SIZE'])
+    return _hash_executor, _hash_slots
+
+
+def _run_hashing(func, *args):
+    """Выполнить хеширование в пуле процессов.
+
+    Хеширование нагружает процессор и держит GIL, поэтому в потоках веб-воркера
+    оно останавливало бы отдачу страниц. Если все места в очереди заняты,
+    поднимается AuthBusy, а не растет очередь. Место освобождается, когда
+    хеширование действительно закончилось, а не когда запрос перестал ждать.
+    """
+    app = current_app._get_current_object()
+    if not app.config['AUTH_HASH_WORKERS']:
+        return func(*args)
+
+    executor, slots = _get_hash_executor(app)
+    if not slots.acquire(blocking=False):
+        app.logger.warning('Очередь хеширования паролей заполнена, запрос отклонен')
+        raise AuthBusy()
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda f: slots.release())
+    try:
+        return future.result(timeout=app.config['AUTH_HASH_TIMEOUT'])
+    except FutureTimeout:
+        app.logger.warning('Хеширование пароля дольше %s с, запрос отклонен', app.config['AUTH_HASH_TIMEOUT'])
+        raise AuthBusy()
+
+
+def hash_password(password):
+    return _run_hashing(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def verify_password(password_hash, password):
+    if not password_hash:
+        return False
+    return _run_hashing(check_password_hash, password_hash, password)
+
+
+def _full_method(method):
+    """Метод с параметрами по умолчанию, как он записывается в начале хеша"""
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        n, r, p = (params + ['32768', '8', '1'][len(params):])[:3]
+        return f'scrypt:{n}:{r}:{p}'
+    if name == 'pbkdf2':
+        digest, iterations = (params + ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)][len(params):])[:2]
+        return f'pbkdf2:{digest}:{iterations}'
+    return method
+
+
+def needs_rehash(password_hash):
+    """Хеш создан другим методом или с другой стоимостью, чем PASSWORD_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != _full_method(current_app.config['PASSWORD_HASH_METHOD'])
+
+
+class TokenBucketLimiter:
+    """Ограничение частоты по алгоритму token bucket.
+
+    У каждого ключа ведро на capacity токенов, которое наполняется со
+    скоростью capacity / period в секунду; запрос забирает один токен.
+    Ведра хранятся в памяти процесса (не более max_keys, давно не
+    использованные вытесняются), поэтому при N воркерах фактический
+    предел до N раз выше.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, capacity, period):
+        """Забрать токен: 0, если разрешено, иначе сколько секунд ждать"""
+        now = time.monotonic()
+        rate = capacity / period
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+limiter = TokenBucketLimiter()
+
+
+def rate_limited(*rules):
+    """Ограничить частоту POST-запросов к маршруту.
+
+    rules - имена правил из AUTH_RATE_LIMITS; правило задает (запросов, за секунд)
+    и ключ: 'ip' - адрес клиента, 'username' - имя из формы, 'ip_username' -
+    имя из формы с этого адреса.
+    При превышении отвечает 429 с заголовком Retry-After.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == 'POST' and current_app.config['AUTH_RATE_LIMIT_ENABLED']:
+                wait = 0
+                for rule in rules:
+                    capacity, period, key_type = current_app.config['AUTH_RATE_LIMITS'][rule]
+                    if key_type in ('username', 'ip_username'):
+                        value = (request.form.get('username') or '').strip().lower()
+                        if not value:
+                            continue
+                        if key_type == 'ip_username':
+                            value = f'{request.remote_addr}:{value}'
+                    else:
+                        value = request.remote_addr
+                    wait = max(wait, limiter.hit(f'{rule}:{value}', capacity, period))
+                if wait:
+                    current_app.logger.warning('Превышен лимит запросов к %s с %s', request.path, request.remote_addr)
+                    abort(429, retry_after=int(wait) + 1)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
\ No newline at end of file
@@ -0,0 +1,96 @@
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger('forum.buffers')
+
+
+class WriteBuffer:
+    """Накопление частых мелких записей в памяти и запись пачками.
+
+    add(key, value) объединяет значения одного ключа функцией merge (max для
+    отметок прочтения, сумма для счетчиков). Накопленное записывает фоновый
+    поток функцией flush(items) - раз в interval секунд или сразу, как только
+    ключей стало max_size, - а также обработчик atexit при остановке процесса.
+
+    Граница потерь: при аварийном завершении воркера (kill -9, OOM) теряется
+    то, что накоплено с последней записи, - не больше interval секунд и не
+    больше max_size ключей на процесс. Если запись не удалась, пачка
+    возвращается в буфер и пишется в следующий раз.
+    """
+
+    def __init__(self, name, flush, merge, interval=5, max_size=1000):
+        self.name = name
+        self.flush_items = flush
+        self.merge = merge
+        self.interval = interval
+        self.max_size = max_size
+        self.app = None
+        self._items = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app, interval=None, max_size=None):
+        self.app = app
+        if interval is not None:
+            self.interval = interval
+        if max_size is not None:
+            self.max_size = max_size
+
+    def add(self, key, value):
+        with self._lock:
+            current = self._items.get(key)
+            self._items[key] = value if current is None else self.merge(current, value)
+            full = len(self._items) >= self.max_size
+            if self._thread is None:
+                self._start()
+        if full:
+            self._wakeup.set()
+
+    def get(self, key):
+        """Еще не записанное значение ключа (или None)"""
+        with self._lock:
+            return self._items.get(key)
+
+    def pending(self):
+        with self._lock:
+            return len(self._items)
+
+    def flush(self):
+        """Записать накопленное; возвращает число записанных ключей"""
+        from app import db
+
+        if self.app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, {}
+            if not items:
+                return 0
+            with self.app.app_context():
+                try:
+                    self.flush_items(items)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Ошибка записи буфера %s (%s ключей), повтор позже', self.name, len(items))
+                    with self._lock:
+                        for key, value in items.items():
+                            current = self._items.get(key)
+                            self._items[key] = value if current is None else self.merge(value, current)
+                    return 0
+                finally:
+                    db.session.remove()
+            return len(items)
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name=f'buffer-{self.name}', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
@@ -0,0 +1,405 @@
+import os
+import pickle
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from hashlib import sha1
+from flask import current_app, g, request, session, make_response, render_template
+from flask_login import UserMixin, current_user
+from markupsafe import Markup
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+
+class NullCache:
+    """Кэш отключен"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class LRUCache:
+    """Кэш в памяти процесса с вытеснением давно неиспользуемых записей.
+
+    Подходит для одного процесса: при нескольких воркерах инвалидация в одном
+    не видна остальным (устаревание ограничено CACHE_DEFAULT_TIMEOUT).
+    """
+
+    def __init__(self, max_entries=10000, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class FileSystemCache:
+    """Кэш в файлах, общий для всех процессов на одной машине"""
+
+    def __init__(self, directory, default_timeout=300):
+        self.directory = directory
+        self.default_timeout = default_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time.time() + timeout if timeout else 0
+        # Атомарная запись: читатели не увидят недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+def make_backend(app, cache_type, max_entries, timeout):
+    if cache_type == 'lru':
+        return LRUCache(max_entries, timeout)
+    if cache_type == 'filesystem':
+        return FileSystemCache(app.config['CACHE_DIR'], timeout)
+    return NullCache()
+
+
+class Cache:
+    """Кэш страниц и фрагментов с ключами по версиям сущностей.
+
+    Версия сущности ('index', 'users', 'section:<id>', 'thread:<id>') - случайный
+    токен в кэше. После коммита, изменившего тему, сообщение, раздел, категорию
+    или видимые поля пользователя, токены затронутых сущностей заменяются, и все
+    ключи со старыми версиями перестают использоваться.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_backend(app, app.config.get('CACHE_TYPE', 'lru'),
+                                    app.config.get('CACHE_MAX_ENTRIES', 10000),
+                                    app.config.get('CACHE_DEFAULT_TIMEOUT', 300))
+        app.extensions['cache'] = self
+
+        if not event.contains(Session, 'after_flush', _collect_changes):
+            event.listen(Session, 'after_flush', _collect_changes)
+            event.listen(Session, 'after_commit', _apply_invalidation)
+            event.listen(Session, 'after_rollback', _discard_changes)
+
+        app.jinja_env.globals['cached_include'] = self.cached_include
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+
+    def version(self, name):
+        """Текущая версия сущности (создается при первом обращении)"""
+        key = 'version:' + name
+        value = self.backend.get(key)
+        if value is None:
+            value = secrets.token_hex(4)
+            self.backend.set(key, value, 0)
+        return value
+
+    def invalidate(self, *names):
+        for name in names:
+            self.backend.set('version:' + name, secrets.token_hex(4), 0)
+
+    def cached_include(self, template_name, key, depends=(), **context):
+        """Отрендерить шаблон-фрагмент или взять его из кэша"""
+        versions = ':'.join(self.version(name) for name in depends)
+        full_key = f'fragment:{template_name}:{key}:{versions}'
+        html = self.backend.get(full_key)
+        if html is None:
+            html = render_template(template_name, **context)
+            self.backend.set(full_key, html, _replica_timeout())
+        return Markup(html)
+
+    def cached_page(self, *depends):
+        """Кэшировать страницу целиком для анонимных GET-запросов.
+
+        depends - имена версий или функции от аргументов маршрута, возвращающие имя.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if (request.method != 'GET' or current_user.is_authenticated
+                        or session.get('_flashes')):
+                    return view(**kwargs)
+
+                names = [d(**kwargs) if callable(d) else d for d in depends]
+                versions = ':'.join(self.version(name) for name in names)
+                key = f'page:{request.full_path}:{versions}'
+                body = self.backend.get(key)
+                if body is not None:
+                    return make_response(body)
+
+                response = make_response(view(**kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(key, response.get_data(), _replica_timeout())
+                return response
+            return wrapper
+        return decorator
+
+    def conditional(self, validator, *depends):
+        """Отвечать 304 Not Modified до загрузки данных и рендеринга страницы.
+
+        validator(**kwargs) - дешевый индексированный запрос, возвращающий
+        кортеж значений или None, если объекта нет. В ETag также входят версии
+        depends (правки, не отраженные в счетчиках), адрес страницы и пользователь.
+        Last-Modified не отдается: удаление ответа, переименование категории или
+        смена имени и аватара автора меняют страницу, но не время изменения темы,
+        и If-Modified-Since без ETag получил бы неверный 304.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if request.method != 'GET' or session.get('_flashes'):
+                    return view(**kwargs)
+                values = validator(**kwargs)
+                if values is None:
+                    return view(**kwargs)
+
+                if current_user.is_authenticated:
+                    # Страница содержит CSRF-токен - не отдаем ее из кэша браузера дольше получаса
+                    user_part = (current_user.get_id(), int(time.time() // 1800))
+                else:
+                    user_part = None
+                names = [d(**kwargs) if callable(d) else d for d in depends]
+                etag = sha1(repr((
+                    values, [self.version(name) for name in names], request.full_path, user_part
+                )).encode('utf-8')).hexdigest()
+
+                not_modified = request.if_none_match.contains(etag)
+                response = make_response('', 304) if not_modified else make_response(view(**kwargs))
+                if response.status_code in (200, 304):
+                    response.set_etag(etag)
+                    response.cache_control.no_cache = True
+                    if user_part is not None:
+                        response.cache_control.private = True
+                return response
+            return wrapper
+        return decorator
+
+
+class SessionUser(UserMixin):
+    """Снимок полей пользователя, нужных каждому запросу (шапка, права, авторство).
+
+    Только для чтения: маршрутам, которые меняют пользователя или читают
+    остальные поля, полный объект User подставляет декоратор full_user.
+    """
+
+    FIELDS = ('id', 'username', 'avatar', 'is_moderator')
+
+    def __init__(self, snapshot):
+        for name in self.FIELDS:
+            object.__setattr__(self, name, snapshot[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'SessionUser только для чтения ({name}): нужен декоратор full_user')
+
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
+
+class UserCache:
+    """Кэш снимков пользователей для user_loader с коротким сроком жизни.
+
+    USER_CACHE_TYPE: lru (в памяти процесса), filesystem (общий для процессов)
+    или null. Снимок сбрасывается после коммита, изменившего пользователя;
+    в других процессах lru-кэш устаревает не дольше USER_CACHE_TIMEOUT.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_backend(app, app.config.get('USER_CACHE_TYPE', 'lru'),
+                                    app.config.get('USER_CACHE_MAX_ENTRIES', 10000),
+                                    app.config.get('USER_CACHE_TIMEOUT', 60))
+        app.extensions['user_cache'] = self
+
+        if not event.contains(Session, 'after_flush', _collect_users):
+            event.listen(Session, 'after_flush', _collect_users)
+            event.listen(Session, 'after_commit', _drop_users)
+            event.listen(Session, 'after_rollback', _discard_users)
+
+    def load(self, user_id):
+        """Снимок пользователя из кэша или одним запросом по первичному ключу"""
+        from app import db
+        from app.models import User
+
+        key = f'user:{user_id}'
+        snapshot = self.backend.get(key)
+        if snapshot is None:
+            row = db.session.execute(
+                select(*(getattr(User, name) for name in SessionUser.FIELDS)).where(User.id == user_id)
+            ).first()
+            if row is None:
+                return None
+            snapshot = dict(row._mapping)
+            self.backend.set(key, snapshot)
+        return SessionUser(snapshot)
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            self.backend.delete(f'user:{user_id}')
+
+
+def full_user(view):
+    """Подставить в current_user полный объект User вместо снимка"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from app import db, login_manager
+        from app.models import User
+
+        if isinstance(current_user._get_current_object(), SessionUser):
+            user = db.session.get(User, current_user.id)
+            if user is None:
+                return login_manager.unauthorized()
+            # Flask-Login хранит пользователя запроса в g._login_user
+            g._login_user = user
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _collect_users(session, flush_context):
+    from app.models import User
+
+    changed = session.info.setdefault('user_cache_invalidate', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+
+def _drop_users(session):
+    from app import user_cache
+
+    changed = session.info.pop('user_cache_invalidate', None)
+    if changed:
+        user_cache.invalidate(*changed)
+
+
+def _discard_users(session):
+    session.info.pop('user_cache_invalidate', None)
+
+
+def _replica_timeout():
+    """Срок хранения записи, отрендеренной по данным реплики.
+
+    Реплика может отставать от версии в ключе, поэтому такие записи живут
+    не дольше окна REPLICA_PIN_SECONDS. None - срок по умолчанию.
+    """
+    from app import db
+
+    if db.session.info.get('replica') is not None:
+        return current_app.config['REPLICA_PIN_SECONDS']
+    return None
+
+
+def invalidate_on_commit(session, *names):
+    """Сбросить версии после коммита сессии (для массовых изменений в обход ORM)"""
+    session.info.setdefault('cache_invalidate', set()).update(names)
+
+
+def _entities_for(obj, deleted=False):
+    """Версии, которые устаревают при изменении объекта"""
+    from app.models import User, Category, Section, Thread, Post
+
+    if isinstance(obj, Post):
+        return {f'thread:{obj.thread_id}'}
+    if isinstance(obj, Thread):
+        return {f'thread:{obj.id}', f'section:{obj.section_id}', 'index'}
+    if isinstance(obj, Section):
+        return {f'section:{obj.id}', 'index'}
+    if isinstance(obj, Category):
+        return {'index'}
+    if isinstance(obj, User):
+        # Имя, аватар и статус модератора выводятся рядом с каждым сообщением
+        state = inspect(obj)
+        if deleted or any(state.attrs[name].history.has_changes()
+                          for name in ('username', 'avatar', 'is_moderator')):
+            return {'users'}
+    return set()
+
+
+def _collect_changes(session, flush_context):
+    changed = session.info.setdefault('cache_invalidate', set())
+    for obj in session.new:
+        changed |= _entities_for(obj)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            changed |= _entities_for(obj)
+    for obj in session.deleted:
+        changed |= _entities_for(obj, deleted=True)
+
+
+def _apply_invalidation(session):
+    from app import cache
+
+    changed = session.info.pop('cache_invalidate', None)
+    if changed:
+        cache.invalidate(*changed)
+
+
+def _discard_changes(session):
+    session.info.pop('cache_invalidate', None)
@@ -0,0 +1,307 @@
+import sys
+import click
+from collections import Counter
+from datetime import datetime
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select, update, desc, asc, tuple_, bindparam
+from app import db, popularity
+from app.models import User, Category, Section, Thread, Post, HotThread
+from app.archive import archive_batches, archive_cold_threads, archive_stats, post_ids_reused, restore_thread, unpack_posts
+from app.assets import BUNDLES, build_assets, fetch_vendor
+from app.deletion import TARGETS, deletion_size
+from app.rendering import rerender_all, get_renderer
+from app.search import reindex_all
+from app.transfer import export_forum, import_forum, open_dump
+from app.utils import collect_avatar_garbage
+
+forum_cli = AppGroup('forum', help='Служебные команды форума.')
+
+
+def rebuild_counters():
+    """Пересчитать денормализованные счетчики тем, разделов и пользователей с нуля"""
+    replies = select(func.count(Post.id)).where(Post.thread_id == Thread.id).scalar_subquery()
+    last_post = select(Post.id).where(Post.thread_id == Thread.id) \
+        .order_by(Post.created_at.desc(), Post.id.desc()).limit(1).scalar_subquery()
+    last_post_at = select(func.max(Post.created_at)).where(Post.thread_id == Thread.id).scalar_subquery()
+    
+    # У архивных тем ответов в post нет: их счетчики не меняются с момента архивации
+    db.session.execute(update(Thread).where(Thread.is_archived.is_(False)).values(
+        post_count=replies,
+        last_post_id=last_post,
+        last_post_at=last_post_at
+    ))
+    
+    threads = select(func.count(Thread.id)).where(Thread.section_id == Section.id).scalar_subquery()
+    posts = select(func.coalesce(func.sum(Thread.post_count), 0)) \
+        .where(Thread.section_id == Section.id).scalar_subquery()
+    last_thread = select(Thread.id).where(Thread.section_id == Section.id) \
+        .order_by(Thread.updated_at.desc()).limit(1).scalar_subquery()
+    
+    db.session.execute(update(Section).values(
+        thread_count=threads,
+        post_count=posts,
+        last_thread_id=last_thread
+    ))
+    
+    user_threads = select(func.count(Thread.id)).where(Thread.user_id == User.id).scalar_subquery()
+    user_posts = select(func.count(Post.id)).where(Post.user_id == User.id).scalar_subquery()
+    db.session.execute(update(User).values(
+        thread_count=user_threads,
+        post_count=user_posts
+    ))
+    archived = Counter()
+    for archives in archive_batches():
+        for archive in archives:
+            archived.update(post.user_id for post in unpack_posts(archive))
+    if archived:
+        db.session.execute(
+            update(User.__table__).where(User.__table__.c.id == bindparam('target'))
+            .values(post_count=User.__table__.c.post_count + bindparam('amount')),
+            [{'target': user_id, 'amount': amount} for user_id, amount in archived.items()]
+        )
+    db.session.commit()
+
+
+@forum_cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Пересчитать счетчики сообщений и тем (в разделах, темах и у пользователей)."""
+    rebuild_counters()
+    click.echo('Счетчики пересчитаны.')
+
+
+@forum_cli.command('reindex')
+@click.option('--batch-size', default=1000, show_default=True, help='Записей в одной транзакции.')
+def reindex_command(batch_size):
+    """Перестроить поисковый индекс по темам и сообщениям."""
+    total = reindex_all(batch_size)
+    click.echo(f'Проиндексировано записей: {total}.')
+
+
+@forum_cli.command('delete')
+@click.argument('kind', type=click.Choice(['thread', 'section', 'category']))
+@click.argument('target_id', type=int)
+@click.option('--chunk-size', default=1000, show_default=True, help='Строк в одной транзакции.')
+def delete_command(kind, target_id, chunk_size):
+    """Удалить тему, раздел или категорию со всем содержимым порциями."""
+    with click.progressbar(length=deletion_size(kind, target_id) or 1, label='Удаление') as bar:
+        TARGETS[kind](target_id, chunk_size, bar.update)
+    click.echo('Удалено.')
+
+
+@forum_cli.command('rerender')
+@click.option('--batch-size', default=1000, show_default=True, help='Записей в одной транзакции.')
+@click.option('--force', is_flag=True, help='Перерисовать все записи, а не только устаревшие.')
+def rerender_command(batch_size, force):
+    """Перерисовать HTML тем и сообщений текущим рендерером."""
+    version = get_renderer().full_version
+    done = {}
+    
+    def progress(kind, count):
+        done[kind] = done.get(kind, 0) + count
+        click.echo(f'\r{kind}: {done[kind]}', nl=False)
+    
+    total = rerender_all(batch_size, force, progress)
+    click.echo(f'\nОбновлено записей: {total} (рендерер {version}).')
+
+
+@forum_cli.command('assets')
+@click.option('--fetch', is_flag=True, help='Сначала скачать сторонние файлы (Bootstrap, Font Awesome) в static/vendor.')
+@click.option('--clean', is_flag=True, help='Удалить файлы прошлых сборок.')
+def assets_command(fetch, clean):
+    """Собрать статические файлы: бандлы, хеши в именах, .gz и .br."""
+    static_dir = current_app.static_folder
+    if fetch:
+        fetch_vendor(static_dir, lambda url: click.echo(f'Скачан {url}'))
+    try:
+        manifest = build_assets(static_dir, clean)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for name in BUNDLES:
+        entry = manifest[name]
+        click.echo(f"{name} -> {entry['path']} ({', '.join(entry['encodings']) or 'без сжатия'})")
+    click.echo(f'Собрано файлов: {len(manifest)}. Перезапустите приложение, чтобы подхватить манифест.')
+
+
+@forum_cli.command('archive')
+@click.option('--months', type=int, help='Архивировать темы без ответов дольше стольких месяцев '
+                                          '(по умолчанию ARCHIVE_AFTER_MONTHS).')
+@click.option('--batch-size', default=100, show_default=True, help='Тем в одной выборке.')
+def archive_command(months, batch_size):
+    """Перенести ответы давно неактивных тем в сжатый архив."""
+    if post_ids_reused():
+        raise click.ClickException('Таблица post создана без AUTOINCREMENT: новые сообщения заняли бы id '
+                                   'архивных ответов. Перенесите базу через flask forum export/import.')
+    if months is None:
+        months = current_app.config['ARCHIVE_AFTER_MONTHS']
+    
+    def progress(totals):
+        click.echo(f"Тем: {totals['threads']}, сообщений: {totals['posts']}")
+    
+    totals = archive_cold_threads(months, current_app.config['ARCHIVE_MAX_POSTS'], batch_size, progress)
+    click.echo(f"Заархивировано тем: {totals['threads']}, сообщений: {totals['posts']}; "
+               f"{_megabytes(totals['raw_bytes'])} в post -> {_megabytes(totals['archive_bytes'])} в архиве.")
+    stats = archive_stats()
+    click.echo(f"Всего в архиве тем: {stats['threads']}, сообщений: {stats['posts']}; "
+               f"{_megabytes(stats['raw_bytes'])} -> {_megabytes(stats['archive_bytes'])}.")
+    if db.engine.dialect.name == 'sqlite' and totals['threads']:
+        click.echo('Освобожденные страницы SQLite используются повторно; уменьшить файл базы - VACUUM.')
+
+
+@forum_cli.command('restore')
+@click.argument('thread_id', type=int)
+def restore_command(thread_id):
+    """Вернуть ответы архивной темы в основные таблицы."""
+    thread = db.session.get(Thread, thread_id)
+    if thread is None or not thread.is_archived:
+        raise click.ClickException(f'Тема {thread_id} не в архиве.')
+    count = restore_thread(thread)
+    db.session.commit()
+    click.echo(f'Восстановлено сообщений: {count}.')
+
+
+def _megabytes(size):
+    return f'{size / 1024 / 1024:.1f} МБ'
+
+
+@forum_cli.command('export')
+@click.argument('path')
+@click.option('--batch-size', default=1000, show_default=True, help='Строк в одной выборке.')
+def export_command(path, batch_size):
+    """Выгрузить форум в NDJSON (PATH.gz - со сжатием gzip, - в stdout)."""
+    out = open_dump(path, 'w')
+    try:
+        counts = export_forum(out, batch_size, _table_progress())
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    click.echo(f'\nВыгружено строк: {sum(counts.values())}.', err=True)
+
+
+@forum_cli.command('import')
+@click.argument('path')
+@click.option('--batch-size', default=1000, show_default=True, help='Строк в одной транзакции.')
+@click.option('--resume', is_flag=True, help='Продолжить прерванную загрузку того же файла.')
+@click.option('--reindex', is_flag=True, help='Затем построить поисковый индекс.')
+def import_command(path, batch_size, resume, reindex):
+    """Загрузить выгрузку flask forum export в пустую базу."""
+    db.create_all()
+    dump = open_dump(path, 'r')
+    try:
+        results = import_forum(dump, batch_size, resume, _table_progress())
+    except ValueError as e:
+        click.echo(err=True)
+        raise click.ClickException(str(e))
+    finally:
+        if dump is not sys.stdin:
+            dump.close()
+    click.echo(err=True)
+    for name, (inserted, skipped) in results.items():
+        click.echo(f'{name}: {inserted}' + (f' (уже были: {skipped})' if skipped else ''))
+    popularity.refresh()
+    if reindex:
+        click.echo(f'Проиндексировано записей: {reindex_all(batch_size)}.')
+    else:
+        click.echo('Поисковый индекс не перенесен: flask forum reindex.')
+
+
+def _table_progress():
+    """Вывод хода выгрузки или загрузки в stderr (stdout может быть самим файлом)"""
+    current = []
+    
+    def progress(name, count):
+        if current and current[0] != name:
+            click.echo(err=True)
+        current[:] = [name]
+        click.echo(f'\r{name}: {count}', nl=False, err=True)
+    return progress
+
+
+@forum_cli.command('hot')
+def hot_command():
+    """Пересчитать рейтинг горячих тем и записать накопленные просмотры."""
+    popularity.buffer.flush()
+    count = popularity.refresh()
+    click.echo(f'Горячих тем: {count}.')
+
+
+@forum_cli.command('avatars-gc')
+@click.option('--grace-minutes', default=60, show_default=True,
+              help='Не трогать файлы моложе этого возраста.')
+@click.option('--dry-run', is_flag=True, help='Только показать, что будет удалено.')
+def avatars_gc_command(grace_minutes, dry_run):
+    """Удалить файлы аватарок, на которые никто не ссылается."""
+    removed = collect_avatar_garbage(grace_minutes * 60, dry_run)
+    for path in removed:
+        click.echo(path)
+    click.echo(f'{"Будет удалено" if dry_run else "Удалено"} файлов: {len(removed)}.')
+
+
+def hot_queries():
+    """Запросы горячих маршрутов, для которых недопустим полный просмотр таблицы"""
+    now = datetime.utcnow()
+    section_threads = select(Thread).where(Thread.section_id == 1)
+    thread_posts = select(Post).where(Post.thread_id == 1)
+    return {
+        'index: категории': select(Category).order_by(Category.order),
+        'index: разделы': select(Section).where(Section.category_id.in_([1, 2])),
+        'index: горячие темы': select(Thread).join(HotThread, HotThread.thread_id == Thread.id)
+            .order_by(desc(HotThread.score)),
+        'hot: активные темы': select(Thread.id).where(Thread.updated_at >= now),
+        'hot: свежие ответы': select(Post.thread_id, Post.created_at).where(
+            Post.thread_id.in_([1, 2]), Post.created_at >= now
+        ),
+        'section: updated_at_desc': section_threads.order_by(desc(Thread.updated_at)),
+        'section: updated_at_asc': section_threads.order_by(asc(Thread.updated_at)),
+        'section: title_asc': section_threads.order_by(asc(Thread.title)),
+        'section: title_desc': section_threads.order_by(desc(Thread.title)),
+        'section: post_count_desc': section_threads.order_by(desc(Thread.post_count)),
+        'thread: первая страница': thread_posts.order_by(Post.created_at, Post.id).limit(21),
+        'thread: следующая страница': thread_posts.where(
+            tuple_(Post.created_at, Post.id) > tuple_(now, 1)
+        ).order_by(Post.created_at, Post.id).limit(21),
+        'thread: последняя страница': thread_posts.order_by(desc(Post.created_at), desc(Post.id)).limit(21),
+        'profile: темы': select(Thread).where(Thread.user_id == 1)
+            .order_by(desc(Thread.created_at), desc(Thread.id)).limit(6),
+        'profile: сообщения': select(Post).where(Post.user_id == 1)
+            .order_by(desc(Post.created_at), desc(Post.id)).limit(6),
+        'activity: следующая страница': select(Post).where(
+            Post.user_id == 1, tuple_(Post.created_at, Post.id) < tuple_(now, 1)
+        ).order_by(desc(Post.created_at), desc(Post.id)).limit(21),
+        'профиль: пользователь': select(User).where(User.username == 'admin'),
+    }
+
+
+def explain_hot_queries():
+    """Вернуть список проблем в планах запросов (только SQLite)"""
+    problems = []
+    connection = db.session.connection()
+    for name, statement in hot_queries().items():
+        compiled = statement.compile(dialect=connection.dialect,
+                                     compile_kwargs={'render_postcompile': True})
+        params = tuple(compiled.params[key] for key in compiled.positiontup)
+        plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).all()
+        for row in plan:
+            detail = row[-1]
+            full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+            if full_scan or 'TEMP B-TREE' in detail:
+                problems.append(f'{name}: {detail}')
+    return problems
+
+
+@forum_cli.command('explain')
+def explain_command():
+    """Проверить планы горячих запросов (ошибка при полном просмотре)."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo('Проверка планов поддерживается только для SQLite.')
+        return
+    problems = explain_hot_queries()
+    for problem in problems:
+        click.echo(problem, err=True)
+    if problems:
+        sys.exit(1)
+    click.echo('Полных просмотров таблиц нет.')
+
+
+def init_commands(app):
+    app.cli.add_command(forum_cli)
@@ -0,0 +1,270 @@
+import secrets
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, delete, func, bindparam
+from app import db
+from app.cache import invalidate_on_commit
+from app.models import User, Category, Section, Thread, Post, ThreadRead, SectionRead, HotThread, ThreadArchive
+from app.archive import archived_post_authors
+from app.search import get_search_backend
+
+# Сколько последних заданий показывать в панели администратора
+JOBS_KEPT = 20
+
+# Удаления выполняются по одному: параллельные писатели только мешали бы друг другу
+_executor = None
+_executor_lock = threading.Lock()
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _decrement(model, column, amounts):
+    """Уменьшить счетчик у нескольких строк одним executemany"""
+    table = model.__table__
+    if amounts:
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('target'))
+            .values({column: table.c[column] - bindparam('amount')}),
+            [{'target': target, 'amount': amount} for target, amount in amounts.items()]
+        )
+
+
+def _report(progress, count):
+    if progress is not None and count:
+        progress(count)
+
+
+def delete_threads(thread_ids, chunk_size=1000, progress=None):
+    """Удалить темы вместе с сообщениями без загрузки объектов ORM.
+    
+    Сообщения удаляются порциями по chunk_size, каждая порция - отдельная
+    транзакция, поэтому блокировка записи не удерживается надолго, а память
+    не зависит от размера темы. Счетчики, поисковый индекс и версии кэша
+    обновляются в той же транзакции, что и удаление порции.
+    """
+    backend = get_search_backend()
+    section_of = dict(db.session.execute(
+        select(Thread.id, Thread.section_id).where(Thread.id.in_(thread_ids))
+    ).all())
+    if not section_of:
+        return
+    thread_ids = list(section_of)
+    
+    while True:
+        rows = db.session.execute(
+            select(Post.id, Post.thread_id, Post.user_id).where(Post.thread_id.in_(thread_ids)).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        post_ids = [row.id for row in rows]
+        backend.remove_posts(post_ids)
+        db.session.execute(delete(Post).where(Post.id.in_(post_ids)),
+                           execution_options={'synchronize_session': False})
+        
+        per_thread = Counter(row.thread_id for row in rows)
+        per_section = Counter()
+        for thread_id, count in per_thread.items():
+            per_section[section_of[thread_id]] += count
+        _decrement(Thread, 'post_count', per_thread)
+        _decrement(Section, 'post_count', per_section)
+        _decrement(User, 'post_count', Counter(row.user_id for row in rows))
+        invalidate_on_commit(db.session, 'index', *(f'thread:{thread_id}' for thread_id in per_thread),
+                             *(f'section:{section_id}' for section_id in per_section))
+        db.session.commit()
+        _report(progress, len(rows))
+    
+    # Сами темы - одной транзакцией вместе с ответами, добавленными во время удаления
+    rows = db.session.execute(
+        select(Thread.id, Thread.section_id, Thread.user_id, Thread.post_count).where(Thread.id.in_(thread_ids))
+    ).all()
+    late_posts = db.session.execute(
+        select(Post.id, Post.user_id).where(Post.thread_id.in_(thread_ids))
+    ).all()
+    # Ответы архивных тем хранятся в thread_archive, но есть в поиске и счетчиках авторов:
+    # архивы разбираются по одному, в памяти копится только счетчик авторов
+    archived_authors = Counter()
+    for archived in archived_post_authors(thread_ids):
+        backend.remove_posts([post_id for post_id, _ in archived])
+        archived_authors.update(user_id for _, user_id in archived)
+    backend.remove_posts([post_id for post_id, _ in late_posts])
+    for row in rows:
+        backend.remove_thread(row.id, [])
+    db.session.execute(delete(Post).where(Post.thread_id.in_(thread_ids)),
+                       execution_options={'synchronize_session': False})
+    db.session.execute(delete(ThreadRead).where(ThreadRead.thread_id.in_(thread_ids)),
+                       execution_options={'synchronize_session': False})
+    db.session.execute(delete(HotThread).where(HotThread.thread_id.in_(thread_ids)),
+                       execution_options={'synchronize_session': False})
+    db.session.execute(delete(ThreadArchive).where(ThreadArchive.thread_id.in_(thread_ids)),
+                       execution_options={'synchronize_session': False})
+    db.session.execute(delete(Thread).where(Thread.id.in_(thread_ids)),
+                       execution_options={'synchronize_session': False})
+    
+    _decrement(Section, 'thread_count', Counter(row.section_id for row in rows))
+    post_totals = Counter()
+    for row in rows:
+        post_totals[row.section_id] += row.post_count
+    _decrement(Section, 'post_count', +post_totals)
+    _decrement(User, 'thread_count', Counter(row.user_id for row in rows))
+    _decrement(User, 'post_count', Counter(user_id for _, user_id in late_posts) + archived_authors)
+    
+    section_ids = {row.section_id for row in rows}
+    for section in Section.query.filter(Section.id.in_(section_ids),
+                                        Section.last_thread_id.in_(thread_ids)):
+        section.update_last_thread()
+    invalidate_on_commit(db.session, 'index', 'hot', *(f'thread:{row.id}' for row in rows),
+                         *(f'section:{section_id}' for section_id in section_ids))
+    db.session.commit()
+    _report(progress, len(rows))
+
+
+def delete_thread(thread_id, chunk_size=1000, progress=None):
+    delete_threads([thread_id], chunk_size, progress)
+
+
+def delete_section(section_id, chunk_size=1000, progress=None):
+    """Удалить раздел: темы порциями по chunk_size, затем сам раздел"""
+    while True:
+        thread_ids = db.session.scalars(
+            select(Thread.id).where(Thread.section_id == section_id).limit(chunk_size)
+        ).all()
+        if not thread_ids:
+            break
+        delete_threads(thread_ids, chunk_size, progress)
+    db.session.execute(delete(SectionRead).where(SectionRead.section_id == section_id),
+                       execution_options={'synchronize_session': False})
+    db.session.execute(delete(Section).where(Section.id == section_id),
+                       execution_options={'synchronize_session': False})
+    invalidate_on_commit(db.session, 'index', f'section:{section_id}')
+    db.session.commit()
+
+
+def delete_category(category_id, chunk_size=1000, progress=None):
+    """Удалить категорию со всеми разделами, темами и сообщениями"""
+    section_ids = db.session.scalars(select(Section.id).where(Section.category_id == category_id)).all()
+    for section_id in section_ids:
+        delete_section(section_id, chunk_size, progress)
+    db.session.execute(delete(Category).where(Category.id == category_id),
+                       execution_options={'synchronize_session': False})
+    invalidate_on_commit(db.session, 'index')
+    db.session.commit()
+
+
+def deletion_size(kind, target_id):
+    """Сколько строк (тем и сообщений) затронет удаление - по счетчикам"""
+    if kind == 'thread':
+        return (db.session.scalar(select(Thread.post_count).where(Thread.id == target_id)) or 0) + 1
+    sections = select(func.coalesce(func.sum(Section.post_count + Section.thread_count), 0))
+    if kind == 'section':
+        return db.session.scalar(sections.where(Section.id == target_id))
+    return db.session.scalar(sections.where(Section.category_id == target_id))
+
+
+TARGETS = {
+    'thread': delete_thread,
+    'section': delete_section,
+    'category': delete_category,
+}
+
+
+class DeletionJob:
+    """Фоновое удаление темы, раздела или категории с отчетом о ходе выполнения.
+    
+    Задания хранятся в памяти процесса: ход выполнения виден в том воркере,
+    который принял запрос на удаление.
+    """
+    
+    def __init__(self, kind, target_id, title, total):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.target_id = target_id
+        self.title = title
+        self.total = max(total, 1)
+        self.done = 0
+        self.status = 'running'
+        self.error = None
+        self.started_at = datetime.utcnow()
+        self.finished_at = None
+    
+    def advance(self, count):
+        self.done += count
+    
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        return min(self.done * 100 // self.total, 99)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'target_id': self.target_id,
+            'title': self.title,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'percent': self.percent,
+            'error': self.error,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+def delete_or_schedule(kind, target_id, title):
+    """Удалить сразу или, если объем больше DELETE_BACKGROUND_THRESHOLD, в фоне.
+    
+    Возвращает DeletionJob для фонового удаления или None, если все уже удалено.
+    """
+    app = current_app._get_current_object()
+    chunk_size = app.config['DELETE_CHUNK_SIZE']
+    total = deletion_size(kind, target_id)
+    if total <= app.config['DELETE_BACKGROUND_THRESHOLD']:
+        TARGETS[kind](target_id, chunk_size)
+        return None
+    
+    job = DeletionJob(kind, target_id, title, total)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > JOBS_KEPT:
+            _jobs.popitem(last=False)
+    _get_executor().submit(_run_job, app, job)
+    return job
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deletion')
+    return _executor
+
+
+def _run_job(app, job):
+    with app.app_context():
+        try:
+            TARGETS[job.kind](job.target_id, app.config['DELETE_CHUNK_SIZE'], job.advance)
+            job.status = 'done'
+            app.logger.info('Удаление %s %s завершено: %s строк', job.kind, job.target_id, job.done)
+        except Exception as e:
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+            app.logger.exception('Ошибка фонового удаления %s %s', job.kind, job.target_id)
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.session.remove()
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def recent_jobs():
+    """Последние задания, новые первыми"""
+    with _jobs_lock:
+        return list(reversed(_jobs.values()))
\ No newline at end of file
@@ -0,0 +1,227 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, func
+
+logger = logging.getLogger('forum.events')
+
+Event = namedtuple('Event', 'id type data')
+
+# Помещается в очередь подписчика, который не успевает читать события
+OVERFLOW = Event(None, 'reload', {})
+
+# Для скольких каналов хранить последние события (давно не активные вытесняются)
+HISTORY_CHANNELS = 1000
+
+
+class Subscription:
+    """Очередь событий одного канала для одного клиента"""
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Медленный клиент не задерживает остальных: он получит reload
+            self.overflowed = True
+            self.queue = queue.Queue(1)
+            self.queue.put_nowait(OVERFLOW)
+
+    def get(self, timeout):
+        """Следующее событие или None, если за timeout секунд ничего не пришло"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Доставка событий от публикующего процесса до хабов всех процессов.
+
+    publish отправляет событие, start запускает доставку событий в hub.dispatch.
+    """
+
+    def publish(self, channel, event_type, data):
+        raise NotImplementedError
+
+    def start(self, hub):
+        pass
+
+
+class LocalBroker(Broker):
+    """События видят только подписчики того же процесса (один воркер)"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.hub = None
+
+    def publish(self, channel, event_type, data):
+        if self.hub is not None:
+            self.hub.dispatch(channel, Event(next(self._ids), event_type, data))
+
+    def start(self, hub):
+        self.hub = hub
+
+
+class DatabaseBroker(Broker):
+    """События через таблицу live_event основной базы.
+
+    Замена внешнего брокера (Redis и т.п.) для нескольких воркеров на одной
+    базе: каждый процесс одним потоком опрашивает таблицу раз в poll_interval
+    секунд и раздает новые строки своим подписчикам. Строки старше ttl секунд
+    удаляются при публикации.
+    """
+
+    def __init__(self, engine, poll_interval=0.5, ttl=300):
+        from app.models import LiveEvent
+
+        self.engine = engine
+        self.table = LiveEvent.__table__
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self._published = 0
+
+    def publish(self, channel, event_type, data):
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.table).values(
+                channel=channel, type=event_type, data=json.dumps(data), created_at=datetime.utcnow()
+            ))
+            self._published += 1
+            if self._published % 100 == 0:
+                conn.execute(delete(self.table).where(
+                    self.table.c.created_at < datetime.utcnow() - timedelta(seconds=self.ttl)
+                ))
+
+    def start(self, hub):
+        thread = threading.Thread(target=self._poll, args=(hub,), name='live-events', daemon=True)
+        thread.start()
+
+    def _poll(self, hub):
+        table = self.table
+        with self.engine.connect() as conn:
+            last_id = conn.scalar(select(func.coalesce(func.max(table.c.id), 0)))
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with self.engine.connect() as conn:
+                    rows = conn.execute(
+                        select(table.c.id, table.c.channel, table.c.type, table.c.data)
+                        .where(table.c.id > last_id).order_by(table.c.id).limit(1000)
+                    ).all()
+            except Exception:
+                logger.exception('Ошибка чтения событий из live_event')
+                continue
+            for row in rows:
+                hub.dispatch(row.channel, Event(row.id, row.type, json.loads(row.data)))
+                last_id = row.id
+
+
+class EventHub:
+    """Раздача событий каналов ('thread:<id>') подписчикам процесса.
+
+    Подписчики - очереди в памяти, поэтому ожидающее SSE-соединение не
+    занимает поток, если сервер кооперативный (gevent): ожидание на очереди
+    переключает гринлеты. Для каждого канала хранятся последние history
+    событий, чтобы переподключившийся клиент получил пропущенное по Last-Event-ID.
+    """
+
+    def __init__(self, app=None):
+        self.broker = None
+        self._channels = {}
+        self._history = OrderedDict()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.queue_size = app.config.get('SSE_QUEUE_SIZE', 100)
+        self.history = app.config.get('SSE_HISTORY', 50)
+        self.broker_type = app.config.get('SSE_BROKER', 'local')
+        self.poll_interval = app.config.get('SSE_POLL_INTERVAL', 0.5)
+        self.ttl = app.config.get('SSE_EVENT_TTL', 300)
+        self.broker = None
+        self._started = False
+        app.extensions['events'] = self
+
+    def get_broker(self):
+        """Брокер создается при первом обращении, когда движок базы уже доступен"""
+        with self._lock:
+            if self.broker is None:
+                if self.broker_type == 'database':
+                    from app import db
+                    self.broker = DatabaseBroker(db.engine, self.poll_interval, self.ttl)
+                else:
+                    self.broker = LocalBroker()
+            if not self._started:
+                self.broker.start(self)
+                self._started = True
+            return self.broker
+
+    def publish(self, channel, event_type, data):
+        """Опубликовать событие; вызывается после коммита изменения.
+
+        Ошибка доставки не должна превращать уже сохраненный ответ в 500:
+        клиенты увидят сообщение при следующей загрузке страницы.
+        """
+        try:
+            self.get_broker().publish(channel, event_type, data)
+        except Exception:
+            logger.exception('Ошибка публикации события %s в %s', event_type, channel)
+
+    def subscribe(self, channel, last_id=None):
+        self.get_broker()
+        subscription = Subscription(channel, self.queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+            self._count += 1
+            if last_id is not None:
+                for event in self._history.get(channel, ()):
+                    if event.id > last_id:
+                        subscription.put(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def dispatch(self, channel, event):
+        with self._lock:
+            history = self._history.get(channel)
+            if history is None:
+                history = self._history[channel] = deque(maxlen=self.history)
+                while len(self._history) > HISTORY_CHANNELS:
+                    self._history.popitem(last=False)
+            else:
+                self._history.move_to_end(channel)
+            history.append(event)
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    @property
+    def connections(self):
+        return self._count
+
+
+def format_event(event):
+    """Событие в формате text/event-stream"""
+    head = f'id: {event.id}\n' if event.id is not None else ''
+    return f'{head}event: {event.type}\ndata: {json.dumps(event.data)}\n\n'
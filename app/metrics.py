@@ -0,0 +1,212 @@
+import hmac
+import json
+import logging
+import threading
+from ipaddress import ip_address, ip_network
+from time import perf_counter
+from flask import current_app, g, request, has_request_context, template_rendered, before_render_template, Response, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('forum.metrics')
+
+# Границы корзин гистограммы времени ответа, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    """Счетчики одного запроса"""
+
+    def __init__(self, keep):
+        self.start = perf_counter()
+        self.keep = keep
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.template_start = 0.0
+        self.slowest = []
+
+    def add_query(self, statement, duration):
+        self.query_count += 1
+        self.db_time += duration
+        # Держим только keep самых медленных запросов
+        if len(self.slowest) < self.keep or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.keep:]
+
+
+class EndpointStats:
+    """Накопленная статистика маршрута для /metrics"""
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.duration_sum = 0.0
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+class Metrics:
+    """Инструментирование запросов: число и время SQL-запросов, время рендеринга.
+
+    Данные отдаются в заголовке Server-Timing (в режиме отладки), в виде
+    строки JSON в логе forum.metrics и в формате Prometheus на /metrics.
+    Статистика хранится в памяти процесса: у каждого воркера своя.
+    /metrics раскрывает маршруты и их нагрузку, поэтому отвечает только по
+    METRICS_TOKEN или адресам из METRICS_ALLOWED_IPS, остальным - 404.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        if not self.enabled:
+            return
+        self.slowest_kept = app.config.get('METRICS_SLOWEST_QUERIES', 3)
+        # None - только в режиме отладки (app.debug проверяется в момент запроса)
+        self.server_timing = app.config.get('METRICS_SERVER_TIMING')
+        self.token = app.config.get('METRICS_TOKEN')
+        self.allowed_networks = [ip_network(item.strip(), strict=False)
+                                 for item in app.config.get('METRICS_ALLOWED_IPS', ())]
+        app.extensions['metrics'] = self
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _start_request(self):
+        g.request_metrics = RequestMetrics(self.slowest_kept)
+
+    def _finish_request(self, response):
+        metrics = g.pop('request_metrics', None)
+        if metrics is None or request.endpoint == 'metrics':
+            return response
+
+        duration = perf_counter() - metrics.start
+        endpoint = request.endpoint or 'unknown'
+        self._observe(endpoint, duration, metrics)
+
+        if self.server_timing or (self.server_timing is None and current_app.debug):
+            response.headers.add('Server-Timing', (
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.query_count} queries", '
+                f'tpl;dur={metrics.template_time * 1000:.1f}, '
+                f'total;dur={duration * 1000:.1f}'
+            ))
+
+        logger.info(json.dumps({
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_queries': metrics.query_count,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'template_ms': round(metrics.template_time * 1000, 2),
+            'slowest': [{'ms': round(d * 1000, 2), 'sql': sql[:200]} for d, sql in metrics.slowest],
+        }, ensure_ascii=False))
+        return response
+
+    def _observe(self, endpoint, duration, metrics):
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats()
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+            stats.count += 1
+            stats.duration_sum += duration
+            stats.query_count += metrics.query_count
+            stats.db_time += metrics.db_time
+            stats.template_time += metrics.template_time
+
+    def render_prometheus(self):
+        """Текст метрик в формате Prometheus exposition 0.0.4"""
+        with self._lock:
+            stats = sorted(self._stats.items())
+            lines = [
+                '# HELP forum_request_duration_seconds Время обработки запроса.',
+                '# TYPE forum_request_duration_seconds histogram',
+            ]
+            for endpoint, item in stats:
+                for bound, count in zip(LATENCY_BUCKETS, item.buckets):
+                    lines.append(f'forum_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'forum_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {item.count}')
+                lines.append(f'forum_request_duration_seconds_sum{{endpoint="{endpoint}"}} {item.duration_sum:.6f}')
+                lines.append(f'forum_request_duration_seconds_count{{endpoint="{endpoint}"}} {item.count}')
+            for name, attr, help_text in (
+                ('forum_db_queries_total', 'query_count', 'Число SQL-запросов.'),
+                ('forum_db_duration_seconds_total', 'db_time', 'Время SQL-запросов.'),
+                ('forum_template_duration_seconds_total', 'template_time', 'Время рендеринга шаблонов.'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, item in stats:
+                    value = getattr(item, attr)
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {value:.6f}' if isinstance(value, float)
+                                 else f'{name}{{endpoint="{endpoint}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def _scrape_allowed(self):
+        if self.token and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                              f'Bearer {self.token}'.encode()):
+            return True
+        try:
+            address = ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    def metrics_view(self):
+        if not self._scrape_allowed():
+            abort(404)
+        return Response(self.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+def _current():
+    if has_request_context():
+        return g.get('request_metrics')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current() is not None:
+        context._metrics_start = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = _current()
+    start = getattr(context, '_metrics_start', None)
+    if metrics is not None and start is not None:
+        metrics.add_query(statement, perf_counter() - start)
+
+
+def _before_render(sender, template, context, **extra):
+    metrics = _current()
+    if metrics is not None:
+        # Вложенные шаблоны (кэшируемые фрагменты) учитываются во внешнем
+        if metrics.template_depth == 0:
+            metrics.template_start = perf_counter()
+        metrics.template_depth += 1
+
+
+def _after_render(sender, template, context, **extra):
+    metrics = _current()
+    if metrics is not None and metrics.template_depth > 0:
+        metrics.template_depth -= 1
+        if metrics.template_depth == 0:
+            metrics.template_time += perf_counter() - metrics.template_start
@@ -1,33 +1,39 @@
 from datetime import datetime
-from app import db, login_manager
+from app import db, login_manager, user_cache
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.auth import hash_password, verify_password
 import os
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
-    avatar = db.Column(db.String(120), default='default.png')
+    # Хеш scrypt занимает около 160 символов
+    password_hash = db.Column(db.String(256))
+    # Имя файла (старые аватарки) или хеш содержимого (набор размеров в ab/cd/)
+    avatar = db.Column(db.String(120), default='default.png', index=True)
     is_moderator = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     about = db.Column(db.Text, default='')
+    # Денормализованные счетчики профиля (обновляются в маршрутах и при удалении,
+    # пересчет - flask forum rebuild-counters)
+    thread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     posts = db.relationship('Post', backref='author', lazy='dynamic')
     threads = db.relationship('Thread', backref='author', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
     def get_post_count(self):
-        return self.posts.count()
+        return self.post_count
     
     def get_thread_count(self):
-        return self.threads.count()
+        return self.thread_count
     
     def get_avatar_url(self):
         return f'/app/static/avatars/{self.avatar}'
@@ -39,40 +45,148 @@ class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    order = db.Column(db.Integer, default=0)
+    order = db.Column(db.Integer, default=0, index=True)
     
     sections = db.relationship('Section', backref='category', lazy='dynamic', cascade='all, delete-orphan')
+    # Не-динамический вариант для пакетной загрузки (selectinload) на главной
+    section_list = db.relationship('Section', viewonly=True, order_by='Section.id')
 
 class Section(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False, index=True)
+    
+    # Денормализованные счетчики (обновляются в маршрутах, пересчет - flask forum rebuild-counters)
+    thread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_thread_id = db.Column(db.Integer)
     
     threads = db.relationship('Thread', backref='section', lazy='dynamic', cascade='all, delete-orphan')
+    last_thread = db.relationship('Thread', primaryjoin='foreign(Section.last_thread_id) == Thread.id',
+                                  uselist=False, viewonly=True)
+    
+    def update_last_thread(self):
+        """Пересчитать последнюю активную тему раздела"""
+        latest = db.session.query(Thread.id).filter(Thread.section_id == self.id) \
+            .order_by(Thread.updated_at.desc()).first()
+        self.last_thread_id = latest.id if latest else None
 
 class Thread(db.Model):
+    # Индексы под сортировки раздела, последнюю тему раздела, темы в профиле
+    # и отбор недавно активных тем для рейтинга горячих
+    __table_args__ = (
+        db.Index('ix_thread_section_updated', 'section_id', 'updated_at'),
+        db.Index('ix_thread_section_title', 'section_id', 'title'),
+        db.Index('ix_thread_section_post_count', 'section_id', 'post_count'),
+        db.Index('ix_thread_user_created', 'user_id', 'created_at'),
+        db.Index('ix_thread_updated', 'updated_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # HTML, отрисованный при записи, и версия рендерера (flask forum rerender)
+    content_html = db.Column(db.Text)
+    content_version = db.Column(db.String(32))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_pinned = db.Column(db.Boolean, default=False)
     is_locked = db.Column(db.Boolean, default=False)
+    # Ответы давно неактивной темы перенесены в thread_archive (flask forum archive)
+    is_archived = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     section_id = db.Column(db.Integer, db.ForeignKey('section.id'), nullable=False)
     
+    # Количество ответов и последний ответ (без учета первого сообщения темы)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_post_at = db.Column(db.DateTime)
+    last_post_id = db.Column(db.Integer)
+    # Просмотры (пишутся пачками из памяти воркеров, см. app/popularity.py)
+    views = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     posts = db.relationship('Post', backref='thread', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def update_last_post(self):
+        """Пересчитать последний ответ темы (по индексу thread_id, created_at, id)"""
+        latest = db.session.query(Post.id, Post.created_at).filter(Post.thread_id == self.id) \
+            .order_by(Post.created_at.desc(), Post.id.desc()).first()
+        self.last_post_id = latest.id if latest else None
+        self.last_post_at = latest.created_at if latest else None
 
 class Post(db.Model):
+    # Индексы под keyset-пагинацию темы по (created_at, id) и сообщения в профиле.
+    # AUTOINCREMENT: SQLite не отдает новым сообщениям id ответов, перенесенных
+    # в архив (они возвращаются в post с прежними id и ключами в поиске)
+    __table_args__ = (
+        db.Index('ix_post_thread_created', 'thread_id', 'created_at', 'id'),
+        db.Index('ix_post_user_created', 'user_id', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text)
+    content_version = db.Column(db.String(32))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     thread_id = db.Column(db.Integer, db.ForeignKey('thread.id'), nullable=False)
 
+class ThreadRead(db.Model):
+    """Позиция (created_at, id) последнего прочитанного ответа темы.
+
+    Прочитано только первое сообщение - last_read_post_id = 0 и время создания темы.
+    """
+    __tablename__ = 'thread_read'
+    __table_args__ = (
+        db.Index('ix_thread_read_thread', 'thread_id'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    thread_id = db.Column(db.Integer, db.ForeignKey('thread.id'), primary_key=True)
+    last_read_at = db.Column(db.DateTime, nullable=False)
+    last_read_post_id = db.Column(db.Integer, nullable=False, default=0)
+
+class SectionRead(db.Model):
+    """Отметка «все прочитано» в разделе: темы без ответов после marked_at прочитаны"""
+    __tablename__ = 'section_read'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    section_id = db.Column(db.Integer, db.ForeignKey('section.id'), primary_key=True)
+    marked_at = db.Column(db.DateTime, nullable=False)
+
+class ThreadArchive(db.Model):
+    """Ответы архивной темы одним сжатым блоком (zlib, JSON), см. app/archive.py"""
+    __tablename__ = 'thread_archive'
+
+    thread_id = db.Column(db.Integer, db.ForeignKey('thread.id'), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    post_count = db.Column(db.Integer, nullable=False)
+    # Размер текста и HTML ответов в таблице post до архивации (для отчета об экономии)
+    raw_size = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class HotThread(db.Model):
+    """Рейтинг горячих тем, пересчитывается периодически (flask forum hot)"""
+    __tablename__ = 'hot_thread'
+
+    thread_id = db.Column(db.Integer, db.ForeignKey('thread.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, index=True)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+class LiveEvent(db.Model):
+    """Событие для SSE-подписчиков других процессов (SSE_BROKER = database)"""
+    __tablename__ = 'live_event'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(64), nullable=False)
+    type = db.Column(db.String(16), nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
\ No newline at end of file
+    # Снимок из кэша: полный объект User нужен лишь маршрутам с full_user
+    return user_cache.load(int(id))
\ No newline at end of file
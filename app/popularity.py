@@ -0,0 +1,163 @@
+import logging
+import operator
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from sqlalchemy import select, update, delete, func, bindparam
+from sqlalchemy.orm import joinedload
+from app.buffers import WriteBuffer
+
+logger = logging.getLogger('forum.popularity')
+
+# Сколько id тем в одном IN-списке при подсчете свежих ответов
+IN_CHUNK = 500
+
+
+class Popularity:
+    """Просмотры тем и рейтинг горячих тем.
+
+    Просмотр не пишется в базу в запросе (UPDATE на каждый просмотр занимал
+    бы блокировку записи SQLite): приращения копятся в WriteBuffer и
+    записываются одним executemany раз в VIEW_FLUSH_INTERVAL секунд.
+
+    Рейтинг пересчитывается фоновым потоком раз в HOT_REFRESH_INTERVAL
+    (или командой flask forum hot) в таблицу hot_thread; главная только
+    читает из нее HOT_THREADS строк.
+    """
+
+    def __init__(self, app=None):
+        self.buffer = WriteBuffer('views', self._write, operator.add)
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.buffer.init_app(app, app.config.get('VIEW_FLUSH_INTERVAL', 10),
+                             app.config.get('VIEW_FLUSH_SIZE', 1000))
+        app.extensions['popularity'] = self
+
+    def _write(self, items):
+        from app import db
+        from app.models import Thread
+
+        table = Thread.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('thread_id'))
+            .values(views=table.c.views + bindparam('delta')),
+            [{'thread_id': thread_id, 'delta': delta} for thread_id, delta in items.items()]
+        )
+        db.session.commit()
+
+    def counted(self, view):
+        """Считать просмотр страницы, в том числе ответы из кэша и 304"""
+        @wraps(view)
+        def wrapper(**kwargs):
+            response = view(**kwargs)
+            if getattr(response, 'status_code', 200) in (200, 304):
+                self.buffer.add(kwargs['thread_id'], 1)
+                self._start()
+            return response
+        return wrapper
+
+    def hot_threads(self):
+        """Горячие темы по последнему пересчету (с авторами и разделами)"""
+        from app import db
+        from app.models import Thread, HotThread
+
+        self._start()
+        return db.session.scalars(
+            select(Thread).join(HotThread, HotThread.thread_id == Thread.id)
+            .options(joinedload(Thread.author), joinedload(Thread.section))
+            .order_by(HotThread.score.desc())
+        ).all()
+
+    def scores(self, now=None):
+        """{id темы: оценка} для тем, активных за HOT_WINDOW_HOURS.
+
+        Каждый ответ дает 1, просмотры темы - HOT_VIEW_WEIGHT каждый; вклад
+        затухает вдвое за HOT_HALF_LIFE_HOURS: ответа - от его created_at,
+        просмотров - от последней активности темы (updated_at).
+        """
+        from app import db
+        from app.models import Thread, Post
+
+        config = self.app.config
+        now = now or datetime.utcnow()
+        half_life = config['HOT_HALF_LIFE_HOURS'] * 3600
+        cutoff = now - timedelta(hours=config['HOT_WINDOW_HOURS'])
+
+        def decay(moment):
+            return 0.5 ** (max((now - moment).total_seconds(), 0) / half_life)
+
+        scores = {}
+        candidates = db.session.execute(
+            select(Thread.id, Thread.views, Thread.updated_at).where(Thread.updated_at >= cutoff)
+        ).all()
+        for row in candidates:
+            scores[row.id] = config['HOT_VIEW_WEIGHT'] * (row.views or 0) * decay(row.updated_at)
+        thread_ids = list(scores)
+        for start in range(0, len(thread_ids), IN_CHUNK):
+            # По индексу (thread_id, created_at): только свежие ответы тем-кандидатов
+            replies = db.session.execute(
+                select(Post.thread_id, Post.created_at).where(
+                    Post.thread_id.in_(thread_ids[start:start + IN_CHUNK]), Post.created_at >= cutoff
+                )
+            )
+            for thread_id, created_at in replies:
+                scores[thread_id] += decay(created_at)
+        return scores
+
+    def refresh(self):
+        """Пересчитать рейтинг и заменить содержимое hot_thread; возвращает число тем"""
+        from app import db, cache
+        from app.models import HotThread
+
+        now = datetime.utcnow()
+        scores = self.scores(now)
+        top = sorted(scores.items(), key=operator.itemgetter(1), reverse=True)[:self.app.config['HOT_THREADS']]
+        db.session.execute(delete(HotThread))
+        if top:
+            db.session.execute(HotThread.__table__.insert(), [
+                {'thread_id': thread_id, 'score': score, 'computed_at': now} for thread_id, score in top
+            ])
+        db.session.commit()
+        cache.invalidate('hot')
+        return len(top)
+
+    def refresh_if_stale(self):
+        """Пересчитать, если последний пересчет (любого воркера) старше HOT_REFRESH_INTERVAL"""
+        from app import db
+        from app.models import HotThread
+
+        computed_at = db.session.scalar(select(func.max(HotThread.computed_at)))
+        interval = timedelta(seconds=self.app.config['HOT_REFRESH_INTERVAL'])
+        if computed_at is not None and datetime.utcnow() - computed_at < interval:
+            return False
+        self.refresh()
+        return True
+
+    def _start(self):
+        if self._thread is not None or self.app is None or not self.app.config['HOT_REFRESH_INTERVAL']:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='hot-threads', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from app import db
+
+        while True:
+            with self.app.app_context():
+                try:
+                    self.refresh_if_stale()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Ошибка пересчета горячих тем')
+                finally:
+                    db.session.remove()
+            time.sleep(self.app.config['HOT_REFRESH_INTERVAL'])
@@ -0,0 +1,185 @@
+from datetime import datetime
+from flask_login import current_user
+from sqlalchemy import select, delete, and_, case, tuple_
+from app.buffers import WriteBuffer
+
+# Сколько id тем в одном IN-списке запроса непрочитанных
+IN_CHUNK = 500
+# id в позиции отметки раздела (marked_at, ...): она стоит после всех сообщений,
+# созданных до marked_at включительно, и нигде не хранится
+WATERMARK_POST_ID = 2 ** 63 - 1
+
+
+def _upsert_statement(table, keys, values):
+    """INSERT ... ON CONFLICT для SQLite и PostgreSQL; None для остальных баз"""
+    from app import db
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    statement = insert(table)
+    return statement.on_conflict_do_update(index_elements=keys, set_=values(statement.excluded))
+
+
+def last_position(thread):
+    """Позиция (created_at, id) последнего сообщения темы в порядке страниц темы"""
+    if thread.last_post_id:
+        return (thread.last_post_at, thread.last_post_id)
+    return (thread.created_at, 0)
+
+
+class ReadTracker:
+    """Что пользователь уже прочитал.
+
+    В thread_read хранится позиция последнего прочитанного ответа темы -
+    пара (created_at, id), по которой упорядочены страницы темы (id сам по
+    себе не совпадает с порядком у импортированных сообщений). В section_read
+    - отметка «все прочитано» раздела: темы без ответов после нее считаются
+    прочитанными без отдельной строки на каждую тему.
+
+    Отметки с каждого просмотра темы не пишутся сразу, а копятся в WriteBuffer
+    (по ключу пользователь-тема остается максимум) и записываются пачкой
+    одним upsert. Еще не записанные отметки процесса учитываются при подсчете
+    непрочитанного; другие воркеры увидят их после записи (READ_FLUSH_INTERVAL).
+    """
+
+    def __init__(self, app=None):
+        self.buffer = WriteBuffer('reads', self._write, max)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.buffer.init_app(app, app.config.get('READ_FLUSH_INTERVAL', 5),
+                             app.config.get('READ_FLUSH_SIZE', 1000))
+        app.extensions['reads'] = self
+
+    def _write(self, items):
+        from app import db
+        from app.models import ThreadRead
+
+        table = ThreadRead.__table__
+        rows = [{'user_id': user_id, 'thread_id': thread_id, 'last_read_at': read_at, 'last_read_post_id': post_id}
+                for (user_id, thread_id), (read_at, post_id) in items.items()]
+        stored = tuple_(table.c.last_read_at, table.c.last_read_post_id)
+
+        def newer(excluded):
+            # Отметка только растет: параллельный воркер мог записать более позднюю
+            advanced = tuple_(excluded.last_read_at, excluded.last_read_post_id) > stored
+            return {
+                'last_read_at': case((advanced, excluded.last_read_at), else_=table.c.last_read_at),
+                'last_read_post_id': case((advanced, excluded.last_read_post_id), else_=table.c.last_read_post_id),
+            }
+
+        statement = _upsert_statement(table, ['user_id', 'thread_id'], newer)
+        if statement is not None:
+            db.session.execute(statement, rows)
+        else:
+            for row in rows:
+                key = (table.c.user_id == row['user_id'], table.c.thread_id == row['thread_id'])
+                updated = db.session.execute(
+                    table.update().where(*key, stored < tuple_(row['last_read_at'], row['last_read_post_id']))
+                    .values(last_read_at=row['last_read_at'], last_read_post_id=row['last_read_post_id'])
+                ).rowcount
+                if not updated and not db.session.execute(select(table.c.user_id).where(*key)).first():
+                    db.session.execute(table.insert().values(row))
+        db.session.commit()
+
+    def _states(self, user_id, thread_ids):
+        """{id темы: (позиция прочитанного или None, отметка раздела или None)}"""
+        from app import db
+        from app.models import Thread, ThreadRead, SectionRead
+
+        states = {}
+        thread_ids = list(thread_ids)
+        for start in range(0, len(thread_ids), IN_CHUNK):
+            rows = db.session.execute(
+                select(Thread.id, ThreadRead.last_read_at, ThreadRead.last_read_post_id, SectionRead.marked_at)
+                .select_from(Thread)
+                .outerjoin(ThreadRead, and_(ThreadRead.thread_id == Thread.id, ThreadRead.user_id == user_id))
+                .outerjoin(SectionRead, and_(SectionRead.section_id == Thread.section_id,
+                                             SectionRead.user_id == user_id))
+                .where(Thread.id.in_(thread_ids[start:start + IN_CHUNK])),
+                # Отметки пишутся только в основную базу: реплика могла еще не получить их
+                bind_arguments={'bind': db.engine}
+            ).all()
+            for row in rows:
+                read = (row.last_read_at, row.last_read_post_id) if row.last_read_at is not None else None
+                states[row.id] = (read, row.marked_at)
+        return states
+
+    def _last_read(self, user_id, thread, state):
+        """Позиция прочитанного с учетом буфера и отметки раздела; None - тема не открывалась"""
+        read, marked_at = state
+        buffered = self.buffer.get((user_id, thread.id))
+        if buffered is not None and (read is None or buffered > read):
+            read = buffered
+        # Отметка старше самой темы осталась от удаленной темы с тем же id
+        # (SQLite переиспользует id, а буфер другого воркера удаление не очищает)
+        if read is not None and read[0] < thread.created_at:
+            read = None
+        # Отметка раздела - нижняя граница прочитанного: все, что создано до нее
+        if marked_at is not None and (read is None or (marked_at, WATERMARK_POST_ID) > read):
+            read = (marked_at, WATERMARK_POST_ID)
+        return read
+
+    def unread_threads(self, user_id, threads):
+        """id тем с невиденными ответами и еще не открытых тем (один запрос на страницу)"""
+        threads = [thread for thread in threads if thread is not None]
+        states = self._states(user_id, (thread.id for thread in threads))
+        unread = set()
+        for thread in threads:
+            read = self._last_read(user_id, thread, states.get(thread.id, (None, None)))
+            if read is None or read < last_position(thread):
+                unread.add(thread.id)
+        return unread
+
+    def unread_sections(self, user_id, sections):
+        """id разделов, последняя активная тема которых не прочитана"""
+        unread = self.unread_threads(user_id, [section.last_thread for section in sections])
+        return {section.id for section in sections if section.last_thread_id in unread}
+
+    def last_read(self, user_id, thread):
+        return self._last_read(user_id, thread, self._states(user_id, [thread.id]).get(thread.id, (None, None)))
+
+    def mark_read(self, user_id, thread_id, position):
+        """Отметить тему прочитанной до позиции (created_at, id) (запишется с буфером).
+
+        Вызывается, только если отметка продвинулась: сбрасывает ETag
+        страниц со значками непрочитанного.
+        """
+        from app import cache
+
+        self.buffer.add((user_id, thread_id), position)
+        cache.invalidate(f'reads:{user_id}')
+
+    def mark_section_read(self, user_id, section_id):
+        """Все темы раздела прочитаны: одна строка section_read вместо строк по темам"""
+        from app import db
+        from app.cache import invalidate_on_commit
+        from app.models import Thread, ThreadRead, SectionRead
+
+        table = SectionRead.__table__
+        row = {'user_id': user_id, 'section_id': section_id, 'marked_at': datetime.utcnow()}
+        statement = _upsert_statement(table, ['user_id', 'section_id'],
+                                      lambda excluded: {'marked_at': excluded.marked_at})
+        if statement is None:
+            db.session.execute(delete(table).where(table.c.user_id == user_id, table.c.section_id == section_id))
+            statement = table.insert()
+        db.session.execute(statement, [row])
+        # Отметки отдельных тем раздела теперь ничего не добавляют
+        db.session.execute(delete(ThreadRead).where(
+            ThreadRead.user_id == user_id,
+            ThreadRead.thread_id.in_(select(Thread.id).where(Thread.section_id == section_id))
+        ), execution_options={'synchronize_session': False})
+        invalidate_on_commit(db.session, f'reads:{user_id}')
+
+
+def read_state(**kwargs):
+    """Имя версии кэша с состоянием прочтения текущего пользователя (для ETag страниц)"""
+    if current_user.is_authenticated:
+        return f'reads:{current_user.id}'
+    return 'reads'
@@ -0,0 +1,137 @@
+import re
+from flask import current_app
+from markupsafe import escape, Markup
+from sqlalchemy import select, update, or_
+
+try:
+    import markdown
+    import nh3
+except ImportError:
+    markdown = nh3 = None
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+class ContentRenderer:
+    """Преобразование текста сообщения в HTML.
+
+    version меняется при любом изменении результата: строки с другой
+    версией перерисовывает flask forum rerender.
+    """
+
+    name = None
+    version = 1
+
+    @property
+    def full_version(self):
+        return f'{self.name}:{self.version}'
+
+    def render(self, text):
+        raise NotImplementedError
+
+
+class PlainRenderer(ContentRenderer):
+    """Экранированный текст: абзацы по пустым строкам, переносы строк - <br>"""
+
+    name = 'plain'
+
+    def render(self, text):
+        text = (text or '').replace('\r\n', '\n').strip()
+        paragraphs = (str(escape(part.strip())).replace('\n', '<br>\n')
+                      for part in _PARAGRAPH_BREAK.split(text) if part.strip())
+        return '\n'.join(f'<p>{paragraph}</p>' for paragraph in paragraphs)
+
+
+class MarkdownRenderer(ContentRenderer):
+    """Markdown с очисткой результата по белому списку тегов (пакеты markdown и nh3)"""
+
+    name = 'markdown'
+    tags = {'p', 'br', 'strong', 'em', 'del', 'code', 'pre', 'blockquote', 'ul', 'ol', 'li',
+            'a', 'h3', 'h4', 'h5', 'h6', 'hr'}
+    attributes = {'a': {'href', 'title'}}
+
+    def __init__(self):
+        if markdown is None:
+            raise RuntimeError('CONTENT_RENDERER = "markdown" требует пакетов markdown и nh3')
+
+    def render(self, text):
+        html = markdown.markdown(text or '', extensions=['fenced_code', 'nl2br', 'sane_lists'])
+        return nh3.clean(html, tags=self.tags, attributes=self.attributes,
+                         url_schemes={'http', 'https', 'mailto'}, link_rel='nofollow noopener')
+
+
+RENDERERS = {
+    'plain': PlainRenderer,
+    'markdown': MarkdownRenderer,
+}
+
+_renderers = {}
+
+
+def get_renderer():
+    name = current_app.config['CONTENT_RENDERER']
+    renderer = _renderers.get(name)
+    if renderer is None:
+        renderer = _renderers[name] = RENDERERS[name]()
+    return renderer
+
+
+def render_content(obj):
+    """Заполнить content_html и content_version объекта Thread или Post"""
+    renderer = get_renderer()
+    obj.content_html = renderer.render(obj.content)
+    obj.content_version = renderer.full_version
+
+
+def content_html(obj):
+    """HTML сообщения для шаблона; еще не отрисованные строки рисуются на лету"""
+    if obj.content_html is None:
+        return Markup(get_renderer().render(obj.content))
+    return Markup(obj.content_html)
+
+
+def post_card_key(post, number):
+    """Ключ фрагмента карточки сообщения (страница темы и события SSE).
+
+    Версия рендерера отделяет перерисованные сообщения, время создания -
+    новое сообщение от удаленного с тем же id (SQLite переиспользует id).
+    """
+    return f'{post.id}-{number}-{post.content_version}-{post.created_at.isoformat()}'
+
+
+def rerender_all(batch_size=1000, force=False, progress=None):
+    """Перерисовать content_html тем и сообщений с устаревшей версией рендерера.
+
+    Строки выбираются пакетами по возрастанию id, каждый пакет записывается
+    одним executemany и отдельной транзакцией. Возвращает число обновленных строк.
+    """
+    from app import db
+    from app.cache import invalidate_on_commit
+    from app.models import Thread, Post
+
+    renderer = get_renderer()
+    version = renderer.full_version
+    total = 0
+    for model in (Thread, Post):
+        thread_column = model.id if model is Thread else model.thread_id
+        last_id = 0
+        while True:
+            query = select(model.id, thread_column.label('thread_id'), model.content) \
+                .where(model.id > last_id).order_by(model.id).limit(batch_size)
+            if not force:
+                query = query.where(or_(model.content_version.is_(None), model.content_version != version))
+            rows = db.session.execute(query).all()
+            if not rows:
+                break
+            db.session.execute(update(model), [
+                {'id': row.id, 'content_html': renderer.render(row.content), 'content_version': version}
+                for row in rows
+            ])
+            # Закэшированные страницы тем содержат старый HTML
+            invalidate_on_commit(db.session, *{f'thread:{row.thread_id}' for row in rows})
+            db.session.commit()
+            last_id = rows[-1].id
+            total += len(rows)
+            if progress is not None:
+                progress(model.__name__, len(rows))
+    return total
\ No newline at end of file
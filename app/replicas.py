@@ -0,0 +1,87 @@
+import random
+import time
+from functools import wraps
+from flask import current_app, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+# Ключ в cookie-сессии: до этого времени запросы пользователя читают с основной базы
+PIN_KEY = '_primary_until'
+
+
+class RoutingSession(Session):
+    """Сессия, которая отправляет SELECT на реплику, выбранную для запроса.
+
+    Реплика выбирается декоратором use_replica. Запись (flush, INSERT,
+    UPDATE, DELETE) всегда идет в основную базу, а после первой записи
+    в сессии на основную базу переходит и чтение.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if (replica is not None and bind is None and isinstance(clause, Select)
+                and not self._flushing and not self.info.get('wrote')):
+            return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_replicas(app):
+    """Подключить реплики из REPLICA_URLS как дополнительные binds.
+
+    Вызывается до db.init_app, чтобы движки реплик создались вместе с основным.
+    """
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    names = []
+    for number, url in enumerate(app.config['REPLICA_URLS'], 1):
+        name = f'replica{number}'
+        binds[name] = url
+        names.append(name)
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.extensions['replicas'] = names
+
+    if not event.contains(Session, 'after_commit', _pin_to_primary):
+        event.listen(Session, 'after_flush', _mark_write)
+        event.listen(Session, 'do_orm_execute', _mark_dml)
+        event.listen(Session, 'after_commit', _pin_to_primary)
+        event.listen(Session, 'after_rollback', _forget_write)
+
+
+def use_replica(view):
+    """Выполнять чтение обработчика на случайной реплике.
+
+    Если пользователь недавно что-то записал (REPLICA_PIN_SECONDS),
+    он читает с основной базы и видит свои изменения, даже если реплика отстает.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from app import db
+
+        replicas = current_app.extensions.get('replicas')
+        if not replicas or session.get(PIN_KEY, 0) > time.time():
+            return view(*args, **kwargs)
+        db.session.info['replica'] = random.choice(replicas)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            db.session.info.pop('replica', None)
+    return wrapper
+
+
+def _mark_write(db_session, flush_context):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.info['wrote'] = True
+
+
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+def _pin_to_primary(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context() and current_app.extensions.get('replicas'):
+        session[PIN_KEY] = time.time() + current_app.config['REPLICA_PIN_SECONDS']
+
+
+def _forget_write(db_session):
+    db_session.info.pop('wrote', None)
\ No newline at end of file
@@ -1,30 +1,41 @@
-from flask import render_template, flash, redirect, url_for, request, abort
+import os
+from flask import render_template, flash, redirect, url_for, request, abort, send_from_directory, jsonify, make_response, Response, after_this_request
 from flask_login import login_user, current_user, logout_user, login_required
 from datetime import datetime
-from app import db
-from app.models import User, Category, Section, Thread, Post
+from app import db, cache, events, reads, popularity
+from app.cache import full_user
+from app.auth import AuthBusy, needs_rehash, rate_limited
+from app.models import User, Category, Section, Thread, Post, SectionRead
 from app.forms import RegistrationForm, LoginForm, ThreadForm, PostForm, ProfileForm, ChangePasswordForm, SortForm
-from app.utils import save_avatar, delete_old_avatar, allowed_file
-from sqlalchemy import desc, func, asc, text
+from app.utils import save_avatar, allowed_file, get_thread_page, get_activity_page, avatar_srcset, is_hashed_avatar, retry_on_busy
+from sqlalchemy import desc, func, asc, text, select, tuple_, update
+from sqlalchemy.orm import selectinload, joinedload
 from app.utils import get_avatar_url
 from app.forms import CategoryForm, SectionForm
+from app.search import get_search_backend
+from app.deletion import delete_or_schedule, get_job, recent_jobs
+from app.replicas import use_replica
+from app.rendering import render_content, post_card_key
+from app.events import format_event
+from app.reads import read_state, last_position
+from app.archive import archived_thread_page, restore_thread
+from datetime import timedelta
 
 def init_routes(app):
     
     @app.context_processor
     def utility_processor():
         def get_thread_post_count(thread):
-            return thread.posts.count()
+            return thread.post_count
         
         def get_section_post_count(section_id):
-            """Подсчет сообщений в разделе"""
-            from app.models import Post, Thread
-            return db.session.query(Post).join(Thread).filter(Thread.section_id == section_id).count()
+            """Количество сообщений в разделе (денормализованный счетчик)"""
+            return db.session.query(Section.post_count).filter(Section.id == section_id).scalar() or 0
         
         def get_section_stats(section):
-            thread_count = section.threads.count()
-            post_count = get_section_post_count(section.id)
-            latest_thread = section.threads.order_by(desc(Thread.updated_at)).first()
+            thread_count = section.thread_count
+            post_count = section.post_count
+            latest_thread = section.last_thread
             return {
                 'thread_count': thread_count,
                 'post_count': post_count,
@@ -35,22 +46,80 @@ def init_routes(app):
             get_thread_post_count=get_thread_post_count,
             get_section_post_count=get_section_post_count,  # ← ДОБАВЛЯЕМ
             get_section_stats=get_section_stats,
-            get_avatar_url=get_avatar_url
+            get_avatar_url=get_avatar_url,
+            avatar_srcset=avatar_srcset
         )
 
+    # Валидаторы для условных GET-запросов: один индексированный запрос вместо сборки страницы
+    def index_state():
+        row = db.session.query(
+            func.count(Section.id), func.sum(Section.thread_count),
+            func.sum(Section.post_count), func.max(Thread.updated_at)
+        ).outerjoin(Thread, Thread.id == Section.last_thread_id).one()
+        return tuple(row)
+    
+    def section_state(section_id):
+        row = db.session.query(
+            Section.thread_count, Section.post_count, Section.last_thread_id, Thread.updated_at
+        ).outerjoin(Thread, Thread.id == Section.last_thread_id).filter(Section.id == section_id).first()
+        return tuple(row) if row else None
+    
+    def thread_state(thread_id):
+        row = db.session.query(
+            Thread.updated_at, Thread.post_count, Thread.last_post_id, Thread.is_locked, Thread.is_pinned
+        ).filter(Thread.id == thread_id).first()
+        return tuple(row) if row else None
+    
+    def count_user_activity(user_id, **deltas):
+        """Изменить счетчики профиля одним UPDATE, не загружая User"""
+        # Изменение объекта User сбросило бы кэш снимков и фрагменты с авторами
+        db.session.execute(update(User).where(User.id == user_id).values(
+            {name: getattr(User, name) + delta for name, delta in deltas.items()}
+        ), execution_options={'synchronize_session': False})
+    
+    def publish_post(post_id):
+        """Отправить карточку нового сообщения открытым страницам темы"""
+        post = Post.query.options(joinedload(Post.author)).filter(Post.id == post_id).one()
+        number = db.session.scalar(select(Thread.post_count).where(Thread.id == post.thread_id)) + 1
+        # Тот же фрагмент кэша, что и на странице темы
+        html = cache.cached_include('forum/_post_card.html', post_card_key(post, number),
+                                    depends=['users'], post=post, number=number)
+        events.publish(f'thread:{post.thread_id}', 'post', {'id': post.id, 'html': str(html)})
+
     @app.route('/')
+    @use_replica
+    @cache.conditional(index_state, 'index', 'hot', 'users', read_state)
+    @cache.cached_page('index', 'hot', 'users')
     def index():
-        categories = Category.query.order_by(Category.order).all()
-        
-        # Предварительно загружаем данные для статистики
-        for category in categories:
-            for section in category.sections:
-                # Получаем последнюю тему для каждого раздела
-                section.latest_thread = section.threads.order_by(desc(Thread.updated_at)).first()
-        
-        return render_template('forum/index.html', categories=categories)
+        # Все дерево категория -> раздел -> последняя тема (+автор) за 3 запроса,
+        # независимо от количества разделов
+        categories = Category.query.options(
+            selectinload(Category.section_list)
+            .selectinload(Section.last_thread)
+            .joinedload(Thread.author)
+        ).order_by(Category.order).all()
+        
+        unread = set()
+        if current_user.is_authenticated:
+            sections = [section for category in categories for section in category.section_list]
+            unread = reads.unread_sections(current_user.id, sections)
+        return render_template('forum/index.html', categories=categories, unread=unread,
+                               hot_threads=popularity.hot_threads())
+
+    @app.route('/avatars/<path:filename>')
+    def avatar_file(filename):
+        response = send_from_directory(os.path.abspath(app.config['UPLOAD_FOLDER']), filename)
+        # Имя по хешу меняется вместе с содержимым - файл можно кэшировать навсегда
+        if is_hashed_avatar(os.path.basename(filename).split('_')[0]):
+            response.cache_control.public = True
+            response.cache_control.max_age = 365 * 24 * 3600
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
 
     @app.route('/register', methods=['GET', 'POST'])
+    @rate_limited('register_ip')
+    @retry_on_busy
     def register():
         if current_user.is_authenticated:
             return redirect(url_for('index'))
@@ -67,6 +136,7 @@ def init_routes(app):
         return render_template('auth/register.html', form=form)
 
     @app.route('/login', methods=['GET', 'POST'])
+    @rate_limited('login_ip', 'login_user')
     def login():
         if current_user.is_authenticated:
             return redirect(url_for('index'))
@@ -75,6 +145,10 @@ def init_routes(app):
         if form.validate_on_submit():
             user = User.query.filter_by(username=form.username.data).first()
             if user and user.check_password(form.password.data):
+                # Хеш со старыми параметрами заменяем, пока пароль известен
+                if needs_rehash(user.password_hash):
+                    user.set_password(form.password.data)
+                    db.session.commit()
                 login_user(user, remember=form.remember.data)
                 next_page = request.args.get('next')
                 return redirect(next_page) if next_page else redirect(url_for('index'))
@@ -91,28 +165,27 @@ def init_routes(app):
     # Профиль пользователя
     @app.route('/profile')
     @login_required
+    @full_user
+    @use_replica
     def profile():
-        # Используем desc() для сортировки вместо строки
-        recent_threads = current_user.threads.order_by(desc(Thread.created_at)).limit(3).all()
-        recent_posts = current_user.posts.order_by(desc(Post.created_at)).limit(3).all()
+        # Счетчики хранятся в User, лента - два запроса по индексам
+        activity = get_activity_page(current_user.id, app.config['PROFILE_ACTIVITY_ITEMS'])
         
-        return render_template('user/profile.html', 
-                             recent_threads=recent_threads, 
-                             recent_posts=recent_posts)
+        return render_template('user/profile.html', activity=activity)
 
     @app.route('/profile/edit', methods=['GET', 'POST'])
     @login_required
+    @full_user
     def edit_profile():
         form = ProfileForm(original_username=current_user.username, original_email=current_user.email)
         
         if form.validate_on_submit():
             if form.avatar.data:
-                # Сохраняем новую аватарку
-                avatar_filename = save_avatar(form.avatar.data)
-                if avatar_filename:
-                    # Удаляем старую аватарку если она не дефолтная
-                    delete_old_avatar(current_user.avatar)
-                    current_user.avatar = avatar_filename
+                # Аватарка обрабатывается в фоне и заменит старую, когда будет готова
+                if save_avatar(form.avatar.data, current_user.id):
+                    flash('Аватарка загружена и скоро обновится.', 'info')
+                else:
+                    flash('Не удалось принять аватарку, попробуйте позже.', 'warning')
             
             current_user.username = form.username.data
             current_user.email = form.email.data
@@ -131,6 +204,7 @@ def init_routes(app):
 
     @app.route('/profile/change_password', methods=['GET', 'POST'])
     @login_required
+    @full_user
     def change_password():
         form = ChangePasswordForm()
         
@@ -147,21 +221,30 @@ def init_routes(app):
 
     # Публичный профиль
     @app.route('/user/<username>')
+    @use_replica
     def user_profile(username):
         user = User.query.filter_by(username=username).first_or_404()
         
-        # Получаем последние темы и сообщения пользователя
-        recent_threads = user.threads.order_by(desc(Thread.created_at)).limit(5).all()
-        recent_posts = user.posts.order_by(desc(Post.created_at)).limit(5).all()
+        # Последние темы и сообщения пользователя одной лентой
+        activity = get_activity_page(user.id, app.config['PROFILE_ACTIVITY_ITEMS'])
         
-        return render_template('user/user_profile.html', 
-                             user=user, 
-                             recent_threads=recent_threads, 
-                             recent_posts=recent_posts)
+        return render_template('user/user_profile.html', user=user, activity=activity)
+
+    @app.route('/user/<username>/activity')
+    @use_replica
+    def user_activity(username):
+        user = User.query.filter_by(username=username).first_or_404()
+        # Keyset-пагинация: курсор before - последняя запись предыдущей страницы
+        activity = get_activity_page(user.id, app.config['ACTIVITY_PER_PAGE'],
+                                     before=request.args.get('before'))
+        return render_template('user/activity.html', user=user, activity=activity)
 
 
 
     @app.route('/section/<int:section_id>')
+    @use_replica
+    @cache.conditional(section_state, lambda section_id: f'section:{section_id}', 'users', read_state)
+    @cache.cached_page(lambda section_id: f'section:{section_id}', 'users')
     def section(section_id):
         section = Section.query.get_or_404(section_id)
         form = SortForm()
@@ -169,8 +252,8 @@ def init_routes(app):
         # Получаем параметры сортировки
         sort_by = request.args.get('sort_by', 'updated_at_desc')
         
-        # Базовый запрос
-        query = section.threads
+        # Базовый запрос (авторы тем загружаются тем же запросом)
+        query = section.threads.options(joinedload(Thread.author))
         
         # Применяем сортировку
         if sort_by == 'updated_at_desc':
@@ -183,20 +266,67 @@ def init_routes(app):
             threads = query.order_by(desc(Thread.title)).all()
         elif sort_by == 'post_count_desc':
             # Сортировка по количеству сообщений
-            threads = query.outerjoin(Post).group_by(Thread.id).order_by(
-                desc(func.count(Post.id))
-            ).all()
+            threads = query.order_by(desc(Thread.post_count)).all()
         else:
             threads = query.order_by(desc(Thread.updated_at)).all()
         
+        # Значки непрочитанного - одним запросом на всю страницу
+        unread = reads.unread_threads(current_user.id, threads) if current_user.is_authenticated else set()
         return render_template('forum/category.html', 
                             section=section, 
                             threads=threads, 
                             form=form,
-                            current_sort=sort_by)
+                            current_sort=sort_by,
+                            unread=unread)
+
+    @app.route('/section/<int:section_id>/read', methods=['POST'])
+    @login_required
+    @retry_on_busy
+    def mark_section_read(section_id):
+        section = Section.query.get_or_404(section_id)
+        reads.mark_section_read(current_user.id, section.id)
+        db.session.commit()
+        flash('Все темы раздела отмечены как прочитанные.', 'success')
+        return redirect(url_for('section', section_id=section.id))
+
+    @app.route('/search')
+    def search():
+        query = request.args.get('q', '').strip()
+        page = max(request.args.get('page', 1, type=int), 1)
+        section_id = request.args.get('section', type=int)
+        author = request.args.get('author', '').strip()
+        
+        # Даты в формате ГГГГ-ММ-ДД, дата окончания включительно
+        def parse_date(name):
+            try:
+                return datetime.strptime(request.args.get(name, ''), '%Y-%m-%d')
+            except ValueError:
+                return None
+        date_from = parse_date('date_from')
+        date_to = parse_date('date_to')
+        if date_to:
+            date_to += timedelta(days=1)
+        
+        results, has_next = [], False
+        author_user = User.query.filter_by(username=author).first() if author else None
+        if query and not (author and author_user is None):
+            results, has_next = get_search_backend().search(
+                query,
+                section_id=section_id,
+                user_id=author_user.id if author_user else None,
+                date_from=date_from,
+                date_to=date_to,
+                page=page,
+                per_page=app.config['SEARCH_RESULTS_PER_PAGE']
+            )
+        
+        sections = Section.query.order_by(Section.name).all()
+        return render_template('forum/search.html', query=query, results=results,
+                             page=page, has_next=has_next, sections=sections)
 
     @app.route('/section/<int:section_id>/new', methods=['GET', 'POST'])
     @login_required
+    @retry_on_busy
     def new_thread(section_id):
         section = Section.query.get_or_404(section_id)
         form = ThreadForm()
@@ -208,24 +338,116 @@ def init_routes(app):
                 user_id=current_user.id,
                 section_id=section_id
             )
+            render_content(thread)
             db.session.add(thread)
+            db.session.flush()
+            
+            # Счетчики раздела и автора обновляем в той же транзакции
+            section.thread_count = Section.thread_count + 1
+            section.last_thread_id = thread.id
+            count_user_activity(current_user.id, thread_count=1)
+            get_search_backend().index_thread(thread)
+            # id до commit: после него обращение к объекту перечитало бы строку
+            thread_id = thread.id
             db.session.commit()
             flash('Тема создана успешно!', 'success')
-            return redirect(url_for('thread', thread_id=thread.id))
+            return redirect(url_for('thread', thread_id=thread_id))
         
         return render_template('forum/new_thread.html', form=form, section=section)
 
     @app.route('/thread/<int:thread_id>')
+    @popularity.counted
+    @use_replica
+    @cache.conditional(thread_state, 'users')
+    @cache.cached_page(lambda thread_id: f'thread:{thread_id}', 'users')
     def thread(thread_id):
-        thread = Thread.query.get_or_404(thread_id)
-        posts = thread.posts.order_by(Post.created_at.asc()).all()
+        # Автор и раздел (для навигации) загружаются вместе с темой
+        thread = Thread.query.options(
+            joinedload(Thread.author),
+            joinedload(Thread.section)
+        ).get_or_404(thread_id)
+        per_page = app.config['POSTS_PER_PAGE']
+        
+        last_read = None
+        if current_user.is_authenticated:
+            last_read = reads.last_read(current_user.id, thread)
+            # Тема открыта без курсора и в ней есть новые ответы - сразу к первому непрочитанному
+            if (last_read is not None and last_read < last_position(thread)
+                    and not thread.is_archived
+                    and not any(arg in request.args for arg in ('after', 'before', 'last', 'n'))):
+                key = tuple_(Post.created_at, Post.id)
+                replies = select(Post.id).where(Post.thread_id == thread_id)
+                # Курсор - последний прочитанный ответ: позиция отметки раздела
+                # или удаленного ответа сама сообщением не является
+                last_seen = db.session.scalar(
+                    replies.where(key <= tuple_(*last_read)).order_by(Post.created_at.desc(), Post.id.desc()).limit(1)
+                )
+                first_unread = db.session.scalar(
+                    replies.where(key > tuple_(*last_read)).order_by(Post.created_at, Post.id).limit(1)
+                )
+                # Ни одного прочитанного ответа - первая страница и так начинается с непрочитанного
+                if last_seen is not None and first_unread is not None:
+                    return redirect(url_for('thread', thread_id=thread_id, after=last_seen,
+                                            _anchor=f'post-{first_unread}'))
+        
+        # Keyset-пагинация: курсор after/before и смещение n для нумерации;
+        # ответы архивной темы читаются из сжатого архива с теми же курсорами
+        offset = request.args.get('n', type=int)
+        page = (archived_thread_page if thread.is_archived else get_thread_page)(
+            thread, per_page,
+            after=request.args.get('after', type=int),
+            before=request.args.get('before', type=int),
+            last=request.args.get('last', type=int) == 1,
+            offset=max(offset, 0) if offset is not None else None
+        )
+        if current_user.is_authenticated:
+            seen = max(((post.created_at, post.id) for post in page.posts), default=(thread.created_at, 0))
+            if last_read is None or seen > last_read:
+                reads.mark_read(current_user.id, thread_id, seen)
         form = PostForm()
-        return render_template('forum/thread.html', thread=thread, posts=posts, form=form)
+        return render_template('forum/thread.html', thread=thread, posts=page.posts,
+                             page=page, per_page=per_page, form=form)
 
+    @app.route('/thread/<int:thread_id>/events')
+    @use_replica
+    def thread_events(thread_id):
+        # Поток событий темы (Server-Sent Events) для открытой последней страницы
+        if db.session.scalar(select(Thread.id).where(Thread.id == thread_id)) is None:
+            abort(404)
+        if events.connections >= app.config['SSE_MAX_CONNECTIONS']:
+            abort(503)
+        channel = f'thread:{thread_id}'
+        last_id = request.headers.get('Last-Event-ID', type=int)
+        heartbeat = app.config['SSE_HEARTBEAT']
+        
+        # Генератор работает после завершения запроса: соединение с базой уже
+        # возвращено в пул, клиент только ждет на своей очереди событий
+        def stream():
+            subscription = events.subscribe(channel, last_id)
+            try:
+                yield 'retry: 5000\n\n'
+                while True:
+                    event = subscription.get(heartbeat)
+                    if event is None:
+                        # Пинг держит соединение через прокси и выявляет отключившихся
+                        yield ': ping\n\n'
+                        continue
+                    yield format_event(event)
+                    if event.type == 'reload':
+                        break
+            finally:
+                events.unsubscribe(subscription)
+        
+        response = Response(stream(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
     @app.route('/thread/<int:thread_id>/reply', methods=['POST'])
     @login_required
+    @retry_on_busy
     def reply(thread_id):
-        thread = Thread.query.get_or_404(thread_id)
+        thread = Thread.query.options(joinedload(Thread.section)).get_or_404(thread_id)
         
         if thread.is_locked:
             flash('Эта тема закрыта для новых сообщений.', 'warning')
@@ -233,15 +455,43 @@ def init_routes(app):
         
         form = PostForm()
         if form.validate_on_submit():
+            if thread.is_archived:
+                # Новый ответ - в обычную таблицу, поэтому архив сначала возвращается в post
+                restore_thread(thread)
             post = Post(
                 content=form.content.data,
                 user_id=current_user.id,
                 thread_id=thread_id
             )
+            render_content(post)
             thread.updated_at = datetime.utcnow()
             db.session.add(post)
+            db.session.flush()
+            
+            # Счетчики темы, раздела и автора обновляем в той же транзакции
+            thread.post_count = Thread.post_count + 1
+            thread.last_post_id = post.id
+            thread.last_post_at = post.created_at
+            thread.section.post_count = Section.post_count + 1
+            thread.section.last_thread_id = thread.id
+            count_user_activity(current_user.id, post_count=1)
+            get_search_backend().index_post(post, thread)
+            post_id = post.id
             db.session.commit()
+            
+            # Рассылка читает базу: она идет после обработчика, вне повторов записи
+            @after_this_request
+            def publish(response):
+                try:
+                    publish_post(post_id)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Не удалось разослать сообщение %s', post_id)
+                return response
+            
             flash('Сообщение добавлено!', 'success')
+            # Новое сообщение всегда на последней странице
+            return redirect(url_for('thread', thread_id=thread_id, last=1, _anchor=f'post-{post_id}'))
         else:
             flash('Ошибка при отправке сообщения.', 'danger')
         
@@ -256,22 +506,44 @@ def init_routes(app):
             abort(403)
         
         section_id = thread.section_id
-        db.session.delete(thread)
+        title = thread.title
+        # Тема с большим числом ответов удаляется в фоне; до конца удаления она закрыта
+        thread.is_locked = True
         db.session.commit()
-        flash('Тема удалена!', 'success')
+        if delete_or_schedule('thread', thread_id, title):
+            flash('Тема удаляется. Это может занять некоторое время.', 'info')
+        else:
+            flash('Тема удалена!', 'success')
         return redirect(url_for('section', section_id=section_id))
 
     @app.route('/delete_post/<int:post_id>')
     @login_required
     def delete_post(post_id):
-        post = Post.query.get_or_404(post_id)
+        archived = Thread.query.filter_by(id=request.args.get('thread', type=int), is_archived=True).first()
+        if archived is not None:
+            # Ответ архивной темы: тема возвращается из архива в той же транзакции
+            restore_thread(archived)
+            db.session.flush()
+        post = Post.query.options(
+            joinedload(Post.thread).joinedload(Thread.section)
+        ).get_or_404(post_id)
         
         if not current_user.is_moderator and post.user_id != current_user.id:
             abort(403)
         
-        thread_id = post.thread_id
+        thread = post.thread
+        thread_id = thread.id
+        thread.post_count = Thread.post_count - 1
+        thread.section.post_count = Section.post_count - 1
+        count_user_activity(post.user_id, post_count=-1)
+        get_search_backend().remove_post(post_id)
         db.session.delete(post)
+        db.session.flush()
+        
+        if thread.last_post_id == post_id:
+            thread.update_last_post()
         db.session.commit()
+        events.publish(f'thread:{thread_id}', 'delete', {'id': post_id})
         flash('Сообщение удалено!', 'success')
         return redirect(url_for('thread', thread_id=thread_id))
     
@@ -282,7 +554,19 @@ def init_routes(app):
             abort(403)
         
         categories = Category.query.order_by(Category.order).all()
-        return render_template('admin/admin_panel.html', categories=categories)
+        return render_template('admin/admin_panel.html', categories=categories, jobs=recent_jobs())
+    
+    @app.route('/admin/jobs/<job_id>')
+    @login_required
+    def deletion_job(job_id):
+        """Ход фонового удаления (для опроса из панели администратора)"""
+        if not current_user.is_moderator:
+            abort(403)
+        
+        job = get_job(job_id)
+        if job is None:
+            abort(404)
+        return jsonify(job.to_dict())
     
     # Создание категории
     @app.route('/admin/category/new', methods=['GET', 'POST'])
@@ -382,6 +666,7 @@ def init_routes(app):
             flash('Нельзя удалить раздел, в котором есть темы!', 'danger')
             return redirect(url_for('admin_panel'))
         
+        SectionRead.query.filter_by(section_id=section.id).delete()
         db.session.delete(section)
         db.session.commit()
         flash('Раздел успешно удален!', 'success')
@@ -395,17 +680,14 @@ def init_routes(app):
             abort(403)
         
         category = Category.query.get_or_404(category_id)
+        name = category.name
         
         try:
-            # Удаляем все разделы в категории (и их темы/сообщения через каскад)
-            for section in category.sections.all():
-                db.session.delete(section)
-            
-            # Удаляем саму категорию
-            db.session.delete(category)
-            db.session.commit()
-            
-            flash(f'Категория "{category.name}" и все её разделы успешно удалены!', 'success')
+            # Разделы, темы и сообщения удаляются порциями запросами DELETE, без загрузки объектов
+            if delete_or_schedule('category', category_id, name):
+                flash(f'Категория "{name}" удаляется. Ход удаления - ниже на этой странице.', 'info')
+            else:
+                flash(f'Категория "{name}" и все её разделы успешно удалены!', 'success')
         except Exception as e:
             db.session.rollback()
             flash(f'Ошибка при удалении категории: {str(e)}', 'danger')
@@ -424,4 +706,18 @@ def init_routes(app):
 
     @app.errorhandler(403)
     def forbidden_error(error):
-        return render_template('errors/403.html'), 403
\ No newline at end of file
+        return render_template('errors/403.html'), 403
+
+    @app.errorhandler(429)
+    def too_many_requests_error(error):
+        response = make_response(render_template('errors/429.html'), 429)
+        if error.retry_after:
+            response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
+    @app.errorhandler(AuthBusy)
+    def auth_busy_error(error):
+        db.session.rollback()
+        response = make_response(render_template('errors/503.html'), 503)
+        response.headers['Retry-After'] = '5'
+        return response
\ No newline at end of file
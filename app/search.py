@@ -0,0 +1,446 @@
+import re
+import sqlite3
+from datetime import datetime
+from markupsafe import escape, Markup
+from sqlalchemy import bindparam, event, literal, null, select, text, union_all, and_, or_
+from sqlalchemy.orm import joinedload
+from app import db
+
+# Маркеры подсветки в сниппетах: заменяются на <mark> после экранирования текста
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+
+def _thread_rowid(thread_id):
+    return thread_id * 2
+
+
+def _post_rowid(post_id):
+    return post_id * 2 + 1
+
+
+class SearchResult:
+    """Найденная тема или сообщение"""
+
+    def __init__(self, kind, thread_id, post_id, user_id, created_at, snippet):
+        self.kind = kind
+        self.thread_id = thread_id
+        self.post_id = post_id
+        self.user_id = user_id
+        self.created_at = created_at
+        self.snippet = snippet
+        self.thread = None
+        self.author = None
+
+    @property
+    def snippet_html(self):
+        """Сниппет с экранированным текстом и подсветкой совпадений"""
+        html = str(escape(self.snippet or ''))
+        return Markup(html.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+class SearchBackend:
+    """Интерфейс полнотекстового поиска по темам и сообщениям.
+
+    Таблицы индекса не входят в метаданные моделей: их создает DDL бэкенда
+    вместе с db.create_all (create_index_tables) и миграция.
+    """
+
+    # Команды создания таблиц индекса (идемпотентные)
+    DDL = []
+
+    def ensure_index(self):
+        for statement in self.DDL:
+            db.session.execute(text(statement))
+
+    def index_thread(self, thread):
+        raise NotImplementedError
+
+    def index_post(self, post, thread):
+        raise NotImplementedError
+
+    def remove_post(self, post_id):
+        raise NotImplementedError
+
+    def remove_posts(self, post_ids):
+        raise NotImplementedError
+
+    def remove_thread(self, thread_id, post_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def query(self, terms, filters, limit, offset):
+        """Вернуть список SearchResult, отсортированный по релевантности"""
+        raise NotImplementedError
+
+    def search(self, terms, section_id=None, user_id=None, date_from=None, date_to=None,
+               page=1, per_page=20):
+        """Поиск с фильтрами и постраничным выводом: (результаты, есть_ли_следующая)"""
+        filters = {
+            'section_id': section_id,
+            'user_id': user_id,
+            'date_from': date_from,
+            'date_to': date_to,
+        }
+        results = self.query(terms, filters, per_page + 1, (page - 1) * per_page)
+        has_next = len(results) > per_page
+        results = results[:per_page]
+        _load_related(results)
+        return results, has_next
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Поиск на виртуальной таблице FTS5 с ранжированием bm25"""
+
+    DDL = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "title, body, kind UNINDEXED, thread_id UNINDEXED, post_id UNINDEXED, "
+        "section_id UNINDEXED, user_id UNINDEXED, created_at UNINDEXED, "
+        "tokenize='unicode61 remove_diacritics 2')",
+    ]
+
+    def _insert(self, rowid, title, body, kind, thread_id, post_id, section_id, user_id, created_at):
+        db.session.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': rowid})
+        db.session.execute(text(
+            'INSERT INTO search_index(rowid, title, body, kind, thread_id, post_id, section_id, user_id, created_at) '
+            'VALUES (:rowid, :title, :body, :kind, :thread_id, :post_id, :section_id, :user_id, :created_at)'
+        ), {
+            'rowid': rowid, 'title': title, 'body': body, 'kind': kind,
+            'thread_id': thread_id, 'post_id': post_id, 'section_id': section_id,
+            'user_id': user_id, 'created_at': _format_date(created_at)
+        })
+
+    def index_thread(self, thread):
+        self._insert(_thread_rowid(thread.id), thread.title, thread.content, 'thread',
+                     thread.id, None, thread.section_id, thread.user_id, thread.created_at)
+
+    def index_post(self, post, thread):
+        self._insert(_post_rowid(post.id), '', post.content, 'post',
+                     thread.id, post.id, thread.section_id, post.user_id, post.created_at)
+
+    def remove_post(self, post_id):
+        db.session.execute(text('DELETE FROM search_index WHERE rowid = :rowid'),
+                           {'rowid': _post_rowid(post_id)})
+
+    def remove_posts(self, post_ids):
+        if post_ids:
+            db.session.execute(text('DELETE FROM search_index WHERE rowid = :rowid'),
+                               [{'rowid': _post_rowid(post_id)} for post_id in post_ids])
+
+    def remove_thread(self, thread_id, post_ids):
+        rowids = [_thread_rowid(thread_id)] + [_post_rowid(post_id) for post_id in post_ids]
+        for start in range(0, len(rowids), 500):
+            db.session.execute(text('DELETE FROM search_index WHERE rowid = :rowid'),
+                               [{'rowid': rowid} for rowid in rowids[start:start + 500]])
+
+    def clear(self):
+        db.session.execute(text('DELETE FROM search_index'))
+
+    def query(self, terms, filters, limit, offset):
+        match = _fts_match(terms)
+        if not match:
+            return []
+
+        conditions = ['search_index MATCH :match']
+        params = {'match': match, 'limit': limit, 'offset': offset,
+                  'start': HIGHLIGHT_START, 'end': HIGHLIGHT_END}
+        if filters['section_id']:
+            conditions.append('section_id = :section_id')
+            params['section_id'] = filters['section_id']
+        if filters['user_id']:
+            conditions.append('user_id = :user_id')
+            params['user_id'] = filters['user_id']
+        if filters['date_from']:
+            conditions.append('created_at >= :date_from')
+            params['date_from'] = _format_date(filters['date_from'])
+        if filters['date_to']:
+            conditions.append('created_at < :date_to')
+            params['date_to'] = _format_date(filters['date_to'])
+
+        # Совпадение в заголовке весит больше совпадения в тексте
+        rows = db.session.execute(text(
+            "SELECT kind, thread_id, post_id, user_id, created_at, "
+            "snippet(search_index, -1, :start, :end, '…', 16) AS snippet "
+            "FROM search_index WHERE " + ' AND '.join(conditions) +
+            " ORDER BY bm25(search_index, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+        ), params).all()
+        return [SearchResult(row.kind, int(row.thread_id), row.post_id and int(row.post_id),
+                             int(row.user_id), _parse_date(row.created_at), row.snippet)
+                for row in rows]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Поиск на tsvector с GIN-индексом (PostgreSQL)"""
+
+    ts_config = 'russian'
+
+    DDL = [
+        'CREATE TABLE IF NOT EXISTS search_document ('
+        'id BIGINT PRIMARY KEY, kind VARCHAR(10) NOT NULL, thread_id INTEGER NOT NULL, '
+        'post_id INTEGER, section_id INTEGER NOT NULL, user_id INTEGER NOT NULL, '
+        'created_at TIMESTAMP, title TEXT, body TEXT, document TSVECTOR NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_search_document ON search_document USING GIN (document)',
+        'CREATE INDEX IF NOT EXISTS ix_search_document_thread ON search_document (thread_id)',
+    ]
+
+    def _upsert(self, rowid, title, body, kind, thread_id, post_id, section_id, user_id, created_at):
+        db.session.execute(text(
+            'INSERT INTO search_document '
+            '(id, kind, thread_id, post_id, section_id, user_id, created_at, title, body, document) '
+            'VALUES (:id, :kind, :thread_id, :post_id, :section_id, :user_id, :created_at, :title, :body, '
+            "setweight(to_tsvector(CAST(:config AS regconfig), :title), 'A') || "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :body), 'D')) "
+            'ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body, '
+            'document = EXCLUDED.document'
+        ), {
+            'id': rowid, 'kind': kind, 'thread_id': thread_id, 'post_id': post_id,
+            'section_id': section_id, 'user_id': user_id, 'created_at': created_at,
+            'title': title, 'body': body, 'config': self.ts_config
+        })
+
+    def index_thread(self, thread):
+        self._upsert(_thread_rowid(thread.id), thread.title, thread.content, 'thread',
+                     thread.id, None, thread.section_id, thread.user_id, thread.created_at)
+
+    def index_post(self, post, thread):
+        self._upsert(_post_rowid(post.id), '', post.content, 'post',
+                     thread.id, post.id, thread.section_id, post.user_id, post.created_at)
+
+    def remove_post(self, post_id):
+        db.session.execute(text('DELETE FROM search_document WHERE id = :id'),
+                           {'id': _post_rowid(post_id)})
+
+    def remove_posts(self, post_ids):
+        if post_ids:
+            db.session.execute(text('DELETE FROM search_document WHERE id IN :ids')
+                               .bindparams(bindparam('ids', expanding=True)),
+                               {'ids': [_post_rowid(post_id) for post_id in post_ids]})
+
+    def remove_thread(self, thread_id, post_ids):
+        db.session.execute(text('DELETE FROM search_document WHERE thread_id = :thread_id'),
+                           {'thread_id': thread_id})
+
+    def clear(self):
+        db.session.execute(text('TRUNCATE search_document'))
+
+    def query(self, terms, filters, limit, offset):
+        if not terms.strip():
+            return []
+
+        conditions = ['document @@ query']
+        params = {'terms': terms, 'config': self.ts_config, 'limit': limit, 'offset': offset,
+                  'options': f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=30, MinWords=10'}
+        if filters['section_id']:
+            conditions.append('section_id = :section_id')
+            params['section_id'] = filters['section_id']
+        if filters['user_id']:
+            conditions.append('user_id = :user_id')
+            params['user_id'] = filters['user_id']
+        if filters['date_from']:
+            conditions.append('created_at >= :date_from')
+            params['date_from'] = filters['date_from']
+        if filters['date_to']:
+            conditions.append('created_at < :date_to')
+            params['date_to'] = filters['date_to']
+
+        rows = db.session.execute(text(
+            'SELECT kind, thread_id, post_id, user_id, created_at, '
+            "ts_headline(CAST(:config AS regconfig), coalesce(title, '') || ' ' || body, query, :options) AS snippet "
+            'FROM search_document, websearch_to_tsquery(CAST(:config AS regconfig), :terms) AS query '
+            'WHERE ' + ' AND '.join(conditions) +
+            ' ORDER BY ts_rank(document, query) DESC LIMIT :limit OFFSET :offset'
+        ), params).all()
+        return [SearchResult(row.kind, row.thread_id, row.post_id, row.user_id,
+                             row.created_at, row.snippet)
+                for row in rows]
+
+
+class LikeSearchBackend(SearchBackend):
+    """Запасной поиск LIKE по самим таблицам тем и сообщений.
+
+    Для SQLite без FTS5 и других СУБД: индекса нет (методы индексации ничего
+    не делают), ранжирования тоже - новые записи выше; ответы архивных тем
+    не находятся, а в SQLite регистр не учитывается только для латиницы.
+    """
+
+    def index_thread(self, thread):
+        pass
+
+    def index_post(self, post, thread):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def remove_posts(self, post_ids):
+        pass
+
+    def remove_thread(self, thread_id, post_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def query(self, terms, filters, limit, offset):
+        from app.models import Thread, Post
+
+        words = terms.split()
+        if not words:
+            return []
+
+        def matches(*columns):
+            # Каждое слово - хотя бы в одном из столбцов
+            return and_(*(or_(*(column.ilike(f'%{_escape_like(word)}%', escape='\\') for column in columns))
+                          for word in words))
+
+        def filtered(query, model):
+            if filters['section_id']:
+                query = query.where(Thread.section_id == filters['section_id'])
+            if filters['user_id']:
+                query = query.where(model.user_id == filters['user_id'])
+            if filters['date_from']:
+                query = query.where(model.created_at >= filters['date_from'])
+            if filters['date_to']:
+                query = query.where(model.created_at < filters['date_to'])
+            return query
+
+        threads = filtered(select(
+            literal('thread').label('kind'), Thread.id.label('thread_id'), null().label('post_id'),
+            Thread.user_id.label('user_id'), Thread.created_at.label('created_at'),
+            Thread.title.label('title'), Thread.content.label('body')
+        ).where(matches(Thread.title, Thread.content)), Thread)
+        posts = filtered(select(
+            literal('post'), Post.thread_id, Post.id, Post.user_id, Post.created_at, literal(''), Post.content
+        ).join(Thread, Thread.id == Post.thread_id).where(matches(Post.content)), Post)
+
+        found = union_all(threads, posts).subquery()
+        rows = db.session.execute(
+            select(found).order_by(found.c.created_at.desc()).limit(limit).offset(offset)
+        ).all()
+        return [SearchResult(row.kind, row.thread_id, row.post_id, row.user_id, row.created_at,
+                             _snippet(f'{row.title} {row.body}'.strip(), words))
+                for row in rows]
+
+
+# Собран ли SQLite с FTS5 (зависит от библиотеки, а не от базы)
+SQLITE_FTS5 = bool(sqlite3.connect(':memory:').execute(
+    "SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0])
+
+
+def backend_for(dialect):
+    """Реализация поиска для диалекта базы"""
+    if dialect.name == 'postgresql':
+        return PostgresSearchBackend()
+    if dialect.name == 'sqlite' and SQLITE_FTS5:
+        return SQLiteSearchBackend()
+    return LikeSearchBackend()
+
+
+def get_search_backend():
+    """Выбрать реализацию поиска для подключенной базы"""
+    return backend_for(db.engine.dialect)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_index_tables(metadata, connection, **kw):
+    """Создать таблицы поискового индекса вместе с таблицами моделей (db.create_all)"""
+    for statement in backend_for(connection.dialect).DDL:
+        connection.exec_driver_sql(statement)
+
+
+def reindex_all(batch_size=1000):
+    """Перестроить поисковый индекс пакетами, не загружая все записи в память"""
+    from app.models import Thread, Post
+
+    backend = get_search_backend()
+    # Базы, созданные до появления поиска, получают таблицы индекса здесь
+    backend.ensure_index()
+    backend.clear()
+    total = 0
+
+    last_id = 0
+    while True:
+        threads = Thread.query.filter(Thread.id > last_id).order_by(Thread.id).limit(batch_size).all()
+        if not threads:
+            break
+        for thread in threads:
+            backend.index_thread(thread)
+        last_id = threads[-1].id
+        total += len(threads)
+        db.session.commit()
+        db.session.expunge_all()
+
+    last_id = 0
+    while True:
+        posts = Post.query.options(joinedload(Post.thread)).filter(Post.id > last_id) \
+            .order_by(Post.id).limit(batch_size).all()
+        if not posts:
+            break
+        for post in posts:
+            backend.index_post(post, post.thread)
+        last_id = posts[-1].id
+        total += len(posts)
+        db.session.commit()
+        db.session.expunge_all()
+
+    # Ответы архивных тем - из их сжатых архивов
+    from app.archive import archive_batches, unpack_posts
+    for archives in archive_batches(max(batch_size // 100, 1)):
+        threads = {thread.id: thread for thread in
+                   Thread.query.filter(Thread.id.in_([archive.thread_id for archive in archives]))}
+        for archive in archives:
+            for post in unpack_posts(archive):
+                backend.index_post(post, threads[archive.thread_id])
+                total += 1
+        db.session.commit()
+        db.session.expunge_all()
+
+    return total
+
+
+def _fts_match(terms):
+    """Превратить ввод пользователя в безопасное выражение FTS5 (все слова, префиксный поиск)"""
+    words = [word.replace('"', '""') for word in terms.split()]
+    return ' '.join(f'"{word}"*' for word in words if word)
+
+
+def _escape_like(word):
+    return word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _snippet(text, words, width=160):
+    """Фрагмент текста у первого совпадения с маркерами подсветки"""
+    pattern = re.compile('|'.join(re.escape(word) for word in words), re.I)
+    match = pattern.search(text)
+    start = max(match.start() - width // 4, 0) if match else 0
+    fragment = pattern.sub(lambda m: HIGHLIGHT_START + m.group(0) + HIGHLIGHT_END, text[start:start + width])
+    return ('…' if start else '') + fragment + ('…' if start + width < len(text) else '')
+
+
+def _format_date(value):
+    if value is None:
+        return None
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+
+
+def _load_related(results):
+    """Пакетно загрузить темы и авторов для найденных записей"""
+    from app.models import Thread, User
+
+    thread_ids = {result.thread_id for result in results}
+    user_ids = {result.user_id for result in results}
+    threads = {thread.id: thread for thread in
+               Thread.query.options(joinedload(Thread.section)).filter(Thread.id.in_(thread_ids))} \
+        if thread_ids else {}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+    for result in results:
+        result.thread = threads.get(result.thread_id)
+        result.author = users.get(result.user_id)
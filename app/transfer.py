@@ -0,0 +1,214 @@
+import base64
+import gzip
+import json
+import sys
+from datetime import datetime
+from sqlalchemy import select, text, DateTime, LargeBinary
+from app import db
+from app.models import User, Category, Section, Thread, Post, ThreadArchive, ThreadRead, SectionRead
+
+# Версия формата выгрузки. Файл - NDJSON: заголовок, затем для каждой таблицы
+# строка {"table": ..., "columns": [...]} и ее строки массивами значений
+# в порядке первичного ключа, в конце {"end": true, "rows": {...}}
+EXPORT_FORMAT = 1
+
+# Таблицы в порядке загрузки (сначала те, на которые ссылаются). Горячие темы,
+# события SSE и поисковый индекс не переносятся: они строятся заново
+TABLES = [Category.__table__, User.__table__, Section.__table__, Thread.__table__, Post.__table__,
+          ThreadArchive.__table__, ThreadRead.__table__, SectionRead.__table__]
+
+RESUME_HINT = 'загруженные строки сохранены, полный файл можно догрузить с --resume'
+
+
+def open_dump(path, mode):
+    """Файл выгрузки для чтения ('r') или записи ('w'): .gz - со сжатием, '-' - stdin/stdout"""
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    return open(path, mode, encoding='utf-8')
+
+
+def _batch_size(table, batch_size):
+    # Строки архивов весят сотни килобайт: их пачки меньше, как в reindex_all
+    if any(isinstance(column.type, LargeBinary) for column in table.columns):
+        return max(batch_size // 100, 1)
+    return batch_size
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f'Значение {type(value).__name__} не переносится в выгрузку')
+
+
+def _write_line(out, value):
+    out.write(json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_encode))
+    out.write('\n')
+
+
+def _decoder(column):
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column.type, LargeBinary):
+        return base64.b64decode
+    return None
+
+
+def _snapshot():
+    """Читать все таблицы в одной транзакции-снимке: счетчики согласованы со строками"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+    elif dialect == 'sqlite':
+        # pysqlite сам не открывает транзакцию для SELECT
+        db.session.connection().exec_driver_sql('BEGIN')
+
+
+def export_forum(out, batch_size=1000, progress=None):
+    """Выгрузить таблицы форума в out, не загружая их в память.
+
+    Строки читаются курсором порциями (yield_per) и сразу пишутся.
+    Возвращает {таблица: строк}.
+    """
+    counts = {}
+    _snapshot()
+    try:
+        _write_line(out, {'format': 'forum', 'version': EXPORT_FORMAT, 'exported_at': datetime.utcnow()})
+        for table in TABLES:
+            _write_line(out, {'table': table.name, 'columns': [column.name for column in table.columns]})
+            result = db.session.execute(
+                select(table).order_by(*table.primary_key.columns),
+                execution_options={'yield_per': _batch_size(table, batch_size)}
+            )
+            count = 0
+            for rows in result.partitions():
+                for row in rows:
+                    _write_line(out, list(row))
+                count += len(rows)
+                if progress is not None:
+                    progress(table.name, count)
+            counts[table.name] = count
+        _write_line(out, {'end': True, 'rows': counts})
+    finally:
+        db.session.rollback()
+    return counts
+
+
+def _last_key(table):
+    """Наибольший первичный ключ таблицы (кортежем) или None для пустой"""
+    key = table.primary_key.columns
+    return db.session.execute(select(*key).order_by(*(column.desc() for column in key)).limit(1)).first()
+
+
+class _TableLoader:
+    """Пачка строк одной таблицы выгрузки: вставка executemany по транзакции на пачку"""
+
+    def __init__(self, table, columns, batch_size, resume):
+        unknown = [name for name in columns if name not in table.c]
+        if unknown:
+            raise ValueError(f'В таблице {table.name} нет столбцов {", ".join(unknown)}: обновите схему базы')
+        self.table = table
+        self.columns = columns
+        self.decoders = [(position, decoder) for position, decoder in
+                         enumerate(_decoder(table.c[name]) for name in columns) if decoder is not None]
+        self.key_positions = [columns.index(column.name) for column in table.primary_key.columns]
+        # Пачки коммитятся по порядку ключа: все до наибольшего ключа в базе уже загружено
+        self.last_key = tuple(_last_key(table) or ()) if resume else ()
+        self.batch_size = _batch_size(table, batch_size)
+        self.batch = []
+        self.inserted = 0
+        self.skipped = 0
+
+    def add(self, values):
+        if self.last_key and tuple(values[position] for position in self.key_positions) <= self.last_key:
+            self.skipped += 1
+            return False
+        for position, decoder in self.decoders:
+            if values[position] is not None:
+                values[position] = decoder(values[position])
+        self.batch.append(dict(zip(self.columns, values)))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if self.batch:
+            db.session.execute(self.table.insert(), self.batch)
+            db.session.commit()
+            self.inserted += len(self.batch)
+            self.batch = []
+
+
+def _reset_sequences():
+    # id вставлялись явно - сдвигаем последовательности PostgreSQL
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in TABLES:
+        if 'id' in table.primary_key.columns:
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                f'(SELECT COALESCE(MAX(id), 1) FROM "{table.name}"))'
+            ))
+    db.session.commit()
+
+
+def import_forum(lines, batch_size=1000, resume=False, progress=None):
+    """Загрузить выгрузку export_forum в пустую базу построчно.
+
+    Каждая пачка - своя транзакция, поэтому прерванную загрузку можно
+    продолжить с тем же файлом (resume): строки с ключом не больше уже
+    загруженного пропускаются. Возвращает {таблица: (вставлено, пропущено)}.
+    """
+    if not resume:
+        filled = [table.name for table in TABLES
+                  if db.session.execute(select(1).select_from(table).limit(1)).first()]
+        db.session.rollback()
+        if filled:
+            raise ValueError(f'База не пуста (таблицы {", ".join(filled)}); продолжить загрузку - --resume')
+
+    lines = iter(lines)
+    try:
+        header = json.loads(next(lines, 'null'))
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != 'forum':
+        raise ValueError('Это не выгрузка форума')
+    if header.get('version') != EXPORT_FORMAT:
+        raise ValueError(f'Неизвестная версия выгрузки: {header.get("version")}')
+
+    tables = {table.name: table for table in TABLES}
+    results = {}
+    loader = None
+    finished = False
+    for number, line in enumerate(lines, 2):
+        try:
+            value = json.loads(line)
+        except ValueError:
+            raise ValueError(f'Строка {number} выгрузки повреждена: {RESUME_HINT}') from None
+        if isinstance(value, list):
+            if loader is None:
+                raise ValueError('Строка данных до заголовка таблицы')
+            if loader.add(value) and progress is not None:
+                progress(loader.table.name, loader.inserted)
+            continue
+        if loader is not None:
+            loader.flush()
+            results[loader.table.name] = (loader.inserted, loader.skipped)
+            loader = None
+        if value.get('end'):
+            finished = True
+            break
+        if value.get('table') not in tables:
+            raise ValueError(f'Неизвестная таблица в выгрузке: {value.get("table")}')
+        loader = _TableLoader(tables[value['table']], value['columns'], batch_size, resume)
+    if loader is not None:
+        loader.flush()
+        results[loader.table.name] = (loader.inserted, loader.skipped)
+    if not finished:
+        raise ValueError(f'Выгрузка оборвана: {RESUME_HINT}')
+    _reset_sequences()
+    return results
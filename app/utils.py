@@ -1,65 +1,402 @@
+import hashlib
 import os
+import random
+import re
 import secrets
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from io import BytesIO
 from flask import current_app, url_for
-from PIL import Image
+from PIL import Image, ImageOps
+from sqlalchemy import event, select, tuple_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, selectinload, load_only
 
-def save_avatar(image_file):
+AVATAR_FORMATS = ('jpg', 'webp')
+
+# Пул обработки аватарок: ограниченное число потоков и мест в очереди
+_avatar_executor = None
+_avatar_slots = None
+_avatar_lock = threading.Lock()
+# Запись и удаление файлов аватарок в процессе не пересекаются
+_storage_lock = threading.Lock()
+
+def _get_avatar_executor(app):
+    global _avatar_executor, _avatar_slots
+    with _avatar_lock:
+        if _avatar_executor is None:
+            _avatar_executor = ThreadPoolExecutor(max_workers=app.config['AVATAR_WORKERS'],
+                                                  thread_name_prefix='avatar')
+            _avatar_slots = threading.BoundedSemaphore(app.config['AVATAR_QUEUE_SIZE'])
+    return _avatar_executor, _avatar_slots
+
+def save_avatar(image_file, user_id):
+    """Поставить загруженную аватарку в очередь на обработку.
+    
+    Декодирование и масштабирование выполняются вне запроса; аватарка
+    пользователя меняется, когда все размеры готовы. Возвращает False,
+    если файл пустой или очередь переполнена.
+    """
     if not image_file or not image_file.filename:
-        return None
+        return False
     
+    data = image_file.read()
+    if not data:
+        return False
+    
+    app = current_app._get_current_object()
+    executor, slots = _get_avatar_executor(app)
+    if not slots.acquire(blocking=False):
+        app.logger.warning('Очередь обработки аватарок переполнена, загрузка отклонена')
+        return False
+    
+    future = executor.submit(_process_avatar, app, data, user_id)
+    future.add_done_callback(lambda f: slots.release())
+    return True
+
+def _process_avatar(app, data, user_id):
+    from app import db
+    from app.models import User
+    
+    with app.app_context():
+        # Имя файла - хеш содержимого: одинаковые загрузки хранятся один раз
+        name = hashlib.sha256(data).hexdigest()
+        written = []
+        try:
+            with _storage_lock:
+                written = write_avatar_variants(data, name)
+                user = db.session.get(User, user_id)
+                if user is None:
+                    raise LookupError(f'пользователь {user_id} не найден')
+                old_avatar = user.avatar
+                user.avatar = name
+                db.session.commit()
+            if old_avatar != name:
+                delete_old_avatar(old_avatar)
+            app.logger.info('Аватарка пользователя %s обновлена: %s', user_id, name)
+        except Exception:
+            db.session.rollback()
+            for path in written:
+                if os.path.exists(path):
+                    os.remove(path)
+            app.logger.exception('Ошибка обработки аватарки пользователя %s', user_id)
+        finally:
+            db.session.remove()
+
+def write_avatar_variants(data, name):
+    """Сохранить все размеры аватарки в JPEG и WebP, вернуть пути созданных файлов.
+    
+    Если такая аватарка уже есть (та же картинка у другого пользователя),
+    файлы не пересоздаются, а только обновляется время изменения, чтобы
+    сборщик мусора не удалил их.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    paths = {filename: os.path.join(upload_folder, filename) for filename in _avatar_files(name)}
+    if all(os.path.exists(path) for path in paths.values()):
+        for path in paths.values():
+            os.utime(path)
+        return []
+    
+    image = Image.open(BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    written = []
     try:
-        # Генерируем случайное имя файла
-        random_hex = secrets.token_hex(8)
-        _, file_extension = os.path.splitext(image_file.filename)
-        picture_filename = random_hex + file_extension.lower()
-        
-        # Получаем путь для сохранения из конфига (корневая папка)
+        for size in current_app.config['AVATAR_SIZES']:
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            for fmt in AVATAR_FORMATS:
+                path = paths[_avatar_file(name, size, fmt)]
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Запись через временный файл: по имени никогда не отдается недописанный файл
+                tmp_path = f'{path}.{secrets.token_hex(4)}.tmp'
+                variant.save(tmp_path, 'JPEG' if fmt == 'jpg' else 'WEBP', quality=85)
+                os.replace(tmp_path, path)
+                written.append(path)
+    except Exception:
+        for path in written:
+            os.remove(path)
+        raise
+    return written
+
+def is_hashed_avatar(avatar):
+    return len(avatar) == 64 and '.' not in avatar
+
+def _avatar_file(avatar, size, fmt):
+    """Путь варианта относительно UPLOAD_FOLDER: ab/cd/<хеш>_<размер>.<формат>"""
+    if is_hashed_avatar(avatar):
+        return f'{avatar[:2]}/{avatar[2:4]}/{avatar}_{size}.{fmt}'
+    return f'{avatar}_{size}.{fmt}'
+
+def _avatar_files(avatar):
+    """Файлы аватарки: старые аватарки - один файл, новые - набор размеров"""
+    if '.' in avatar:
+        return [avatar]
+    return [_avatar_file(avatar, size, fmt)
+            for size in current_app.config['AVATAR_SIZES'] for fmt in AVATAR_FORMATS]
+
+def delete_old_avatar(old_avatar):
+    """Удалить файлы аватарки, если на нее больше не ссылается ни один пользователь"""
+    from app.models import User
+    
+    if not old_avatar or old_avatar == 'default.png':
+        return
+    with _storage_lock:
+        if User.query.filter_by(avatar=old_avatar).count() > 0:
+            return
         upload_folder = current_app.config['UPLOAD_FOLDER']
-        
-        # Убеждаемся, что папка существует
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        picture_path = os.path.join(upload_folder, picture_filename)
-        
-        # Обрабатываем изображение
-        output_size = (150, 150)
-        i = Image.open(image_file)
-        
-        if i.mode in ('RGBA', 'LA', 'P'):
-            i = i.convert('RGB')
-        
-        i.thumbnail(output_size, Image.Resampling.LANCZOS)
-        i.save(picture_path, quality=85)
-        
-        print(f"✅ Аватар сохранен в: {picture_path}")
-        return picture_filename
+        for filename in _avatar_files(old_avatar):
+            try:
+                path = os.path.join(upload_folder, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                current_app.logger.exception('Ошибка при удалении старой аватарки %s', filename)
+
+def collect_avatar_garbage(grace_seconds=3600, dry_run=False):
+    """Удалить файлы аватарок, на которые не ссылается ни один пользователь.
+    
+    Файлы моложе grace_seconds не трогаем: их может прямо сейчас
+    записывать фоновая обработка. Возвращает список удаленных путей.
+    """
+    from app import db
+    from app.models import User
     
-    except Exception as e:
-        print(f"❌ Ошибка при сохранении аватарки: {e}")
-        return None
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    referenced = {'default.png'}
+    for (avatar,) in db.session.query(User.avatar).distinct():
+        if avatar:
+            referenced.update(_avatar_files(avatar))
+    
+    removed = []
+    now = time.time()
+    for root, dirs, files in os.walk(upload_folder, topdown=False):
+        for filename in files:
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, upload_folder).replace(os.sep, '/')
+            if relative in referenced or now - os.path.getmtime(path) < grace_seconds:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed.append(relative)
+        if root != upload_folder and not dry_run and not os.listdir(root):
+            os.rmdir(root)
+    return removed
 
-def delete_old_avatar(old_avatar):
-    if old_avatar and old_avatar != 'default.png':
-        try:
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            old_avatar_path = os.path.join(upload_folder, old_avatar)
-            if os.path.exists(old_avatar_path):
-                os.remove(old_avatar_path)
-                print(f"✅ Старая аватарка удалена: {old_avatar_path}")
-        except Exception as e:
-            print(f"❌ Ошибка при удалении старой аватарки: {e}")
-
-def get_avatar_url(filename):
-    """Получить URL для отображения аватарки из КОРНЕВОЙ папки"""
-    if not filename or filename == 'default.png':
+def get_avatar_url(filename, size=None, fmt='jpg'):
+    """Получить URL аватарки нужного размера (наименьший вариант не меньше size)"""
+    if not filename:
         filename = 'default.png'
     
-    # Всегда используем путь к корневой папке static/avatars/
-    return url_for('static', filename=f'avatars/{filename}')
+    # Старые аватарки и аватарка по умолчанию хранятся одним файлом
+    if '.' in filename:
+        return url_for('avatar_file', filename=filename)
+    
+    sizes = current_app.config['AVATAR_SIZES']
+    size = min((s for s in sizes if s >= (size or 0)), default=max(sizes))
+    return url_for('avatar_file', filename=_avatar_file(filename, size, fmt))
+
+def avatar_srcset(filename, fmt='jpg'):
+    """srcset со всеми размерами аватарки (для старых аватарок - пустой)"""
+    if not filename or '.' in filename:
+        return ''
+    return ', '.join(f'{get_avatar_url(filename, size, fmt)} {size}w'
+                     for size in current_app.config['AVATAR_SIZES'])
+
+def retry_on_busy(view):
+    """Повторить обработчик записи, если база занята другим писателем.
+    
+    В SQLite транзакция, начатая чтением, не может стать пишущей, если
+    другой процесс уже записал данные: ожидание busy_timeout тут не поможет,
+    транзакцию нужно начать заново. Обработчик должен менять данные только
+    через сессию и вызывать flash после commit.
+    
+    После успешного commit повтора нет: запись уже сделана, и новый проход
+    обработчика продублировал бы ее. Работу после commit (рассылку событий)
+    обработчик откладывает в after_this_request.
+    """
+    if not event.contains(Session, 'after_commit', _count_commit):
+        event.listen(Session, 'after_commit', _count_commit)
+    
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from app import db
+        
+        retries = current_app.config['DB_WRITE_RETRIES']
+        for attempt in range(retries + 1):
+            commits = db.session.info.get('commits', 0)
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                message = str(e.orig)
+                if (attempt == retries or db.session.info.get('commits', 0) != commits
+                        or ('locked' not in message and 'busy' not in message)):
+                    raise
+                current_app.logger.warning('База занята, повтор %s: %s', attempt + 1, message)
+                time.sleep(current_app.config['DB_RETRY_DELAY'] * 2 ** attempt * (0.5 + random.random()))
+    return wrapper
+
+def _count_commit(session):
+    session.info['commits'] = session.info.get('commits', 0) + 1
 
 def allowed_file(filename):
     if not filename:
         return False
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
\ No newline at end of file
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+class PostPage:
+    """Страница ответов темы (keyset-пагинация по (created_at, id))"""
+    
+    def __init__(self, posts, offset, has_prev, has_next):
+        self.posts = posts
+        # Сколько ответов темы стоит перед первым сообщением страницы
+        self.offset = offset
+        self.has_prev = has_prev
+        self.has_next = has_next
+    
+    @property
+    def is_first(self):
+        return not self.has_prev
+    
+    def prev_args(self, per_page):
+        return {'before': self.posts[0].id, 'n': max(self.offset - per_page, 0)}
+    
+    def next_args(self):
+        return {'after': self.posts[-1].id, 'n': self.offset + len(self.posts)}
+
+
+def get_thread_page(thread, per_page, after=None, before=None, last=False, offset=None):
+    """Получить страницу ответов темы без OFFSET.
+    
+    Курсор - id сообщения, после (after) или до (before) которого начинается
+    страница. Выборка идет по индексу (thread_id, created_at, id), поэтому
+    стоимость не зависит от глубины страницы. Смещение (offset) передается
+    в ссылках, чтобы нумерация сообщений не требовала подсчета.
+    """
+    from app.models import Post
+    
+    # Авторы сообщений страницы загружаются одним пакетным запросом
+    query = Post.query.options(selectinload(Post.author)).filter(Post.thread_id == thread.id)
+    key = tuple_(Post.created_at, Post.id)
+    newest_first = (Post.created_at.desc(), Post.id.desc())
+    
+    anchor = None
+    if after or before:
+        anchor = query.filter(Post.id == (after or before)).first()
+    
+    if last or (anchor is not None and before):
+        if not last:
+            query = query.filter(key < tuple_(anchor.created_at, anchor.id))
+        posts = query.order_by(*newest_first).limit(per_page + 1).all()
+        if not posts and not last:
+            # До первого ответа ничего нет - показывается первая страница
+            return get_thread_page(thread, per_page)
+        has_prev = len(posts) > per_page
+        posts = posts[:per_page][::-1]
+        if last:
+            offset = max(thread.post_count - len(posts), 0)
+        elif not has_prev:
+            offset = 0
+        elif offset is None:
+            offset = _count_posts_before(thread, posts[0])
+        return PostPage(posts, offset, has_prev, not last)
+    
+    if anchor is not None:
+        query = query.filter(key > tuple_(anchor.created_at, anchor.id))
+    posts = query.order_by(Post.created_at.asc(), Post.id.asc()).limit(per_page + 1).all()
+    if not posts and anchor is not None:
+        # После последнего ответа ничего нет - показывается последняя страница
+        return get_thread_page(thread, per_page, last=True)
+    has_next = len(posts) > per_page
+    posts = posts[:per_page]
+    if anchor is None:
+        offset = 0
+    elif offset is None:
+        offset = _count_posts_before(thread, anchor) + 1
+    return PostPage(posts, offset, anchor is not None, has_next)
+
+
+def _count_posts_before(thread, post):
+    """Смещение для прямой ссылки без параметра n (считается по индексу)"""
+    from app.models import Post
+    return Post.query.filter(
+        Post.thread_id == thread.id,
+        tuple_(Post.created_at, Post.id) < tuple_(post.created_at, post.id)
+    ).count()
+
+
+
+# Запись ленты активности: kind - 'thread' или 'post', item - объект Thread или Post
+Activity = namedtuple('Activity', 'kind created_at item')
+
+# При равном времени тема идет в ленте перед ответом
+ACTIVITY_RANK = {'thread': 1, 'post': 0}
+
+
+class ActivityPage:
+    """Страница ленты активности пользователя (темы и ответы вперемешку, новые сверху)"""
+    
+    def __init__(self, entries, has_next):
+        self.entries = entries
+        self.has_next = has_next
+    
+    def next_args(self):
+        last = self.entries[-1]
+        return {'before': f'{last.kind[0]}{last.item.id}'}
+
+
+def _activity_before(model, rank, anchor):
+    """Условие «раньше якоря» в порядке (created_at, вид, id)"""
+    created_at, anchor_rank, anchor_id = anchor
+    if rank < anchor_rank:
+        return model.created_at <= created_at
+    if rank > anchor_rank:
+        return model.created_at < created_at
+    return tuple_(model.created_at, model.id) < tuple_(created_at, anchor_id)
+
+
+def get_activity_page(user_id, per_page, before=None):
+    """Получить страницу ленты активности без OFFSET и без COUNT.
+    
+    Курсор before - 't<id>' или 'p<id>' последней записи прошлой страницы.
+    Темы и ответы выбираются двумя запросами по индексам (user_id, created_at),
+    каждый не больше per_page + 1 строк, и сливаются по времени, поэтому
+    стоимость не зависит от числа сообщений пользователя. Названия тем для
+    ответов и разделы тем загружаются пакетно.
+    """
+    from app import db
+    from app.models import Thread, Post
+    
+    kinds = {'t': ('thread', Thread), 'p': ('post', Post)}
+    anchor = None
+    match = re.fullmatch(r'([tp])(\d+)', before or '')
+    if match:
+        kind, model = kinds[match.group(1)]
+        created_at = db.session.scalar(
+            select(model.created_at).where(model.id == int(match.group(2)), model.user_id == user_id)
+        )
+        if created_at is not None:
+            anchor = (created_at, ACTIVITY_RANK[kind], int(match.group(2)))
+    
+    threads = Thread.query.options(selectinload(Thread.section)).filter(Thread.user_id == user_id)
+    posts = Post.query.options(selectinload(Post.thread).options(load_only(Thread.id, Thread.title))) \
+        .filter(Post.user_id == user_id)
+    if anchor is not None:
+        threads = threads.filter(_activity_before(Thread, ACTIVITY_RANK['thread'], anchor))
+        posts = posts.filter(_activity_before(Post, ACTIVITY_RANK['post'], anchor))
+    
+    entries = [Activity('thread', thread.created_at, thread) for thread in
+               threads.order_by(Thread.created_at.desc(), Thread.id.desc()).limit(per_page + 1)]
+    entries += [Activity('post', post.created_at, post) for post in
+                posts.order_by(Post.created_at.desc(), Post.id.desc()).limit(per_page + 1)]
+    entries.sort(key=lambda entry: (entry.created_at, ACTIVITY_RANK[entry.kind], entry.item.id), reverse=True)
+    return ActivityPage(entries[:per_page], len(entries) > per_page)
\ No newline at end of file
@@ -0,0 +1,291 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event, select, func
+from sqlalchemy.engine import Engine
+from app import create_app, db, CONFIGS
+from app.routes import init_routes
+from app.models import User, Section, Thread, Post
+
+SORTS = ('updated_at_desc', 'updated_at_asc', 'title_asc', 'title_desc', 'post_count_desc')
+
+# Число SQL-запросов текущего запроса (тестовый клиент выполняет запросы в этом же потоке)
+_query_count = 0
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    global _query_count
+    _query_count += 1
+
+
+def benchmark_config(name):
+    class BenchmarkConfig(CONFIGS[name]):
+        # Формы отправляются без CSRF-токена, вход - чаще, чем разрешено пользователям
+        WTF_CSRF_ENABLED = False
+        AUTH_RATE_LIMIT_ENABLED = False
+    return BenchmarkConfig
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль с линейной интерполяцией по отсортированному списку"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(durations, queries, errors):
+    values = sorted(durations)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.fmean(values) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+        'queries_per_request': round(statistics.fmean(queries), 2),
+    }
+
+
+def measure(name, send, iterations, warmup, expected=(200,)):
+    """Выполнить сценарий warmup + iterations раз и посчитать статистику"""
+    global _query_count
+    durations, queries, errors = [], [], 0
+    for i in range(warmup + iterations):
+        _query_count = 0
+        started = time.perf_counter()
+        response = send()
+        elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        durations.append(elapsed)
+        queries.append(_query_count)
+        if response.status_code not in expected:
+            errors += 1
+    result = summarize(durations, queries, errors)
+    print(f"{name:<28} p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  "
+          f"p99 {result['p99_ms']:>8.2f} мс  запросов {result['queries_per_request']:>6.1f}"
+          + (f'  ошибок {errors}' if errors else ''))
+    return result
+
+
+def logged_in_client(app, username, password):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        sys.exit(f'Не удалось войти как {username}')
+    return client
+
+
+def clear_flashes(client):
+    """Не копить сообщения flash в cookie сессии между итерациями"""
+    with client.session_transaction() as session:
+        session.pop('_flashes', None)
+
+
+def concurrent_replies(app, username, password, thread_id, workers, per_worker):
+    """Отправить ответы в одну тему из workers потоков одновременно.
+    
+    Проверяет, что каждое принятое сообщение записано и счетчик темы
+    совпадает с числом ее сообщений.
+    """
+    with app.app_context():
+        before = db.session.scalar(select(func.count(Post.id)).where(Post.thread_id == thread_id))
+    clients = [logged_in_client(app, username, password) for _ in range(workers)]
+    start = threading.Barrier(workers)
+    accepted, failed, durations = [0] * workers, [0] * workers, []
+    
+    def work(index, client):
+        start.wait()
+        for i in range(per_worker):
+            started = time.perf_counter()
+            response = client.post(f'/thread/{thread_id}/reply',
+                                   data={'content': f'Параллельный ответ {index}-{i}.'})
+            durations.append(time.perf_counter() - started)
+            clear_flashes(client)
+            if response.status_code == 302 and 'last=1' in response.location:
+                accepted[index] += 1
+            else:
+                failed[index] += 1
+    
+    threads = [threading.Thread(target=work, args=(i, client)) for i, client in enumerate(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    with app.app_context():
+        stored = db.session.scalar(select(func.count(Post.id)).where(Post.thread_id == thread_id)) - before
+        counter = db.session.scalar(select(Thread.post_count).where(Thread.id == thread_id))
+        actual = before + stored
+    result = summarize(durations, [0], sum(failed))
+    del result['queries_per_request']
+    result.update({
+        'workers': workers,
+        'accepted': sum(accepted),
+        'stored': stored,
+        'lost': sum(accepted) - stored,
+        'counter_matches': counter == actual,
+        'replies_per_second': round(len(durations) / elapsed, 1),
+    })
+    print(f"параллельные ответы ({workers} потоков): {result['replies_per_second']} в секунду, "
+          f"p95 {result['p95_ms']:.2f} мс, принято {result['accepted']}, записано {stored}, "
+          f"ошибок {result['errors']}, счетчик {'верен' if result['counter_matches'] else 'НЕ СОВПАДАЕТ'}")
+    return result
+
+
+def pick_targets():
+    """Раздел с наибольшим числом тем, самая большая и типичная тема"""
+    section_id = db.session.scalar(select(Section.id).order_by(Section.thread_count.desc()).limit(1))
+    big_thread = db.session.scalar(select(Thread.id).order_by(Thread.post_count.desc()).limit(1))
+    thread_total = db.session.scalar(select(func.count(Thread.id)))
+    typical_thread = db.session.scalar(select(Thread.id).order_by(Thread.post_count)
+                                       .offset(thread_total // 2).limit(1))
+    open_thread = db.session.scalar(select(Thread.id).where(Thread.is_locked == False)
+                                    .order_by(Thread.post_count.desc()).limit(1))
+    return section_id, big_thread, typical_thread, open_thread
+
+
+def run(args):
+    app = create_app(benchmark_config(args.config))
+    if args.cache:
+        app.config['CACHE_TYPE'] = args.cache
+        from app import cache
+        cache.init_app(app)
+    init_routes(app)
+    event.listen(Engine, 'before_cursor_execute', _count_query)
+    
+    with app.app_context():
+        section_id, big_thread, typical_thread, open_thread = pick_targets()
+        if section_id is None or big_thread is None:
+            sys.exit('В базе нет разделов или тем: запустите create_sample_data.py')
+        dataset = {
+            'users': db.session.scalar(select(func.count(User.id))),
+            'sections': db.session.scalar(select(func.count(Section.id))),
+            'threads': db.session.scalar(select(func.count(Thread.id))),
+            'posts': db.session.scalar(select(func.coalesce(func.sum(Thread.post_count), 0))),
+        }
+    
+    # Чтение - от имени пользователя, чтобы кэш страниц для гостей не скрывал работу с БД
+    reader = logged_in_client(app, args.username, args.password)
+    guest = app.test_client()
+    scenarios = [
+        ('index (guest)', lambda: guest.get('/')),
+        ('index', lambda: reader.get('/')),
+    ]
+    scenarios += [(f'section {sort}', lambda sort=sort: reader.get(f'/section/{section_id}?sort_by={sort}'))
+                  for sort in SORTS]
+    scenarios += [
+        # n=0 - первая страница: без курсора вернувшегося читателя перенаправит к непрочитанному
+        ('thread big', lambda: reader.get(f'/thread/{big_thread}?n=0')),
+        ('thread big last page', lambda: reader.get(f'/thread/{big_thread}?last=1')),
+        ('thread typical', lambda: reader.get(f'/thread/{typical_thread}')),
+    ]
+    if not args.read_only:
+        writer = logged_in_client(app, args.username, args.password)
+        
+        def reply():
+            response = writer.post(f'/thread/{open_thread}/reply', data={'content': 'Тестовое сообщение.'})
+            clear_flashes(writer)
+            return response
+        
+        def login():
+            client = app.test_client()
+            return client.post('/login', data={'username': args.username, 'password': args.password})
+        
+        scenarios += [('reply', reply, (302,)), ('login', login, (302,))]
+    
+    if args.only is not None:
+        scenarios = [s for s in scenarios if any(s[0].startswith(prefix) for prefix in args.only)]
+    
+    # Запросы выполняются вне контекста приложения: у каждого свой g и своя сессия БД
+    results = {}
+    for name, send, *expected in scenarios:
+        results[name] = measure(name, send, args.iterations, args.warmup, *expected)
+    
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        'cache': app.config['CACHE_TYPE'],
+        'iterations': args.iterations,
+        'dataset': dataset,
+        'targets': {'section': section_id, 'big_thread': big_thread,
+                    'typical_thread': typical_thread, 'reply_thread': open_thread},
+        'results': results,
+    }
+    if args.concurrency:
+        report['config'] = args.config
+        report['concurrent_replies'] = concurrent_replies(
+            app, args.username, args.password, open_thread, args.concurrency, args.replies
+        )
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'Результаты сохранены в {args.output}')
+    
+    if args.compare:
+        compare(args.compare, report)
+    
+    concurrent = report.get('concurrent_replies')
+    if concurrent and (concurrent['lost'] or not concurrent['counter_matches']):
+        sys.exit('Потеряны записи при параллельных ответах')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(path, report):
+    """Сравнить с сохраненным прогоном: изменение p95 и числа запросов"""
+    with open(path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {path} (коммит {baseline.get('commit')}):")
+    for name, result in report['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        print(f"{name:<28} p95 {old['p95_ms']:>8.2f} -> {result['p95_ms']:>8.2f} мс ({change:+.0f}%)  "
+              f"запросов {old['queries_per_request']:.1f} -> {result['queries_per_request']:.1f}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Нагрузочный тест основных страниц форума.')
+    parser.add_argument('--iterations', type=int, default=200, help='Запросов на сценарий.')
+    parser.add_argument('--warmup', type=int, default=10, help='Неучитываемых запросов перед замером.')
+    parser.add_argument('--username', default='user1')
+    parser.add_argument('--password', default='user123')
+    parser.add_argument('--cache', choices=('lru', 'filesystem', 'null'),
+                        help='Тип кэша (по умолчанию из настроек).')
+    parser.add_argument('--only', nargs='*', help='Запустить только сценарии с этими префиксами.')
+    parser.add_argument('--config', choices=sorted(CONFIGS), default='default',
+                        help='Набор настроек приложения.')
+    parser.add_argument('--concurrency', type=int, default=0,
+                        help='Проверить параллельные ответы в одну тему из стольких потоков.')
+    parser.add_argument('--replies', type=int, default=50, help='Ответов на поток при --concurrency.')
+    parser.add_argument('--read-only', action='store_true', help='Не выполнять reply и login.')
+    parser.add_argument('--output', default=os.path.join('instance', 'benchmark.json'),
+                        help='Файл для результатов в JSON.')
+    parser.add_argument('--compare', help='Файл прошлого прогона для сравнения.')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    run(args)
\ No newline at end of file
@@ -5,4 +5,78 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///forum.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = 'app/static/avatars'
-    MAX_CONTENT_LENGTH = 2 * 1024 * 1024  # 2MB max file size
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 2 * 1024 * 1024  # 2MB max file size
+    AVATAR_SIZES = (32, 64, 150)
+    AVATAR_WORKERS = 2
+    AVATAR_QUEUE_SIZE = 16
+    POSTS_PER_PAGE = 20
+    SEARCH_RESULTS_PER_PAGE = 20
+    ACTIVITY_PER_PAGE = 20
+    PROFILE_ACTIVITY_ITEMS = 5
+    RAISE_ON_LAZY_LOAD = os.environ.get('RAISE_ON_LAZY_LOAD') == '1'
+    CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'lru'
+    CACHE_DIR = os.environ.get('CACHE_DIR') or 'instance/cache'
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_DEFAULT_TIMEOUT = 300
+    USER_CACHE_TYPE = os.environ.get('USER_CACHE_TYPE') or 'lru'
+    USER_CACHE_TIMEOUT = 60
+    USER_CACHE_MAX_ENTRIES = 10000
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+    METRICS_SLOWEST_QUERIES = 3
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = [ip for ip in (os.environ.get('METRICS_ALLOWED_IPS') or '').split(',') if ip]
+    DELETE_CHUNK_SIZE = 1000
+    DELETE_BACKGROUND_THRESHOLD = 5000
+    CONTENT_RENDERER = os.environ.get('CONTENT_RENDERER') or 'plain'
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+    AUTH_HASH_WORKERS = 2
+    AUTH_HASH_QUEUE_SIZE = 8
+    AUTH_HASH_TIMEOUT = 10
+    AUTH_RATE_LIMIT_ENABLED = True
+    AUTH_RATE_LIMITS = {
+        'login_ip': (20, 60, 'ip'),
+        'login_user': (5, 60, 'ip_username'),
+        'register_ip': (5, 3600, 'ip'),
+    }
+    SQLITE_PRAGMAS = {}
+    SQLITE_CONNECT_ARGS = {}
+    DB_WRITE_RETRIES = 3
+    DB_RETRY_DELAY = 0.05
+    REPLICA_URLS = [url for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url]
+    REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS') or 10)
+    SSE_BROKER = os.environ.get('SSE_BROKER') or 'local'
+    SSE_POLL_INTERVAL = 0.5
+    SSE_EVENT_TTL = 300
+    SSE_QUEUE_SIZE = 100
+    SSE_HISTORY = 50
+    SSE_HEARTBEAT = 15
+    SSE_MAX_CONNECTIONS = 5000
+    ASSETS_USE_MANIFEST = os.environ.get('ASSETS_USE_MANIFEST') != '0'
+    READ_FLUSH_INTERVAL = 5
+    READ_FLUSH_SIZE = 1000
+    VIEW_FLUSH_INTERVAL = 10
+    VIEW_FLUSH_SIZE = 1000
+    HOT_THREADS = 10
+    HOT_REFRESH_INTERVAL = 300
+    HOT_WINDOW_HOURS = 72
+    HOT_HALF_LIFE_HOURS = 12
+    HOT_VIEW_WEIGHT = 0.05
+    ARCHIVE_AFTER_MONTHS = 12
+    ARCHIVE_MAX_POSTS = 5000
+
+class ProductionConfig(Config):
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+    }
+    SQLITE_CONNECT_ARGS = {'timeout': 5}
+    DB_WRITE_RETRIES = 5
\ No newline at end of file
@@ -1,8 +1,171 @@
+import argparse
+import random
+import sys
+import time
+from array import array
 from app import create_app, db
 from app.models import User, Category, Section, Thread, Post
+from app.commands import rebuild_counters
+from app.rendering import get_renderer, render_content
+from app.search import reindex_all
 from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, select, update, text
+from werkzeug.security import generate_password_hash
 
-def create_sample_data():
+WORDS = (
+    'форум', 'вопрос', 'ответ', 'тема', 'сообщение', 'спасибо', 'помогите', 'работает', 'ошибка',
+    'решение', 'версия', 'настройка', 'код', 'сервер', 'база', 'данных', 'проект', 'идея', 'фильм',
+    'сериал', 'книга', 'игра', 'музыка', 'новости', 'вчера', 'сегодня', 'всегда', 'иногда', 'очень',
+    'интересно', 'согласен', 'не', 'и', 'в', 'на', 'с', 'по', 'как', 'что', 'это', 'можно', 'нужно',
+)
+
+
+def _text(rng, min_words, max_words):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(min_words, max_words))).capitalize() + '.'
+
+
+def _content(text):
+    renderer = get_renderer()
+    return {'content': text, 'content_html': renderer.render(text), 'content_version': renderer.full_version}
+
+
+def _skewed_weights(rng, count, skew):
+    """Накопленные веса по Парето: несколько очень популярных объектов и длинный хвост"""
+    weights = array('d')
+    total = 0.0
+    for _ in range(count):
+        total += rng.paretovariate(skew)
+        weights.append(total)
+    return weights
+
+
+def _insert_batches(table, rows, batch_size, label, total):
+    """Вставить строки пакетами через executemany, по транзакции на пакет"""
+    batch = []
+    done = 0
+    started = time.perf_counter()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            done += len(batch)
+            batch = []
+            print(f'\r  {label}: {done}/{total}', end='', flush=True)
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        done += len(batch)
+    print(f'\r  {label}: {done}/{total} за {time.perf_counter() - started:.1f} с')
+
+
+def generate_bulk_data(users=0, sections=0, threads=0, posts=0, categories=None,
+                       skew=1.2, days=365, seed=1, batch_size=10000):
+    """Сгенерировать большой объем данных поверх базовых.
+    
+    Темы распределяются по разделам, сообщения по темам, а авторство по
+    пользователям с распределением Парето (skew - его параметр: чем меньше,
+    тем сильнее перекос). Строки вставляются пакетами без создания объектов ORM,
+    id задаются явно, счетчики пересчитываются одним набором UPDATE в конце.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    now_ts = now.timestamp()
+    first_user = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    first_category = (db.session.scalar(select(func.max(Category.id))) or 0) + 1
+    first_section = (db.session.scalar(select(func.max(Section.id))) or 0) + 1
+    first_thread = (db.session.scalar(select(func.max(Thread.id))) or 0) + 1
+    first_post = (db.session.scalar(select(func.max(Post.id))) or 0) + 1
+    
+    # Хеш пароля считается один раз: у всех сгенерированных пользователей пароль user123
+    password_hash = generate_password_hash('user123', current_app.config['PASSWORD_HASH_METHOD'])
+    _insert_batches(User.__table__, (
+        {'id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com',
+         'password_hash': password_hash, 'avatar': 'default.png', 'is_moderator': False,
+         'created_at': now - timedelta(seconds=rng.random() * days * 86400), 'about': ''}
+        for user_id in range(first_user, first_user + users)
+    ), batch_size, 'пользователи', users)
+    
+    if categories is None:
+        categories = (sections + 19) // 20
+    if sections and not categories:
+        categories = 1
+    _insert_batches(Category.__table__, (
+        {'id': category_id, 'name': f'Категория {category_id}', 'description': _text(rng, 3, 10),
+         'order': category_id}
+        for category_id in range(first_category, first_category + categories)
+    ), batch_size, 'категории', categories)
+    category_ids = range(1, first_category + categories)
+    _insert_batches(Section.__table__, (
+        {'id': section_id, 'name': f'Раздел {section_id}', 'description': _text(rng, 3, 12),
+         'category_id': rng.choice(category_ids), 'thread_count': 0, 'post_count': 0}
+        for section_id in range(first_section, first_section + sections)
+    ), batch_size, 'разделы', sections)
+    
+    user_ids = range(1, first_user + users)
+    user_weights = _skewed_weights(rng, len(user_ids), skew)
+    section_ids = range(1, first_section + sections)
+    section_weights = _skewed_weights(rng, len(section_ids), skew)
+    
+    # Время создания каждой темы нужно, чтобы ответы были не раньше нее
+    thread_created = array('d', [0.0] * (first_thread - 1 + threads))
+    for thread_id, created_at in db.session.execute(select(Thread.id, Thread.created_at)):
+        thread_created[thread_id - 1] = created_at.timestamp()
+    
+    def thread_rows():
+        for thread_id in range(first_thread, first_thread + threads):
+            created_ts = now_ts - rng.random() * days * 86400
+            thread_created[thread_id - 1] = created_ts
+            created_at = datetime.fromtimestamp(created_ts)
+            yield {
+                'id': thread_id, 'title': _text(rng, 2, 8)[:200], **_content(_text(rng, 10, 80)),
+                'created_at': created_at, 'updated_at': created_at,
+                'is_pinned': rng.random() < 0.001, 'is_locked': rng.random() < 0.01,
+                'user_id': rng.choices(user_ids, cum_weights=user_weights)[0],
+                'section_id': rng.choices(section_ids, cum_weights=section_weights)[0],
+                'post_count': 0,
+            }
+    _insert_batches(Thread.__table__, thread_rows(), batch_size, 'темы', threads)
+    
+    thread_ids = range(1, first_thread + threads)
+    thread_weights = _skewed_weights(rng, len(thread_ids), skew)
+    
+    def post_rows():
+        post_id = first_post
+        remaining = posts
+        while remaining:
+            count = min(batch_size, remaining)
+            authors = rng.choices(user_ids, cum_weights=user_weights, k=count)
+            targets = rng.choices(thread_ids, cum_weights=thread_weights, k=count)
+            for user_id, thread_id in zip(authors, targets):
+                created_ts = thread_created[thread_id - 1]
+                created_ts += rng.random() * (now_ts - created_ts)
+                yield {'id': post_id, **_content(_text(rng, 5, 60)), 'user_id': user_id,
+                       'thread_id': thread_id, 'created_at': datetime.fromtimestamp(created_ts)}
+                post_id += 1
+            remaining -= count
+    if thread_ids:
+        _insert_batches(Post.__table__, post_rows(), batch_size, 'сообщения', posts)
+    
+    # Дата обновления сгенерированных тем - время последнего ответа
+    last_post_at = select(func.max(Post.created_at)).where(Post.thread_id == Thread.id).scalar_subquery()
+    db.session.execute(update(Thread).where(Thread.id >= first_thread)
+                       .values(updated_at=func.coalesce(last_post_at, Thread.created_at)))
+    db.session.commit()
+    
+    if db.engine.dialect.name == 'postgresql':
+        # id задавались явно - сдвигаем последовательности
+        for table in ('user', 'category', 'section', 'thread', 'post'):
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                f'(SELECT COALESCE(MAX(id), 1) FROM "{table}"))'
+            ))
+        db.session.commit()
+
+
+def create_sample_data(users=0, sections=0, threads=0, posts=0, categories=None,
+                       skew=1.2, days=365, seed=1, batch_size=10000, reindex=False):
     app = create_app()
     
     with app.app_context():
@@ -66,14 +229,45 @@ def create_sample_data():
         )
         
         # Добавление тем
+        for thread in (thread1, thread2, thread3):
+            render_content(thread)
         db.session.add_all([thread1, thread2, thread3])
         db.session.commit()
         
+        if users or sections or threads or posts:
+            print("Генерация данных для нагрузочного тестирования...")
+            generate_bulk_data(users, sections, threads, posts, categories,
+                               skew, days, seed, batch_size)
+        
+        rebuild_counters()
+        print("✓ Счетчики пересчитаны")
+        if reindex:
+            total = reindex_all(batch_size)
+            print(f"✓ Поисковый индекс построен: {total} записей")
+        
         print("🔐 Администратор:")
         print("   Логин: admin")
         print("   Пароль: admin123")
         print("\n👤 Обычные пользователи:")
         print("   Логин: user1 / Пароль: user123")
         print("   Логин: user2 / Пароль: user123")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Создание тестовых данных форума.')
+    parser.add_argument('--users', type=int, default=0, help='Дополнительных пользователей.')
+    parser.add_argument('--categories', type=int, help='Дополнительных категорий (по умолчанию раздел/20).')
+    parser.add_argument('--sections', type=int, default=0, help='Дополнительных разделов.')
+    parser.add_argument('--threads', type=int, default=0, help='Дополнительных тем.')
+    parser.add_argument('--posts', type=int, default=0, help='Дополнительных сообщений.')
+    parser.add_argument('--skew', type=float, default=1.2,
+                        help='Параметр распределения Парето (меньше - сильнее перекос).')
+    parser.add_argument('--days', type=int, default=365, help='За сколько дней распределить даты.')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел.')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Строк в одной вставке.')
+    parser.add_argument('--reindex', action='store_true', help='Построить поисковый индекс.')
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
-    create_sample_data()
\ No newline at end of file
+    args = parse_args(sys.argv[1:])
+    create_sample_data(args.users, args.sections, args.threads, args.posts, args.categories,
+                       args.skew, args.days, args.seed, args.batch_size, args.reindex)
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""search index
+
+Таблицы поискового индекса (app/search.py). Они не описаны моделями, поэтому
+autogenerate их не видит (include_object в env.py); после обновления базы
+индекс заполняет flask forum reindex.
+
+Revision ID: 1ef56add4163
+Revises: 99b6d762200f
+Create Date: 2026-10-18 07:15:02.210145
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1ef56add4163'
+down_revision = '99b6d762200f'
+branch_labels = None
+depends_on = None
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, body, kind UNINDEXED, thread_id UNINDEXED, post_id UNINDEXED, "
+    "section_id UNINDEXED, user_id UNINDEXED, created_at UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2')",
+]
+
+POSTGRESQL_DDL = [
+    'CREATE TABLE IF NOT EXISTS search_document ('
+    'id BIGINT PRIMARY KEY, kind VARCHAR(10) NOT NULL, thread_id INTEGER NOT NULL, '
+    'post_id INTEGER, section_id INTEGER NOT NULL, user_id INTEGER NOT NULL, '
+    'created_at TIMESTAMP, title TEXT, body TEXT, document TSVECTOR NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS ix_search_document ON search_document USING GIN (document)',
+    'CREATE INDEX IF NOT EXISTS ix_search_document_thread ON search_document (thread_id)',
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        statements = POSTGRESQL_DDL
+    elif bind.dialect.name == 'sqlite' and bind.exec_driver_sql(
+            "SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar():
+        statements = SQLITE_DDL
+    else:
+        # Без FTS5 поиск идет запросами LIKE по таблицам, индекс не нужен
+        statements = []
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    bind = op.get_bind()
+    op.execute('DROP TABLE IF EXISTS ' + ('search_document' if bind.dialect.name == 'postgresql' else 'search_index'))
@@ -0,0 +1,39 @@
+"""hot query indexes
+
+Индексы горячих запросов (проверяются flask forum explain). Таблицы создает
+db.create_all() (create_sample_data.py, run.py); в базе, созданной уже с этими
+индексами, ревизия ничего не меняет.
+
+Revision ID: 99b6d762200f
+Revises:
+Create Date: 2026-10-18 07:11:13.731753
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '99b6d762200f'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_category_order', 'category', ['order']),
+    ('ix_section_category_id', 'section', ['category_id']),
+    ('ix_thread_section_updated', 'thread', ['section_id', 'updated_at']),
+    ('ix_thread_section_title', 'thread', ['section_id', 'title']),
+    ('ix_thread_user_created', 'thread', ['user_id', 'created_at']),
+    ('ix_post_user_created', 'post', ['user_id', 'created_at']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
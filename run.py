@@ -1,10 +1,24 @@
+import os
+
+# FORUM_SERVER=gevent: кооперативный сервер, тысячи открытых SSE-соединений
+# обслуживаются без отдельного потока на клиента. Патч до импорта приложения.
+if os.environ.get('FORUM_SERVER') == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 from app import create_app, db
 from app.routes import init_routes
+from app.commands import init_commands
 
 app = create_app()
 init_routes(app)
+init_commands(app)
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
-    app.run(host='0.0.0.0',port=5000,debug=True)
+    if os.environ.get('FORUM_SERVER') == 'gevent':
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('0.0.0.0', 5000), app).serve_forever()
+    else:
+        app.run(host='0.0.0.0',port=5000,debug=True)
\ No newline at end of file
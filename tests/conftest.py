@@ -0,0 +1,63 @@
+import pytest
+from app import create_app, db, reads, popularity, Config
+from app.models import User, Category, Section
+from app.routes import init_routes
+
+
+@pytest.fixture
+def settings():
+    """Дополнительные параметры TestConfig; модуль тестов переопределяет фикстуру"""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, settings):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "forum.db"}'
+        UPLOAD_FOLDER = str(tmp_path / 'avatars')
+        WTF_CSRF_ENABLED = False
+        AUTH_RATE_LIMIT_ENABLED = False
+        AUTH_HASH_WORKERS = 0
+        PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+        CACHE_TYPE = 'null'
+        USER_CACHE_TYPE = 'null'
+        HOT_REFRESH_INTERVAL = 0
+
+    for name, value in settings.items():
+        setattr(TestConfig, name, value)
+    metadatas = dict(db.metadatas)
+    app = create_app(TestConfig)
+    init_routes(app)
+    # Контекст приложения не держится на весь тест: запросы клиента иначе
+    # делят с ним g, и вошедший пользователь (g._login_user) протекает в другие клиенты
+    with app.app_context():
+        db.create_all()
+    yield app
+    # Буферы записи общие для всех приложений процесса: накопленное тестом пишется
+    # в его базу сразу, а не фоновым потоком посреди следующего теста
+    reads.buffer.flush()
+    popularity.buffer.flush()
+    # db тоже общий: binds (реплики) добавляют в него метаданные, которых нет у других тестов
+    db.metadatas.clear()
+    db.metadatas.update(metadatas)
+
+
+@pytest.fixture
+def section_id(app):
+    """id раздела; создается и пользователь user1 с паролем user123"""
+    with app.app_context():
+        user = User(username='user1', email='user1@forum.com')
+        user.set_password('user123')
+        category = Category(name='Категория', order=1)
+        section = Section(name='Раздел', category=category)
+        db.session.add_all([user, category, section])
+        db.session.commit()
+        return section.id
+
+
+@pytest.fixture
+def client(app, section_id):
+    client = app.test_client()
+    client.post('/login', data={'username': 'user1', 'password': 'user123'})
+    return client
@@ -0,0 +1,66 @@
+from app import db
+from app.archive import archive_cold_threads, archived_thread_page
+from app.models import Thread, Post
+
+
+def new_thread(client, section_id, title):
+    client.post(f'/section/{section_id}/new', data={'title': title, 'content': 'Первое сообщение'})
+    with client.application.app_context():
+        return db.session.scalar(db.select(Thread.id).where(Thread.title == title))
+
+
+def reply(client, thread_id, content):
+    return client.post(f'/thread/{thread_id}/reply', data={'content': content})
+
+
+def post_ids(thread_id):
+    return db.session.scalars(db.select(Post.id).where(Post.thread_id == thread_id)
+                              .order_by(Post.created_at, Post.id)).all()
+
+
+def test_reply_after_archive_keeps_archived_ids(app, client, section_id):
+    archived_id = new_thread(client, section_id, 'Старая тема')
+    for number in range(3):
+        reply(client, archived_id, f'Ответ {number}')
+    with app.app_context():
+        archived_posts = post_ids(archived_id)
+        assert archive_cold_threads(0, 5000)['threads'] == 1
+        assert db.session.scalar(db.select(db.func.count(Post.id))) == 0
+
+    # Новый ответ в другой теме не должен получить id архивного ответа
+    other_id = new_thread(client, section_id, 'Новая тема')
+    assert reply(client, other_id, 'Ответ в новой теме').status_code == 302
+    with app.app_context():
+        assert post_ids(other_id)[0] not in archived_posts
+
+    response = reply(client, archived_id, 'Ответ после архивации')
+    assert response.status_code == 302
+    with app.app_context():
+        thread = db.session.get(Thread, archived_id)
+        restored = post_ids(archived_id)
+        assert not thread.is_archived
+        assert restored[:3] == archived_posts
+        assert len(restored) == 4
+        assert thread.post_count == 4
+
+
+def test_archived_boundary_cursors_show_edge_pages(app, client, section_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'POSTS_PER_PAGE', 3)
+    thread_id = new_thread(client, section_id, 'Старая тема')
+    for number in range(7):
+        reply(client, thread_id, f'Ответ {number}')
+    with app.app_context():
+        ids = post_ids(thread_id)
+        archive_cold_threads(0, 5000)
+        thread = db.session.get(Thread, thread_id)
+        assert thread.is_archived
+
+        page = archived_thread_page(thread, 3, after=ids[-1], offset=7)
+        assert [post.id for post in page.posts] == ids[-3:]
+        assert (page.offset, page.has_prev, page.has_next) == (4, True, False)
+        page = archived_thread_page(thread, 3, before=ids[0], offset=0)
+        assert [post.id for post in page.posts] == ids[:3]
+        assert (page.offset, page.has_prev, page.has_next) == (0, False, True)
+
+    for query in (f'after={ids[-1]}&n=7', f'before={ids[0]}&n=0', 'last=1'):
+        assert client.get(f'/thread/{thread_id}?{query}').status_code == 200
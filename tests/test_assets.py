@@ -0,0 +1,25 @@
+import pytest
+from app.assets import VENDOR, build_assets
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'style.css').write_text('body { color: red; }')
+    return tmp_path
+
+
+def test_build_fails_without_vendor_files(static_dir):
+    with pytest.raises(RuntimeError, match='assets --fetch'):
+        build_assets(str(static_dir))
+    # Ничего не собрано частично
+    assert not (static_dir / 'dist').exists()
+
+
+def test_build_bundles_vendor_files(static_dir):
+    for path in VENDOR:
+        (static_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (static_dir / path).write_text('/* vendor */ .x{}' if path.endswith('.css') else 'var x=1;')
+    manifest = build_assets(str(static_dir))
+    assert (static_dir / 'dist' / manifest['css/forum.css']['path']).exists()
+    assert (static_dir / 'dist' / manifest['js/forum.js']['path']).exists()
@@ -0,0 +1,82 @@
+import time
+import pytest
+from app import auth, db
+from app.auth import AuthBusy, _run_hashing, limiter
+from app.models import User
+
+
+def slow_check(password_hash, password):
+    time.sleep(1)
+    return True
+
+
+@pytest.fixture
+def hash_pool(app, monkeypatch):
+    """Отдельный пул хеширования на один процесс и одно место в очереди"""
+    monkeypatch.setitem(app.config, 'AUTH_HASH_WORKERS', 1)
+    monkeypatch.setitem(app.config, 'AUTH_HASH_QUEUE_SIZE', 1)
+    monkeypatch.setitem(app.config, 'AUTH_HASH_TIMEOUT', 0.2)
+    monkeypatch.setattr(auth, '_hash_executor', None)
+    monkeypatch.setattr(auth, '_hash_slots', None)
+    yield
+    if auth._hash_executor is not None:
+        auth._hash_executor.shutdown(wait=True)
+
+
+def test_slow_hash_is_shed_and_keeps_its_slot(app, hash_pool):
+    with app.app_context():
+        with pytest.raises(AuthBusy):
+            _run_hashing(time.sleep, 1)
+        # Хеширование еще идет в пуле: место занято, следующий запрос отклоняется сразу
+        started = time.perf_counter()
+        with pytest.raises(AuthBusy):
+            _run_hashing(abs, -1)
+        assert time.perf_counter() - started < 0.1
+
+        time.sleep(1.2)
+        assert _run_hashing(abs, -1) == 1
+
+
+def test_hash_timeout_answers_503(app, section_id, hash_pool, monkeypatch):
+    monkeypatch.setattr(auth, 'check_password_hash', slow_check)
+    response = app.test_client().post('/login', data={'username': 'user1', 'password': 'user123'})
+    assert response.status_code == 503
+
+
+def login(client, password, address='10.0.0.1'):
+    return client.post('/login', data={'username': 'user1', 'password': password},
+                       environ_base={'REMOTE_ADDR': address})
+
+
+def test_login_limit_is_per_address_and_username(app, section_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTH_RATE_LIMIT_ENABLED', True)
+    limiter.reset()
+    client = app.test_client()
+    for _ in range(5):
+        assert login(client, 'wrong').status_code == 200
+    response = login(client, 'user123')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+    # Перебор с одного адреса не блокирует вход владельцу с другого
+    assert login(app.test_client(), 'user123', '10.0.0.2').status_code == 302
+    limiter.reset()
+
+
+def test_full_hash_pool_answers_503(app, section_id, hash_pool):
+    with app.app_context():
+        with pytest.raises(AuthBusy):
+            _run_hashing(time.sleep, 1)
+    started = time.perf_counter()
+    assert login(app.test_client(), 'user123').status_code == 503
+    assert time.perf_counter() - started < 0.1
+    time.sleep(1)
+
+
+def test_login_rehashes_password_after_cost_change(app, section_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:2000')
+    assert login(app.test_client(), 'user123').status_code == 302
+    with app.app_context():
+        password_hash = db.session.scalar(db.select(User.password_hash).where(User.username == 'user1'))
+    assert password_hash.startswith('pbkdf2:sha256:2000$')
+    assert login(app.test_client(), 'user123').status_code == 302
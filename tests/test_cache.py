@@ -0,0 +1,84 @@
+import pytest
+from app import db, cache
+from app.cache import LRUCache
+from app.models import User, Section, Thread, Post
+
+
+@pytest.fixture
+def pages(app, client, section_id, monkeypatch):
+    """Тема с ответом и адреса ее страниц: главная, раздел, тема (с кэшем страниц в памяти)"""
+    monkeypatch.setattr(cache, 'backend', LRUCache())
+    client.post(f'/section/{section_id}/new', data={'title': 'Тема', 'content': 'Текст'})
+    with app.app_context():
+        thread_id = db.session.scalar(db.select(Thread.id))
+    client.post(f'/thread/{thread_id}/reply', data={'content': 'Первый ответ'})
+    client.get('/')  # сообщения об успехе показаны, дальше страницы без flash
+    return thread_id, ['/', f'/section/{section_id}', f'/thread/{thread_id}']
+
+
+def cached_stale(app, guest, urls, thread_id):
+    """Закэшировать страницы для гостя и переименовать тему в обход событий сессии"""
+    for url in urls:
+        assert 'Тема'.encode() in guest.get(url).data
+    with app.app_context():
+        db.session.execute(db.update(Thread).where(Thread.id == thread_id).values(title='Новое название'))
+        db.session.commit()
+    # Сессия не видела изменения - гость получает страницы из кэша
+    for url in urls:
+        assert 'Новое название'.encode() not in guest.get(url).data
+
+
+def test_reply_invalidates_index_section_and_thread(app, client, pages):
+    thread_id, urls = pages
+    guest = app.test_client()
+    cached_stale(app, guest, urls, thread_id)
+
+    client.post(f'/thread/{thread_id}/reply', data={'content': 'Второй ответ'})
+    for url in urls:
+        assert 'Новое название'.encode() in guest.get(url).data
+    assert 'Второй ответ'.encode() in guest.get(urls[2]).data
+
+
+def test_delete_invalidates_index_section_and_thread(app, client, pages):
+    thread_id, urls = pages
+    guest = app.test_client()
+    cached_stale(app, guest, urls, thread_id)
+
+    with app.app_context():
+        post_id = db.session.scalar(db.select(Post.id))
+    client.get(f'/delete_post/{post_id}')
+    for url in urls:
+        assert 'Новое название'.encode() in guest.get(url).data
+    assert 'Первый ответ'.encode() not in guest.get(urls[2]).data
+
+
+def test_edits_invalidate_pages(app, client, section_id, pages):
+    thread_id, urls = pages
+    guest = app.test_client()
+    for url in urls:
+        guest.get(url)
+    with app.app_context():
+        db.session.execute(db.update(User).values(is_moderator=True))
+        category_id = db.session.get(Section, section_id).category_id
+        db.session.commit()
+
+    client.post(f'/admin/category/{category_id}/edit', data={'name': 'Переименованная', 'order': 1})
+    assert 'Переименованная'.encode() in guest.get('/').data
+    client.post('/profile/edit', data={'username': 'renamed', 'email': 'user1@forum.com', 'about': ''})
+    assert b'renamed' in guest.get(urls[2]).data
+
+
+def test_rollback_keeps_versions(app, pages):
+    thread_id, _ = pages
+    with app.app_context():
+        names = [f'thread:{thread_id}', 'index']
+        before = [cache.version(name) for name in names]
+        thread = db.session.get(Thread, thread_id)
+        thread.title = 'Отмененное'
+        db.session.flush()
+        db.session.rollback()
+        assert [cache.version(name) for name in names] == before
+
+        thread.title = 'Сохраненное'
+        db.session.commit()
+        assert all(cache.version(name) != version for name, version in zip(names, before))
@@ -0,0 +1,57 @@
+import threading
+import pytest
+from app import db, ProductionConfig
+from app.models import User, Thread, Post
+
+WRITERS = 8
+REPLIES = 10
+
+
+@pytest.fixture
+def settings():
+    # Файловая SQLite в режиме WAL с busy_timeout, как в рабочей конфигурации
+    return {
+        'SQLITE_PRAGMAS': ProductionConfig.SQLITE_PRAGMAS,
+        'SQLITE_CONNECT_ARGS': ProductionConfig.SQLITE_CONNECT_ARGS,
+        'DB_WRITE_RETRIES': ProductionConfig.DB_WRITE_RETRIES,
+    }
+
+
+def test_concurrent_replies_are_all_saved_once(app, section_id):
+    first = app.test_client()
+    first.post('/login', data={'username': 'user1', 'password': 'user123'})
+    first.post(f'/section/{section_id}/new', data={'title': 'Тема', 'content': 'Текст'})
+    with app.app_context():
+        assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+        thread_id = db.session.scalar(db.select(Thread.id))
+
+    clients = [app.test_client() for _ in range(WRITERS)]
+    for client in clients:
+        client.post('/login', data={'username': 'user1', 'password': 'user123'})
+    start = threading.Barrier(WRITERS)
+    statuses = []
+    errors = []
+
+    def write(client, number):
+        start.wait()
+        for reply in range(REPLIES):
+            try:
+                response = client.post(f'/thread/{thread_id}/reply', data={'content': f'Ответ {number}.{reply}'})
+                statuses.append(response.status_code)
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=write, args=(client, number)) for number, client in enumerate(clients)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    assert statuses == [302] * WRITERS * REPLIES
+    with app.app_context():
+        contents = db.session.scalars(db.select(Post.content).where(Post.thread_id == thread_id)).all()
+        assert sorted(contents) == sorted(f'Ответ {number}.{reply}'
+                                          for number in range(WRITERS) for reply in range(REPLIES))
+        assert db.session.get(Thread, thread_id).post_count == len(contents)
+        assert db.session.scalar(db.select(User.post_count).where(User.username == 'user1')) == len(contents)
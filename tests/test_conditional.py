@@ -0,0 +1,28 @@
+from app import db, cache
+from app.cache import LRUCache
+from app.models import Thread, Post
+
+
+def test_thread_page_revalidates_by_etag_only(app, client, section_id, monkeypatch):
+    # Версии сущностей должны храниться между запросами (в null-кэше они каждый раз новые)
+    monkeypatch.setattr(cache, 'backend', LRUCache())
+    client.post(f'/section/{section_id}/new', data={'title': 'Тема', 'content': 'Текст'})
+    with app.app_context():
+        thread_id = db.session.scalar(db.select(Thread.id))
+    for number in range(3):
+        client.post(f'/thread/{thread_id}/reply', data={'content': f'Ответ {number}'})
+    url = f'/thread/{thread_id}?n=0'
+    client.get(url)  # сообщения о добавлении ответов уже показаны
+
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert 'Last-Modified' not in response.headers
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    # Удаление не последнего ответа не меняет updated_at темы
+    with app.app_context():
+        first_reply = db.session.scalar(db.select(Post.id).order_by(Post.id))
+    client.get(f'/delete_post/{first_reply}')
+    client.get(url)
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+    assert client.get(url, headers={'If-Modified-Since': 'Sun, 01 Jan 2090 00:00:00 GMT'}).status_code == 200
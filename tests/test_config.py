@@ -0,0 +1,25 @@
+from flask import Flask
+from app import create_app, db, ProductionConfig, _sqlite_connect_args
+
+
+def test_production_sqlite_gets_driver_timeout(tmp_path):
+    class Config(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "forum.db"}'
+        UPLOAD_FOLDER = str(tmp_path / 'avatars')
+
+    app = create_app(Config)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] == {'timeout': 5}
+    with app.app_context():
+        assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+    assert 'connect_args' not in ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS
+
+
+def test_production_postgresql_has_no_sqlite_connect_args():
+    # Движок не создается: драйвера PostgreSQL может не быть, проверяются параметры
+    app = Flask(__name__)
+    app.config.from_object(ProductionConfig)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://forum@localhost/forum'
+    _sqlite_connect_args(app)
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert 'connect_args' not in options
+    assert options['pool_size'] == 10
@@ -0,0 +1,43 @@
+from app import db, archive
+from app.archive import archive_cold_threads
+from app.deletion import delete_section
+from app.models import User, Section, Thread, Post
+from app.search import get_search_backend
+
+
+def add_thread(client, section_id, title, replies):
+    client.post(f'/section/{section_id}/new', data={'title': title, 'content': 'Первое сообщение'})
+    with client.application.app_context():
+        thread_id = db.session.scalar(db.select(Thread.id).where(Thread.title == title))
+    for number in range(replies):
+        client.post(f'/thread/{thread_id}/reply', data={'content': f'{title}: ответ {number}'})
+    return thread_id
+
+
+def test_delete_section_with_archived_threads(app, client, section_id):
+    with app.app_context():
+        other = Section(name='Другой раздел', category=db.session.get(Section, section_id).category)
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+    add_thread(client, section_id, 'Архивная', 4)
+    add_thread(client, section_id, 'Еще архивная', 3)
+    with app.app_context():
+        assert archive_cold_threads(0, 5000)['threads'] == 2
+    add_thread(client, section_id, 'Живая', 2)
+    add_thread(client, other_id, 'Соседняя', 5)
+
+    with app.app_context():
+        user = db.session.scalar(db.select(User).where(User.username == 'user1'))
+        assert (user.thread_count, user.post_count) == (4, 14)
+        archive._unpacked.clear()
+
+        delete_section(section_id, chunk_size=1)
+        db.session.expire_all()
+        assert (user.thread_count, user.post_count) == (1, 5)
+        assert db.session.scalar(db.select(db.func.count(Post.id))) == 5
+        assert db.session.get(Section, section_id) is None
+        # Удаленные архивы не попадают в кэш распакованных
+        assert not archive._unpacked
+        results, _ = get_search_backend().search('ответ')
+        assert {result.thread_id for result in results} == {db.session.scalar(db.select(Thread.id))}
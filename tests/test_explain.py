@@ -0,0 +1,33 @@
+import os
+from flask_migrate import upgrade
+from app import db
+from app.commands import explain_hot_queries
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+
+HOT_INDEXES = ['ix_category_order', 'ix_section_category_id', 'ix_thread_section_updated',
+               'ix_thread_section_title', 'ix_thread_user_created', 'ix_post_user_created']
+
+
+def index_names():
+    return set(db.session.scalars(db.text("SELECT name FROM sqlite_master WHERE type = 'index'")))
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        assert explain_hot_queries() == []
+
+
+def test_migration_restores_hot_query_indexes(app):
+    with app.app_context():
+        for name in HOT_INDEXES:
+            db.session.execute(db.text(f'DROP INDEX {name}'))
+        db.session.commit()
+        assert explain_hot_queries() != []
+        db.session.rollback()
+
+        upgrade(directory=MIGRATIONS)
+        assert index_names() >= set(HOT_INDEXES)
+        assert explain_hot_queries() == []
+        # Повторный запуск на базе с индексами ничего не ломает
+        upgrade(directory=MIGRATIONS)
@@ -0,0 +1,58 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import User, Category, Section, Thread
+
+
+def add_sections(count):
+    """count разделов в двух новых категориях, в каждом тема своего автора"""
+    first = db.session.scalar(db.select(db.func.count(Section.id)))
+    categories = [Category(name=f'Категория {number}', order=number + 2) for number in range(2)]
+    db.session.add_all(categories)
+    for number in range(first, first + count):
+        author = User(username=f'author{number}', email=f'author{number}@forum.com')
+        section = Section(name=f'Раздел {number}', category=categories[number % 2])
+        thread = Thread(title=f'Тема {number}', content='Текст', author=author, section=section,
+                        updated_at=datetime.utcnow())
+        db.session.add_all([author, section, thread])
+        db.session.flush()
+        section.last_thread_id = thread.id
+        section.thread_count = 1
+    db.session.commit()
+
+
+def count_queries(client, path, logged_in):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with client.application.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    # Гость должен видеть страницу анонимно: ссылка на выход только у вошедшего
+    assert (b'href="/logout"' in response.data) == logged_in
+    return len(statements)
+
+
+@pytest.mark.parametrize('logged_in', [False, True])
+def test_index_query_count_does_not_grow_with_sections(app, client, logged_in):
+    if not logged_in:
+        client = app.test_client()
+
+    with app.app_context():
+        add_sections(2)
+    few = count_queries(client, '/', logged_in)
+    with app.app_context():
+        add_sections(27)
+    many = count_queries(client, '/', logged_in)
+
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Section.id))) == 30
+    assert few == many
@@ -0,0 +1,26 @@
+import pytest
+
+
+@pytest.fixture
+def settings():
+    return {'METRICS_ENABLED': True, 'METRICS_TOKEN': 'secret', 'METRICS_ALLOWED_IPS': ['10.1.0.0/16']}
+
+
+def scrape(app, address='192.168.0.5', **headers):
+    return app.test_client().get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': address})
+
+
+def test_metrics_need_token_or_allowed_address(app, section_id):
+    app.test_client().get('/')
+    assert scrape(app).status_code == 404
+    assert scrape(app, Authorization='Bearer wrong').status_code == 404
+
+    response = scrape(app, Authorization='Bearer secret')
+    assert response.status_code == 200
+    assert b'endpoint="index"' in response.data
+    assert scrape(app, '10.1.2.3').status_code == 200
+
+
+@pytest.mark.parametrize('settings', [{'METRICS_ENABLED': False, 'METRICS_TOKEN': 'secret'}])
+def test_metrics_disabled_answer_404(app, settings):
+    assert scrape(app, Authorization='Bearer secret').status_code == 404
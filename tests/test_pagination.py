@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import User, Thread, Post
+from app.utils import get_thread_page
+
+PER_PAGE = 3
+
+
+@pytest.fixture
+def thread_id(app, section_id, monkeypatch):
+    """Тема из 7 ответов при 3 ответах на странице"""
+    monkeypatch.setitem(app.config, 'POSTS_PER_PAGE', PER_PAGE)
+    with app.app_context():
+        author_id = db.session.scalar(db.select(User.id))
+        start = datetime.utcnow() - timedelta(hours=1)
+        thread = Thread(title='Тема', content='Текст', user_id=author_id, section_id=section_id,
+                        created_at=start, updated_at=start)
+        db.session.add(thread)
+        db.session.flush()
+        db.session.add_all([Post(content=f'Ответ {number}', user_id=author_id, thread_id=thread.id,
+                                 created_at=start + timedelta(seconds=number + 1)) for number in range(7)])
+        thread.post_count = 7
+        db.session.commit()
+        return thread.id
+
+
+def reply_ids():
+    return db.session.scalars(db.select(Post.id).order_by(Post.created_at, Post.id)).all()
+
+
+def page_ids(page):
+    return [post.id for post in page.posts]
+
+
+def test_cursor_past_the_last_reply_shows_last_page(app, thread_id):
+    with app.app_context():
+        ids = reply_ids()
+        page = get_thread_page(db.session.get(Thread, thread_id), PER_PAGE, after=ids[-1], offset=7)
+        assert page_ids(page) == ids[-3:]
+        assert (page.offset, page.has_prev, page.has_next) == (4, True, False)
+        assert page.prev_args(PER_PAGE) == {'before': ids[4], 'n': 1}
+
+
+def test_cursor_before_the_first_reply_shows_first_page(app, thread_id):
+    with app.app_context():
+        ids = reply_ids()
+        page = get_thread_page(db.session.get(Thread, thread_id), PER_PAGE, before=ids[0], offset=0)
+        assert page_ids(page) == ids[:3]
+        assert (page.offset, page.has_prev, page.has_next) == (0, False, True)
+        assert page.next_args() == {'after': ids[2], 'n': 3}
+
+
+def test_last_page(app, thread_id):
+    with app.app_context():
+        ids = reply_ids()
+        page = get_thread_page(db.session.get(Thread, thread_id), PER_PAGE, last=True)
+        assert page_ids(page) == ids[-3:]
+        assert (page.offset, page.has_prev, page.has_next) == (4, True, False)
+
+
+def test_unknown_cursor_shows_first_page(app, thread_id):
+    with app.app_context():
+        ids = reply_ids()
+        for cursor in ({'after': 10 ** 6}, {'before': 10 ** 6}):
+            page = get_thread_page(db.session.get(Thread, thread_id), PER_PAGE, **cursor)
+            assert page_ids(page) == ids[:3]
+            assert (page.offset, page.has_prev, page.has_next) == (0, False, True)
+
+
+def test_boundary_cursors_render(app, client, thread_id):
+    with app.app_context():
+        ids = reply_ids()
+    for query in (f'after={ids[-1]}&n=7', f'before={ids[0]}&n=0', 'last=1', 'after=1000000', 'before=1000000'):
+        assert client.get(f'/thread/{thread_id}?{query}').status_code == 200
+
+
+def test_negative_offset_is_clamped(app, client, thread_id):
+    with app.app_context():
+        ids = reply_ids()
+    response = client.get(f'/thread/{thread_id}?after={ids[2]}&n=-50')
+    assert response.status_code == 200
+    assert b'#-' not in response.data
+    assert b'#2<' in response.data
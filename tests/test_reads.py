@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+from app import db
+from app.models import User, Thread, Post
+
+
+def author_id():
+    return db.session.scalar(db.select(User.id).where(User.username == 'user1'))
+
+
+def add_thread(section_id, replies, created_at):
+    thread = Thread(title='Тема', content='Первое сообщение', user_id=author_id(), section_id=section_id,
+                    created_at=created_at, updated_at=created_at)
+    db.session.add(thread)
+    db.session.flush()
+    add_replies(thread.id, replies, created_at)
+    return thread.id
+
+
+def add_replies(thread_id, count, start):
+    """count ответов в тему; возвращает id ответов"""
+    thread = db.session.get(Thread, thread_id)
+    posts = [Post(content=f'Ответ {number}', user_id=author_id(), thread_id=thread_id,
+                  created_at=start + timedelta(seconds=number + 1)) for number in range(count)]
+    db.session.add_all(posts)
+    db.session.flush()
+    thread.post_count = (thread.post_count or 0) + count
+    thread.last_post_id = posts[-1].id
+    thread.last_post_at = posts[-1].created_at
+    thread.updated_at = posts[-1].created_at
+    db.session.commit()
+    return [post.id for post in posts]
+
+
+def test_thread_jumps_to_first_reply_after_section_mark(app, client, section_id):
+    with app.app_context():
+        thread_id = add_thread(section_id, 3, datetime.utcnow() - timedelta(hours=1))
+        last_read_id = db.session.get(Thread, thread_id).last_post_id
+    assert client.post(f'/section/{section_id}/read').status_code == 302
+
+    with app.app_context():
+        new_posts = add_replies(thread_id, 25, datetime.utcnow() + timedelta(seconds=1))
+    response = client.get(f'/thread/{thread_id}')
+    assert response.status_code == 302
+    location = urlsplit(response.location)
+    assert parse_qs(location.query)['after'] == [str(last_read_id)]
+    assert location.fragment == f'post-{new_posts[0]}'
+    assert client.get(response.location).status_code == 200
+
+
+def test_thread_created_after_section_mark_opens_first_page(app, client, section_id):
+    assert client.post(f'/section/{section_id}/read').status_code == 302
+
+    with app.app_context():
+        thread_id = add_thread(section_id, 5, datetime.utcnow() + timedelta(seconds=1))
+    assert client.get(f'/thread/{thread_id}').status_code == 200
@@ -0,0 +1,69 @@
+import shutil
+import sqlite3
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import Section, Thread
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return {'REPLICA_URLS': [f'sqlite:///{tmp_path / "replica.db"}']}
+
+
+@pytest.fixture
+def replica(app, section_id, tmp_path):
+    """Копия основной базы, в которой раздел переименован: видно, откуда прочитана страница"""
+    shutil.copy(tmp_path / 'forum.db', tmp_path / 'replica.db')
+    with sqlite3.connect(tmp_path / 'replica.db') as connection:
+        connection.execute("UPDATE section SET name = 'Раздел на реплике'")
+    with app.app_context():
+        return db.engines['replica1']
+
+
+def statements(engine):
+    """Список, в который пишутся все SQL-запросы движка"""
+    executed = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: executed.append(statement.split()[0].upper()))
+    return executed
+
+
+def test_reads_go_to_replica_and_writes_to_primary(app, client, section_id, replica):
+    guest = app.test_client()
+    assert 'Раздел на реплике'.encode() in guest.get('/').data
+
+    replica_statements = statements(replica)
+    response = client.post(f'/section/{section_id}/new', data={'title': 'Новая тема', 'content': 'Текст'})
+    assert response.status_code == 302
+    assert replica_statements == []
+    with app.app_context():
+        assert db.session.scalar(db.select(Thread.title)) == 'Новая тема'
+
+    # Автор только что писал - читает с основной базы и видит свою тему; гость - с реплики
+    page = client.get('/').data
+    assert 'Новая тема'.encode() in page and 'Раздел на реплике'.encode() not in page
+    page = guest.get('/').data
+    assert 'Новая тема'.encode() not in page and 'Раздел на реплике'.encode() in page
+
+
+def test_flush_and_commit_never_touch_replica(app, section_id, replica):
+    replica_statements = statements(replica)
+    with app.test_request_context():
+        db.session.info['replica'] = 'replica1'
+        section = db.session.get(Section, section_id)
+        assert section.name == 'Раздел на реплике'
+        assert replica_statements == ['SELECT']
+
+        # Запись - в основную базу; после нее и чтение идет туда же
+        db.session.execute(db.update(Section).values(description='Изменено'))
+        assert db.session.scalar(db.select(Section.name)) == 'Раздел'
+        section.name = 'Переименован'
+        db.session.flush()
+        db.session.commit()
+        assert replica_statements == ['SELECT']
+        db.session.info.pop('replica')
+
+    with app.app_context():
+        assert db.session.scalar(db.select(Section.name)) == 'Переименован'
+        assert db.session.scalar(db.select(Section.description)) == 'Изменено'
@@ -0,0 +1,55 @@
+import sqlite3
+import pytest
+from sqlalchemy.exc import OperationalError
+from app import db, events
+from app.models import Thread, Post
+from app.utils import retry_on_busy
+
+
+def locked():
+    return OperationalError('SELECT 1', {}, sqlite3.OperationalError('database is locked'))
+
+
+def test_no_retry_after_commit(app):
+    calls = []
+
+    @retry_on_busy
+    def view():
+        calls.append(1)
+        db.session.commit()
+        raise locked()
+
+    with app.test_request_context():
+        with pytest.raises(OperationalError):
+            view()
+    assert len(calls) == 1
+
+
+def test_retry_before_commit(app):
+    calls = []
+
+    @retry_on_busy
+    def view():
+        calls.append(1)
+        if len(calls) == 1:
+            raise locked()
+        return 'ok'
+
+    with app.test_request_context():
+        assert view() == 'ok'
+    assert len(calls) == 2
+
+
+def test_reply_is_saved_once_when_publishing_fails(app, client, section_id, monkeypatch):
+    client.post(f'/section/{section_id}/new', data={'title': 'Тема', 'content': 'Текст'})
+    with app.app_context():
+        thread_id = db.session.scalar(db.select(Thread.id))
+
+    def publish(*args, **kwargs):
+        raise locked()
+
+    monkeypatch.setattr(events, 'publish', publish)
+    response = client.post(f'/thread/{thread_id}/reply', data={'content': 'Ответ'})
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Post.id))) == 1
@@ -0,0 +1,77 @@
+import os
+import shutil
+from flask_migrate import migrate, stamp
+from app import db, search
+from app.models import User, Thread
+from app.search import LikeSearchBackend, SQLiteSearchBackend, get_search_backend
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+
+
+def add_thread(client, section_id):
+    client.post(f'/section/{section_id}/new', data={'title': 'Настройка принтера', 'content': 'Не печатает'})
+    with client.application.app_context():
+        thread_id = db.session.scalar(db.select(Thread.id))
+    client.post(f'/thread/{thread_id}/reply', data={'content': 'Переустановите драйвер принтера'})
+    client.post(f'/thread/{thread_id}/reply', data={'content': 'Спасибо, заработало'})
+    return thread_id
+
+
+def found(results):
+    return [(result.kind, result.thread.title) for result in results]
+
+
+def test_create_all_creates_search_index(app):
+    with app.app_context():
+        tables = db.session.scalars(db.text("SELECT name FROM sqlite_master WHERE type = 'table'")).all()
+        assert 'search_index' in tables
+
+
+def test_fts_matches_titles_and_replies(app, client, section_id):
+    add_thread(client, section_id)
+    with app.app_context():
+        backend = get_search_backend()
+        assert isinstance(backend, SQLiteSearchBackend)
+        # Префиксный поиск, совпадение в заголовке выше совпадения в тексте
+        results, has_next = backend.search('принтер')
+        assert found(results) == [('thread', 'Настройка принтера'), ('post', 'Настройка принтера')]
+        assert not has_next
+        assert '<mark>' in results[1].snippet_html
+        assert found(backend.search('драйвер принтера')[0]) == [('post', 'Настройка принтера')]
+        assert backend.search('сканер')[0] == []
+        assert backend.search('"; DROP TABLE post; --')[0] == []
+
+    response = client.get('/search?q=драйвер')
+    assert response.status_code == 200
+    assert '<mark>драйвер</mark>'.encode() in response.data
+
+
+def test_like_fallback_backend(app, client, section_id, monkeypatch):
+    thread_id = add_thread(client, section_id)
+    with app.app_context():
+        user_id = db.session.scalar(db.select(User.id))
+        backend = LikeSearchBackend()
+        results, _ = backend.search('принтер')
+        assert sorted(found(results)) == [('post', 'Настройка принтера'), ('thread', 'Настройка принтера')]
+        results, _ = backend.search('драйвер', section_id=section_id, user_id=user_id)
+        assert [(result.kind, result.thread_id) for result in results] == [('post', thread_id)]
+        assert results[0].snippet_html == 'Переустановите <mark>драйвер</mark> принтера'
+        assert backend.search('драйвер', section_id=section_id + 1)[0] == []
+        # Символы шаблона LIKE ищутся как есть
+        assert backend.search('%')[0] == []
+
+        monkeypatch.setattr(search, 'SQLITE_FTS5', False)
+        assert isinstance(get_search_backend(), LikeSearchBackend)
+    assert b'<mark>' in client.get('/search?q=Спасибо').data
+
+
+def test_autogenerate_ignores_search_tables(app, tmp_path):
+    directory = str(tmp_path / 'migrations')
+    shutil.copytree(MIGRATIONS, directory, ignore=shutil.ignore_patterns('__pycache__'))
+    with app.app_context():
+        stamp(directory=directory)
+        migrate(directory=directory, message='check')
+    # Без командной строки пустая ревизия все равно создается: в ней не должно быть операций
+    [revision] = [name for name in os.listdir(os.path.join(directory, 'versions')) if name.endswith('_check.py')]
+    with open(os.path.join(directory, 'versions', revision)) as f:
+        assert 'op.' not in f.read()
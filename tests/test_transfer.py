@@ -0,0 +1,74 @@
+import io
+import pytest
+from app import db, reads
+from app.archive import archive_cold_threads
+from app.models import Thread
+from app.transfer import TABLES, export_forum, import_forum
+
+
+@pytest.fixture
+def forum(app, client, section_id):
+    """Темы с ответами, архивная тема и отметки о прочтении"""
+    for title in ('Первая', 'Вторая'):
+        client.post(f'/section/{section_id}/new', data={'title': title, 'content': 'Текст'})
+        with app.app_context():
+            thread_id = db.session.scalar(db.select(Thread.id).where(Thread.title == title))
+        for number in range(6):
+            client.post(f'/thread/{thread_id}/reply', data={'content': f'{title}: ответ {number}'})
+        if title == 'Первая':
+            with app.app_context():
+                assert archive_cold_threads(0, 5000)['threads'] == 1
+        client.get(f'/thread/{thread_id}')
+    client.post(f'/section/{section_id}/read')
+    reads.buffer.flush()
+
+
+def snapshot():
+    return {table.name: db.session.execute(db.select(table).order_by(*table.primary_key.columns)).all()
+            for table in TABLES}
+
+
+def export_lines():
+    out = io.StringIO()
+    export_forum(out, batch_size=2)
+    return out.getvalue().splitlines(keepends=True)
+
+
+def empty_database():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+
+def test_export_import_round_trip(app, forum):
+    with app.app_context():
+        before = snapshot()
+        assert all(before[table] for table in ('post', 'thread_archive', 'thread_read', 'section_read'))
+        lines = export_lines()
+
+        empty_database()
+        results = import_forum(lines, batch_size=2)
+        assert {name: inserted for name, (inserted, _) in results.items()} == \
+            {name: len(rows) for name, rows in before.items()}
+        assert snapshot() == before
+
+
+def test_resume_after_truncated_import(app, forum):
+    with app.app_context():
+        before = snapshot()
+        lines = export_lines()
+        # Обрыв посреди таблицы ответов
+        cut = lines.index(next(line for line in lines if line.startswith('{"table":"post"'))) + 4
+        assert lines[cut - 1].startswith('[')
+
+        empty_database()
+        with pytest.raises(ValueError, match='--resume'):
+            import_forum(lines[:cut], batch_size=2)
+        partial = snapshot()
+        assert 0 < len(partial['post']) < len(before['post'])
+
+        with pytest.raises(ValueError, match='не пуста'):
+            import_forum(lines, batch_size=2)
+        results = import_forum(lines, batch_size=2, resume=True)
+        assert results['post'] == (len(before['post']) - len(partial['post']), len(partial['post']))
+        assert snapshot() == before